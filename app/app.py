@@ -1,44 +1,106 @@
 """
 app.py – FastAPI + (ayrı modüldeki) Gradio arayüzü
 
-UI kodu artık ui.py içindedir.
+UI kodu helper/interface_helper.py içindedir ve yalnız ``Main.run`` ile
+yüklenir; yalnız API için server.py kullanılır.
 Bu dosya yalnızca:
   • /ask          – NL → SQL → sonuç
-  • /save_view    – üretilen SQL’den CREATE VIEW
+  • /save_view    – üretilen SQL’den CREATE VIEW (materialize=True → kalıcı tablo)
+  • /matviews     – kalıcı görünümleri listeler / elle yeniler
+  • /replica/sync – set 2 / 3 yerel kolonsal kopyasını elle senkronlar
+  • /cache/invalidate – sonuç önbelleğini tablo / set bazında temizler
+  • /metrics      – Prometheus metin biçiminde aşama süreleri / sayaçlar
 endpoint’lerini barındırır.
 """
 
-import os, sys, json, re, threading, traceback, logging
-from typing import List, Dict, Optional
+import os, sys, json, time, asyncio, threading, traceback, logging, contextlib, functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Iterator, List, Dict, Optional
 
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse, Response, PlainTextResponse
+import anyio
 from pydantic import BaseModel
 import uvicorn
-from sqlalchemy import text
 
 # Proje yolunu ekle (models klasörü vb.)
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 sys.path.append(BASE_DIR)
 
-from helper.api_helper import LLModel           # LLM + DB soyutlaması
-from helper.interface_helper import QueryUI                          # → ayırdığımız yeni UI
+from helper.api_helper import LLModel, get_prompt_builder   # LLM + DB soyutlaması
+from helper.concurrency_helper import (SetLimiter, SetSaturated,    # set başına eşzamanlılık
+                                       CancelToken)                  # istemci ayrılınca iptal
+from helper.schema_helper import refresh_all                        # şema kataloğu
+from helper.cache_helper import SQLCache, normalize_question         # NL → SQL önbelleği
+from helper.result_cache_helper import ResultCache                   # SQL → sonuç önbelleği
+from helper.cost_helper import CostGuard                             # yürütme öncesi maliyet
+from helper.matview_helper import all_matviews                       # kalıcı görünümler
+from helper.replica_helper import all_replicas, replica_sets         # yerel DuckDB kopyası
+from helper.llm_router_helper import llm_stats                       # LLM hedge / katman
+from helper.log_helper import LogManager                             # sorgu logu (JSONL)
+from helper.paging_helper import encode_page_token, decode_page_token, strip_order_by
+from helper.db_helper import pool_stats                              # havuz istatistikleri
+from helper.metrics_helper import REGISTRY, REQUESTS, STAGE_SECONDS  # /metrics
+from helper.state_helper import SessionStore                       # oturum başına son SQL
+from helper.format_helper import (FORMATS, ARROW_MEDIA_TYPE,          # sonuç biçimleri
+                                  arrow_available, to_arrow_ipc)
 
 # ─────────────────────────── API şemaları ──────────────────────────────
 class QueryRequest(BaseModel):
-    question: str
+    question: str = ""
     set_id: int = 2          # 1=Factory, 2=Hammadde, 3=Hat
+    no_cache: bool = False   # True → önbelleği atla, LLM'e yeniden sor
+    max_rows: Optional[int] = None        # sunucu üst sınırı MAX_RESULT_ROWS
+    include_total: bool = False           # ek COUNT(*) ile toplam satır
+    page_token: Optional[str] = None      # önceki yanıttaki next_page_token
+    trace: bool = False                   # True → yanıtta aşama zaman çizelgesi
+    repair: bool = True                   # hatalı SQL'i modele düzelttir (REPAIR_*)
+    format: str = "rows"                  # rows | columnar | arrow (bkz. format_helper)
+    session_id: Optional[str] = None      # /save_view için son SQL bu oturuma yazılır
 
 class QueryResponse(BaseModel):
     status: str              # success | error
     sql: Optional[str] = None
     rows: Optional[List[Dict]] = None
+    columns: Optional[List[str]] = None   # format=columnar: kolon adları bir kez
+    data: Optional[List[List[Any]]] = None  # format=columnar: kolon başına değerler
+    cached: Optional[bool] = None
+    similarity: Optional[float] = None   # anlamsal önbellek isabetinde kosinüs skoru
+    result_cached: Optional[bool] = None # satırlar sonuç önbelleğinden mi geldi
     gen_ms: Optional[float] = None
     exec_ms: Optional[float] = None
+    queue_ms: Optional[float] = None
+    truncated: Optional[bool] = None      # satır limiti nedeniyle kesildi mi
+    total_rows: Optional[int] = None
+    next_page_token: Optional[str] = None
+    stages: Optional[Dict[str, float]] = None   # aşama başına ms
+    usage: Optional[Dict[str, int]] = None      # LLM token sayıları
+    trace: Optional[List[Dict]] = None          # yalnız trace=True iken
     error: Optional[str] = None
+    error_detail: Optional[Dict] = None         # doğrulama hatasında kod + sorunlar
+    repairs: Optional[int] = None               # onarım denemesi sayısı
+    materialized: Optional[str] = None          # yanıt bu kalıcı görünümden okundu
+    replica: Optional[bool] = None              # yanıt yerel DuckDB kopyasından okundu
+
+class BatchRequest(BaseModel):
+    items: List[QueryRequest]
+    concurrency: Optional[int] = None     # vars. BATCH_CONCURRENCY
+
+class BatchResponse(BaseModel):
+    results: List[QueryResponse]          # items ile aynı sırada
+    unique: int                           # tekilleştirme sonrası çalışan soru
+    total_ms: float
+
+class InvalidateRequest(BaseModel):
+    tables: Optional[List[str]] = None    # None → set_id'ye göre (o da yoksa tümü)
+    set_id: Optional[int] = None
 
 class SaveViewRequest(BaseModel):
     view_name: str
     set_id: int = 2
+    session_id: Optional[str] = None
+    materialize: bool = False                 # True → sonuç tabloya yazılır, periyodik yenilenir
+    refresh_interval: Optional[float] = None  # sn; vars. MATVIEW_REFRESH_INTERVAL
 
 # ───────────────────────────── Ana sınıf ───────────────────────────────
 log = logging.getLogger("app")
@@ -51,69 +113,696 @@ class Main:
     def __init__(self,
                  api_host: str = "127.0.0.1",
                  api_port: int = 8000,
-                 ui_port: int = 7860):
+                 ui_port: int = 7860,
+                 model_factory: Optional[Callable[..., LLModel]] = None):
         self.api_host, self.api_port, self.ui_port = api_host, api_port, ui_port
-        self.models: Dict[int, LLModel] = {}
-        self.last_sql: Dict[int, str] = {}
+        # LLModel yerine geçebilecek fabrika (ör. benchmark'ta sahte LLM)
+        self.model_factory = model_factory or LLModel
+        self.models: Dict[int, LLModel] = {}        # worker başına, ilk istekte kurulur
+        self._models_lock = threading.Lock()
+        # oturum başına son SQL – STATE_DB ile worker'lar arasında paylaşılır
+        self.state = SessionStore()
+
+        # kapanışta yeni iş alınmaz, süren LLM/DB işleri DRAIN_TIMEOUT kadar beklenir
+        self.drain_timeout = float(os.getenv("DRAIN_TIMEOUT", "30"))
+        self.draining = False
+        self._active = 0
+        self._active_lock = threading.Lock()
+
+        # Bloklayan LLM/DB işi için set başına sınırlı thread havuzu
+        self.limiter = SetLimiter()
+        # /ask_batch ayrı havuz kullanır → toplu iş /ask kuyruğunu doldurmaz
+        self.batch_concurrency = int(os.getenv("BATCH_CONCURRENCY", "8"))
+        self.batch_executor = ThreadPoolExecutor(max_workers=self.batch_concurrency,
+                                                 thread_name_prefix="batch")
+        # tek /ask_batch isteğindeki en fazla öğe (aşılırsa 413)
+        self.batch_max_items = int(os.getenv("BATCH_MAX_ITEMS", "100"))
+        # Tüm setler tek önbelleği paylaşır (anahtar set_id içerir)
+        self.sql_cache = SQLCache()
+        # SEMANTIC_CACHE=1 → benzer sorular için SQL yeniden kullanımı
+        self.semantic_cache = None
+        if os.getenv("SEMANTIC_CACHE", "0") == "1":
+            from helper.semantic_helper import SemanticCache     # NumPy burada yüklenir
+            self.semantic_cache = SemanticCache()
+        # RESULT_CACHE=0 → her sorgu DB'ye gider
+        self.result_cache = (ResultCache()
+                             if os.getenv("RESULT_CACHE", "1") != "0" else None)
+        # QUERY_COST_CHECK=1 → planı eşiği aşan SQL çalıştırılmadan reddedilir
+        self.cost_guard = (CostGuard()
+                           if os.getenv("QUERY_COST_CHECK", "0") == "1" else None)
+        # /ask istemcisinin bağlantısı bu aralıkla yoklanır (sn)
+        self.disconnect_poll = float(os.getenv("DISCONNECT_POLL", "0.2"))
+        # kalıcı görünümlerin vadesi bu aralıkla kontrol edilir (sn, 0 → kapalı)
+        self.matview_tick = float(os.getenv("MATVIEW_TICK", "30"))
+        # REPLICA_SETS açıksa yerel kopya bu aralıkla senkronlanır (sn, 0 → yalnız elle)
+        self.replica_tick = float(os.getenv("REPLICA_SYNC_INTERVAL", "60"))
+
+        # Soru / SQL / süre logu – arka planda toplu yazılır
+        self.query_log = LogManager(os.getenv("QUERY_LOG_FILE", "query_logs.jsonl"))
+        # Açılışta prompt öneki ısıtılan setler → sonuçlar /stats altında
+        self.warmup: Dict[int, Dict] = {}
+        # API event loop'u – aynı süreçteki UI limiter'a buradan girer
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_ready = threading.Event()
 
         # FastAPI
-        self.app = FastAPI(title="Sorgu API", description="Serbest metin → SQL")
+        self.app = FastAPI(title="Sorgu API", description="Serbest metin → SQL",
+                           lifespan=self._lifespan)
         self._register_routes()
+        REGISTRY.register_collector("app", self._collect_metrics)
+
+    # ─────────── Açılış / kapanış ───────────
+    @contextlib.asynccontextmanager
+    async def _lifespan(self, app: FastAPI):
+        self._loop = asyncio.get_running_loop()
+        self._loop_ready.set()
+        sets = self._warmup_sets()
+        # açılışı bloklamaz; ilk istekler ısınma bitmeden de kabul edilir
+        task = asyncio.create_task(self._warm_up(sets)) if sets else None
+        refresher = (asyncio.create_task(self._refresh_matviews())
+                     if self.matview_tick > 0 else None)
+        syncer = (asyncio.create_task(self._sync_replicas())
+                  if self.replica_tick > 0 else None)
+        yield
+        for t in (task, refresher, syncer):
+            if t is not None:
+                t.cancel()
+        await self._drain()
+        self._loop_ready.clear()
+        self.limiter.shutdown(wait=False)
+        self.batch_executor.shutdown(wait=False)
+        # kuyruktaki log kayıtlarını diske yaz
+        self.query_log.close()
+        self.state.close()
+
+    # ─────────── Süren işler / kapanış ───────────
+    @contextlib.contextmanager
+    def _track(self):
+        with self._active_lock:
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._active_lock:
+                self._active -= 1
+
+    async def _drain(self):
+        """Yeni istekleri reddet, süren işleri en fazla ``drain_timeout`` bekle."""
+        self.draining = True
+        deadline = time.monotonic() + self.drain_timeout
+        while self._active and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        if self._active:
+            log.warning("✗ Kapanış: %s iş %.0f sn içinde bitmedi", self._active,
+                        self.drain_timeout)
+        else:
+            log.info("► Kapanış: süren işler tamamlandı")
+
+    def _check_open(self):
+        if self.draining:
+            raise HTTPException(status_code=503, detail="Sunucu kapanıyor.",
+                                headers={"Retry-After": "1"})
+
+    @staticmethod
+    def _warmup_sets() -> List[int]:
+        """WARMUP_SETS: "auto" (vars.) → önbelleklenebilir öneki olan setler,
+        "1,3" → yalnız bunlar, "" / "0" → kapalı."""
+        raw = os.getenv("WARMUP_SETS", "auto").strip().lower()
+        if raw in ("", "0", "none"):
+            return []
+        if raw == "auto":
+            return [s for s in (1, 2, 3) if get_prompt_builder(s).layout == "cached"]
+        return [int(x) for x in raw.split(",") if x.strip()]
+
+    async def _warm_up(self, sets: List[int]):
+        for set_id in sets:
+            try:
+                res = await asyncio.to_thread(lambda: self._get_model(set_id).warm_up())
+                self.warmup[set_id] = res
+                log.info("► Prompt öneki ısıtıldı  set=%s  prefix=%s  cached=%s  %.0f ms",
+                         set_id, res["prefix_tokens"], res["cached_tokens"], res["ms"])
+            except Exception as e:
+                self.warmup[set_id] = {"error": str(e)}
+                log.warning("✗ Isınma başarısız  set=%s: %s", set_id, e)
+
+    async def _refresh_matviews(self):
+        """Vadesi gelen kalıcı görünümleri yeniler; değişenlerin önbelleği düşer."""
+        while True:
+            await asyncio.sleep(self.matview_tick)
+            for mgr in all_matviews():
+                try:
+                    done = await asyncio.to_thread(mgr.refresh_due)
+                except Exception as e:
+                    log.warning("✗ Kalıcı görünüm yenileme turu başarısız: %s", e)
+                    continue
+                changed = [r["name"] for r in done
+                           if r["status"] == "success" and r["mode"] != "unchanged"]
+                if changed and self.result_cache is not None:
+                    self.result_cache.invalidate(changed)
+
+    async def _sync_replicas(self):
+        """Yerel kopyaları artımlı senkronlar (dizin kilidi tek yazıcıyı seçer)."""
+        for set_id in sorted(replica_sets()):
+            try:
+                # kopya model ile oluşur → ilk istek beklenmeden senkron başlasın
+                await asyncio.to_thread(self._get_model, set_id)
+            except Exception as e:
+                log.warning("✗ Yerel kopya için set %s modeli oluşturulamadı: %s", set_id, e)
+        while True:
+            for rep in all_replicas():
+                try:
+                    await asyncio.to_thread(rep.sync)
+                except Exception as e:
+                    log.warning("✗ Yerel kopya senkron turu başarısız: %s", e)
+            await asyncio.sleep(self.replica_tick)
+
+    # ─────────── /metrics için anlık değerler ───────────
+    def _collect_metrics(self):
+        """Önbellek / kuyruk / havuz sayaçlarını Prometheus örneklerine çevirir."""
+        caches = [("sql", self.sql_cache.stats())]
+        if self.semantic_cache is not None:
+            caches.append(("semantic", self.semantic_cache.stats()))
+        if self.result_cache is not None:
+            rc = self.result_cache.stats()
+            caches.append(("result", rc))
+            yield ("nl2sql_result_cache_bytes", "gauge", "Sonuç önbelleği bellek kullanımı",
+                   [({}, rc["bytes"])])
+            yield ("nl2sql_result_cache_invalidations_total", "counter",
+                   "Sonuç önbelleği: geçersiz kılınan kayıt", [({}, rc["invalidations"])])
+        for kind in ("hits", "misses"):
+            yield (f"nl2sql_cache_{kind}_total", "counter", f"Önbellek {kind}",
+                   [({"cache": name}, st[kind]) for name, st in caches])
+
+        lim = self.limiter.stats()
+        for field, typ in (("in_flight", "gauge"), ("queued", "gauge"),
+                           ("done", "counter"), ("rejected", "counter")):
+            samples = [({"set_id": sid}, st[field]) for sid, st in lim.items() if field in st]
+            if samples:
+                name = f"nl2sql_limiter_{field}" + ("_total" if typ == "counter" else "")
+                yield name, typ, f"Set kuyruğu: {field}", samples
+
+        pools = pool_stats()
+        for field in ("in_use", "peak_in_use", "pool_size", "pool_checkedout",
+                      "pool_overflow", "wait_ms_avg", "wait_ms_max"):
+            samples = [({"db": db}, st[field]) for db, st in pools.items() if field in st]
+            if samples:
+                yield f"nl2sql_db_{field}", "gauge", f"DB havuzu: {field}", samples
+        yield ("nl2sql_db_checkouts_total", "counter", "DB havuzu: checkout sayısı",
+               [({"db": db}, st["checkouts"]) for db, st in pools.items()])
 
     # ─────────── LLModel alma/oluşturma ───────────
     def _get_model(self, set_id: int) -> LLModel:
+        # Artık thread havuzundan çağrılıyor → çift oluşturmayı engelle
         if set_id not in self.models:
-            self.models[set_id] = LLModel(table_set=set_id)
+            with self._models_lock:
+                if set_id not in self.models:
+                    self.models[set_id] = self.model_factory(table_set=set_id,
+                                                         sql_cache=self.sql_cache,
+                                                         semantic_cache=self.semantic_cache,
+                                                         result_cache=self.result_cache,
+                                                         cost_guard=self.cost_guard)
         return self.models[set_id]
 
+    def _answer(self, req: QueryRequest, cancel: Optional[CancelToken] = None, *,
+                remember: bool = True) -> Dict:
+        """``remember=False`` → oturumun son SQL'i güncellenmez (toplu istek öğeleri)."""
+        with self._track():
+            model = self._get_model(req.set_id)
+            if req.page_token:
+                # sonraki sayfa: SQL jetondan gelir, LLM'e gidilmez
+                tok = decode_page_token(req.page_token)
+                res = model.page(tok["sql"], offset=tok["offset"],
+                                 max_rows=req.max_rows or tok["limit"],
+                                 include_total=req.include_total,
+                                 fmt=req.format, cancel=cancel)
+            else:
+                res = model.answer(req.question,
+                                   use_cache=not req.no_cache,
+                                   max_rows=req.max_rows,
+                                   include_total=req.include_total,
+                                   repair=req.repair,
+                                   fmt=req.format, cancel=cancel)
+            if remember and res["status"] == "success":
+                # son SQL'i VIEW kaydetmek için sakla – STATE_DB yazımı (busy_timeout'a
+                # kadar bekleyebilir) event loop'ta değil bu worker thread'inde yapılır
+                self.state.set_last_sql(req.session_id, req.set_id, res["sql"])
+            # satırların kendisi loglanmaz, yalnız özet
+            self.query_log.log_interaction(req.question, {
+                "set_id": req.set_id,
+                "status": res["status"],
+                "sql": res.get("sql"),
+                "cached": res.get("cached"),
+                "result_cached": res.get("result_cached"),
+                "gen_ms": res.get("gen_ms"),
+                "exec_ms": res.get("exec_ms"),
+                "repairs": res.get("repairs"),
+                "row_count": self._row_count(res),
+                "error": res.get("error"),
+            })
+            return res
+
+    def _stream(self, req: QueryRequest, cancel: Optional[CancelToken] = None):
+        """stream_answer olaylarını aktarır; bitişte log + last_sql günceller."""
+        final = None
+        with self._track():
+            model = self._get_model(req.set_id)
+            for ev in model.stream_answer(req.question,
+                                          use_cache=not req.no_cache,
+                                          max_rows=req.max_rows,
+                                          repair=req.repair,
+                                          fmt=req.format,
+                                          cancel=cancel):
+                if ev["event"] in ("done", "error"):
+                    final = ev
+                yield ev
+
+        if final and final["event"] == "done":
+            self.state.set_last_sql(req.session_id, req.set_id, final["sql"])
+        REQUESTS.inc(endpoint="/ask/stream",
+                     status="success" if final and final["event"] == "done" else "error")
+        self.query_log.log_interaction(req.question, {
+            "set_id": req.set_id,
+            "status": "success" if final and final["event"] == "done" else "error",
+            "sql": (final or {}).get("sql"),
+            "gen_ms": (final or {}).get("gen_ms"),
+            "exec_ms": (final or {}).get("exec_ms"),
+            "row_count": (final or {}).get("row_count"),
+            "repairs": (final or {}).get("repairs"),
+            "error": (final or {}).get("error"),
+            "stream": True,
+        })
+
+    @staticmethod
+    def _row_count(res: Dict) -> Optional[int]:
+        if res.get("rows") is not None:
+            return len(res["rows"])
+        if res.get("data") is not None:
+            return len(res["data"][0]) if res["data"] else 0
+        return None
+
+    def _to_response(self, req: QueryRequest, res: Dict, queue_ms: float) -> QueryResponse:
+        STAGE_SECONDS.observe(queue_ms / 1000, stage="queue", set_id=req.set_id)
+        timing = {"stages": res.get("stages"), "usage": res.get("usage") or None,
+                  "trace": res.get("spans") if req.trace else None,
+                  "repairs": res.get("repairs")}
+        if res["status"] != "success":
+            return QueryResponse(status="error", error=res["error"],
+                                 error_detail=res.get("error_detail"),
+                                 queue_ms=round(queue_ms, 1), **timing)
+
+        rows = res.get("rows")
+        if rows and not isinstance(rows[0], dict):
+            rows = [dict(enumerate(r)) for r in rows]
+        # arrow'da kolonlar JSON gövdesine girmez (bkz. _encode_arrow)
+        columnar = req.format == "columnar"
+
+        next_token = None
+        if res["next_offset"] is not None:
+            next_token = encode_page_token(req.set_id, res["sql"],
+                                           res["next_offset"], res["limit"])
+
+        return QueryResponse(
+            status="success",
+            sql=res["sql"],
+            rows=rows,
+            columns=res.get("columns") if columnar else None,
+            data=res.get("data") if columnar else None,
+            cached=res["cached"],
+            similarity=res["similarity"],
+            result_cached=res.get("result_cached"),
+            gen_ms=res["gen_ms"],
+            exec_ms=res["exec_ms"],
+            queue_ms=round(queue_ms, 1),
+            truncated=res["truncated"],
+            total_rows=res["total_rows"],
+            next_page_token=next_token,
+            materialized=res.get("materialized"),
+            replica=res.get("replica"),
+            **timing,
+        )
+
+    @staticmethod
+    def _encode(resp: BaseModel, endpoint: str, set_id: Optional[int] = None) -> Response:
+        """Yanıtı JSON'a çevirir; kodlama süresi de aşama olarak ölçülür."""
+        t0 = time.perf_counter()
+        body = resp.model_dump_json()
+        STAGE_SECONDS.observe(time.perf_counter() - t0, stage="response_encode", set_id=set_id)
+        REQUESTS.inc(endpoint=endpoint, status=getattr(resp, "status", "success"))
+        return Response(body, media_type="application/json")
+
+    @staticmethod
+    def _encode_arrow(resp: QueryResponse, res: Dict, set_id: Optional[int] = None) -> Response:
+        """Kolonlar Arrow IPC gövdesi, yanıtın geri kalanı şema metadata'sı olur."""
+        t0 = time.perf_counter()
+        body = to_arrow_ipc(res["columns"], res["data"],
+                            resp.model_dump(exclude_none=True, exclude={"rows", "columns", "data"}))
+        STAGE_SECONDS.observe(time.perf_counter() - t0, stage="response_encode", set_id=set_id)
+        REQUESTS.inc(endpoint="/ask", status=resp.status)
+        return Response(body, media_type=ARROW_MEDIA_TYPE)
+
+    @staticmethod
+    def _format_error(req: QueryRequest, *, stream: bool = False) -> Optional[str]:
+        allowed = ("rows", "columnar") if stream else FORMATS
+        if req.format not in allowed:
+            return f"Geçersiz format: {req.format} ({' | '.join(allowed)})"
+        if req.format == "arrow" and not arrow_available():
+            return "format=arrow için sunucuda pyarrow kurulu olmalı."
+        return None
+
+    async def _run_until_disconnect(self, request: Request, req: QueryRequest):
+        """``_answer``'ı set limiti altında çalıştırır; istemci ayrılırsa iptal eder.
+
+        İptal edilen iş kuyruktaysa hiç başlamaz, çalışıyorsa LLM akışı ve
+        DB cursor'u kesilir; slot iş gerçekten bitince bırakılır.
+        → (sonuç, kuyruk ms) ya da istemci ayrıldıysa None
+        """
+        token = CancelToken()
+        task = asyncio.ensure_future(self.limiter.run(req.set_id, self._answer, req, token))
+        while not task.done():
+            await asyncio.wait({task}, timeout=self.disconnect_poll)
+            if not task.done() and not token.cancelled and await request.is_disconnected():
+                log.info("✗ İstemci ayrıldı, iptal ediliyor  set=%s", req.set_id)
+                token.cancel()
+        res = task.result()
+        return None if token.cancelled else res
+
+    def _save_view(self, r: SaveViewRequest) -> Dict:
+        sql = self.state.get_last_sql(r.session_id, r.set_id)
+        if not sql:
+            return {"status": "error", "msg": "Önce bir sorgu çalıştırın."}
+
+        model = self._get_model(r.set_id)
+        engine = model.engine
+        safe = "".join(c for c in r.view_name if c.isalnum() or c == "_")
+        if not safe:
+            return {"status": "error", "msg": "Geçersiz görünüm adı."}
+
+        try:
+            if r.materialize:
+                v = model.matviews.create(safe, r.set_id, sql,
+                                          tables=model.validator.referenced_tables(sql),
+                                          interval=r.refresh_interval)
+                if self.result_cache is not None:
+                    self.result_cache.invalidate([safe])
+                return {"status": "success", "materialized": v.as_dict(),
+                        "msg": f"Kalıcı görünüm {safe} oluşturuldu ({v.rows} satır, {v.mode})"}
+
+            # aynı adlı kalıcı görünüm varsa önce tablosu kalkar
+            model.matviews.drop(safe)
+            name, body = engine.dialect.identifier_preparer.quote(safe), strip_order_by(sql)
+            with engine.begin() as conn:
+                if engine.dialect.name == "mssql":
+                    conn.exec_driver_sql(f"CREATE OR ALTER VIEW [dbo].{name} AS {body}")
+                else:
+                    conn.exec_driver_sql(f"DROP VIEW IF EXISTS {name}")
+                    conn.exec_driver_sql(f"CREATE VIEW {name} AS {body}")
+            return {"status": "success",
+                    "msg": f"VIEW {safe} oluşturuldu / güncellendi"}
+        except Exception as e:
+            return {"status": "error", "msg": str(e)}
+
+    # ─────────── Aynı süreçteki UI (HTTP'siz) ───────────
+    def _on_loop(self, coro, timeout: float = 30.0):
+        """Coroutine'i API event loop'unda çalıştırıp sonucunu bekler."""
+        if not self._loop_ready.wait(timeout):
+            coro.close()
+            raise RuntimeError("API event loop'u hazır değil.")
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def local_stream(self, payload: Dict) -> Iterator[Dict]:
+        """/ask/stream'in HTTP'siz hâli: aynı set limiti / kuyruğu kullanılır,
+        iş ise çağıran (UI) thread'inde yürür."""
+        req = QueryRequest(**payload)
+        err = ("Sunucu kapanıyor." if self.draining else
+               "Soru boş olamaz." if not req.question.strip()
+               else self._format_error(req, stream=True))
+        if err:
+            yield {"event": "error", "error": err}
+            return
+        slot, acquired = self.limiter.slot(req.set_id), False
+        token, finished = CancelToken(), False
+        try:
+            # slot try içinde alınır: alındıktan sonra ne olursa olsun finally bırakır
+            try:
+                queue_ms = self._on_loop(slot.__aenter__())
+            except SetSaturated as e:
+                yield {"event": "error", "error": str(e)}
+                return
+            acquired = True
+            yield {"event": "queued", "queue_ms": round(queue_ms, 1)}
+            yield from self._stream(req, token)
+            finished = True
+        finally:
+            if not finished:
+                token.cancel("arayüz akışı kapattı")    # ör. sekme kapandı
+            if acquired:
+                self._on_loop(slot.__aexit__(None, None, None))
+
+    def local_save_view(self, payload: Dict) -> Dict:
+        return self._save_view(SaveViewRequest(**payload))
+
     # ─────────── ENDPOINT’ler ───────────
     def _register_routes(self):
 
         @self.app.post("/ask", response_model=QueryResponse)
-        async def ask(req: QueryRequest):
-            log.info("► Soru alındı  set=%s  q=%s", req.set_id, req.question)
+        async def ask(req: QueryRequest, request: Request):
+            self._check_open()
             try:
-                rag = self._get_model(req.set_id)
-                res = rag.answer(req.question)
-
-                rows = res["rows"]
-                if rows and not isinstance(rows[0], dict):
-                    rows = [dict(enumerate(r)) for r in rows]
-
-                # son SQL’i VIEW kaydetmek için sakla
-                self.last_sql[req.set_id] = res["sql"]
-
-                return QueryResponse(
-                    status="success",
-                    sql=res["sql"],
-                    rows=rows,
-                    gen_ms=res["gen_ms"],
-                    exec_ms=res["exec_ms"],
-                )
+                if req.page_token:
+                    req.set_id = decode_page_token(req.page_token)["set_id"]
+                elif not req.question.strip():
+                    return self._encode(QueryResponse(status="error",
+                                                      error="Soru boş olamaz."), "/ask")
+                err = self._format_error(req)
+                if err:
+                    return self._encode(QueryResponse(status="error", error=err), "/ask")
+                log.info("► Soru alındı  set=%s  q=%s", req.set_id, req.question)
+
+                done = await self._run_until_disconnect(request, req)
+                if done is None:
+                    # yanıtı okuyacak kimse yok (499: istemci isteği kapattı)
+                    REQUESTS.inc(endpoint="/ask", status="cancelled")
+                    return Response(status_code=499)
+                res, queue_ms = done
+                resp = self._to_response(req, res, queue_ms)
+                if req.format == "arrow" and resp.status == "success":
+                    return self._encode_arrow(resp, res, req.set_id)
+                return self._encode(resp, "/ask", req.set_id)
+            except SetSaturated as e:
+                log.warning("✗ Kuyruk dolu: %s", e)
+                REQUESTS.inc(endpoint="/ask", status="rejected")
+                raise HTTPException(status_code=429, detail=str(e),
+                                    headers={"Retry-After": "1"})
             except Exception as e:
                 tb = traceback.format_exc()
                 log.error("✗ Hata:\n%s", tb)
-                return QueryResponse(status="error", error=str(e) + "\n" + tb)
+                return self._encode(QueryResponse(status="error", error=str(e) + "\n" + tb),
+                                    "/ask")
+
+        @self.app.post("/ask_batch", response_model=BatchResponse)
+        async def ask_batch(batch: BatchRequest):
+            self._check_open()
+            if len(batch.items) > self.batch_max_items:
+                raise HTTPException(status_code=413,
+                                    detail=f"Toplu istekte en fazla {self.batch_max_items} öğe "
+                                           f"olabilir ({len(batch.items)} gönderildi).")
+            t0 = time.perf_counter()
+            limit = max(1, min(batch.concurrency or self.batch_concurrency,
+                               self.batch_concurrency))
+            sem = asyncio.Semaphore(limit)
+            loop = asyncio.get_running_loop()
+
+            # sayfa jetonlu öğenin seti jetondan gelir (/ask ile aynı)
+            items: List[QueryRequest] = []
+            invalid: Dict[int, QueryResponse] = {}
+            for i, r in enumerate(batch.items):
+                if r.page_token:
+                    try:
+                        r = r.model_copy(update={
+                            "set_id": decode_page_token(r.page_token)["set_id"]})
+                    except ValueError as e:
+                        invalid[i] = QueryResponse(status="error", error=str(e))
+                elif not r.question.strip():
+                    invalid[i] = QueryResponse(status="error", error="Soru boş olamaz.")
+                items.append(r)
+
+            # aynı (set, normalize soru / sayfa jetonu, seçenekler) bir kez çalışır
+            def dedup_key(r: QueryRequest):
+                return (r.set_id, normalize_question(r.question), r.page_token, r.no_cache,
+                        r.max_rows, r.include_total, r.repair, r.format)
+
+            unique: Dict[tuple, QueryRequest] = {}
+            for i, r in enumerate(items):
+                if i not in invalid:
+                    unique.setdefault(dedup_key(r), r)
+
+            async def one(r: QueryRequest) -> QueryResponse:
+                if r.format == "arrow":
+                    # toplu yanıt tek JSON gövdesi → arrow yerine columnar
+                    r = r.model_copy(update={"format": "columnar"})
+                err = self._format_error(r)
+                if err:
+                    return QueryResponse(status="error", error=err)
+                t_q = time.perf_counter()
+                async with sem:
+                    queue_ms = (time.perf_counter() - t_q) * 1000
+                    try:
+                        # oturumun son SQL'ini yalnız son öğe belirler (aşağıda)
+                        res = await loop.run_in_executor(
+                            self.batch_executor,
+                            functools.partial(self._answer, r, remember=False))
+                    except Exception as e:
+                        res = {"status": "error", "error": str(e)}
+                return self._to_response(r, res, queue_ms)
 
+            keys = list(unique)
+            done = await asyncio.gather(*(one(unique[k]) for k in keys))
+            by_key = dict(zip(keys, done))
+            results = [invalid[i] if i in invalid else by_key[dedup_key(r)]
+                       for i, r in enumerate(items)]
+
+            last = items[-1] if items else None
+            if last is not None and results[-1].status == "success":
+                # tek istekteki sıra: /save_view son öğenin SQL'ini görür
+                await loop.run_in_executor(self.batch_executor, self.state.set_last_sql,
+                                           last.session_id, last.set_id, results[-1].sql)
+            log.info("► Toplu sorgu  n=%s  tekil=%s", len(items), len(keys))
+            return self._encode(
+                BatchResponse(results=results, unique=len(keys),
+                              total_ms=round((time.perf_counter() - t0) * 1000, 1)),
+                "/ask_batch")
+
+        @self.app.post("/ask/stream")
+        async def ask_stream(req: QueryRequest, request: Request):
+            """NDJSON (vars.) ya da Accept: text/event-stream ise SSE olay akışı."""
+            self._check_open()
+            if not req.question.strip():
+                raise HTTPException(status_code=400, detail="Soru boş olamaz.")
+            err = self._format_error(req, stream=True)
+            if err:
+                raise HTTPException(status_code=400, detail=err)
+            log.info("► Akış sorusu  set=%s  q=%s", req.set_id, req.question)
+
+            # kuyruk doluysa yanıt başlamadan düz 429; slot ise body() içinde
+            # alınır → istemci akış başlamadan ayrılsa da sızmaz
+            try:
+                self.limiter.check(req.set_id)
+            except SetSaturated as e:
+                raise HTTPException(status_code=429, detail=str(e),
+                                    headers={"Retry-After": "1"})
+
+            sse = "text/event-stream" in request.headers.get("accept", "")
+
+            def fmt(ev: Dict) -> str:
+                line = json.dumps(ev, ensure_ascii=False, default=str)
+                return f"event: {ev['event']}\ndata: {line}\n\n" if sse else line + "\n"
+
+            token = CancelToken()
+
+            async def body():
+                try:
+                    async with self.limiter.slot(req.set_id) as queue_ms:
+                        events, pending, finished = self._stream(req, token), None, False
+                        try:
+                            yield fmt({"event": "queued", "queue_ms": round(queue_ms, 1)})
+                            loop = asyncio.get_running_loop()
+                            while True:
+                                # iterate_in_threadpool'un aksine bu bekleme iptal edilebilir:
+                                # istemci ayrılınca thread'deki sorgu sürerken de buraya düşeriz
+                                pending = loop.run_in_executor(self.limiter.executor,
+                                                               next, events, None)
+                                # iptal thread'in future'ına geçmesin
+                                ev = await asyncio.shield(pending)
+                                if ev is None:
+                                    break
+                                yield fmt(ev)
+                            finished = True
+                        finally:
+                            if not finished:
+                                token.cancel()  # istemci ayrıldı → LLM akışı / cursor kesilir
+                                if pending is not None and not pending.done():
+                                    with anyio.CancelScope(shield=True):
+                                        await asyncio.wait({pending})
+                                events.close()  # bağlantı havuza döner, slot ondan sonra bırakılır
+                except SetSaturated as e:
+                    # check() ile slot() arasında kuyruk doldu
+                    REQUESTS.inc(endpoint="/ask/stream", status="rejected")
+                    yield fmt({"event": "error", "error": str(e)})
+
+            return StreamingResponse(
+                body(), media_type="text/event-stream" if sse else "application/x-ndjson")
+
+        @self.app.get("/stats")
+        async def stats():
+            # set başına kuyruk bekleme / iş süresi özetleri
+            return {"limiter": self.limiter.stats(),
+                    "sql_cache": self.sql_cache.stats(),
+                    "semantic_cache": (self.semantic_cache.stats()
+                                       if self.semantic_cache else None),
+                    "result_cache": (self.result_cache.stats()
+                                     if self.result_cache else None),
+                    "cost_guard": self.cost_guard.stats() if self.cost_guard else None,
+                    "matviews": [m.stats() for m in all_matviews()],
+                    "replica": [r.stats() for r in all_replicas()],
+                    "llm": {"deployments": llm_stats(),
+                            "routers": {s: m.router.stats() for s, m in self.models.items()
+                                        if getattr(m, "router", None) is not None}},
+                    "db_pool": pool_stats(),
+                    "warmup": self.warmup,
+                    "state": self.state.stats(),
+                    "worker": {"pid": os.getpid(), "models": sorted(self.models),
+                               "active": self._active, "draining": self.draining}}
+
+        @self.app.get("/metrics", response_class=PlainTextResponse)
+        async def metrics():
+            # Prometheus text exposition 0.0.4
+            return PlainTextResponse(REGISTRY.render(),
+                                     media_type="text/plain; version=0.0.4; charset=utf-8")
+
+        @self.app.post("/schema/reload")
+        def schema_reload():
+            # şema değiştiğinde TTL'i beklemeden kataloğu yeniden yükle
+            return {"status": "success", "catalogs": refresh_all()}
+
+        @self.app.post("/cache/invalidate")
+        def cache_invalidate(r: InvalidateRequest):
+            # ETL / yükleme sonrası TTL'i beklemeden eski sonuçları düşür
+            if self.result_cache is None:
+                return {"status": "success", "invalidated": 0}
+            tables = r.tables
+            if tables is None and r.set_id is not None:
+                tables = list(get_prompt_builder(r.set_id).tables)     # setin DDL tabloları
+            return {"status": "success",
+                    "invalidated": self.result_cache.invalidate(tables)}
+
+        # def → FastAPI bunu thread havuzunda çalıştırır, event loop bloklanmaz
         @self.app.post("/save_view")
-        async def save_view(r: SaveViewRequest):
-            sql = self.last_sql.get(r.set_id)
-            if not sql:
-                return {"status": "error", "msg": "Önce bir sorgu çalıştırın."}
+        def save_view(r: SaveViewRequest):
+            return self._save_view(r)
 
-            engine = self._get_model(r.set_id).engine
-            safe = "".join(c for c in r.view_name if c.isalnum() or c == "_")
-            clean_sql = re.sub(r'ORDER\\s+BY[\\s\\S]*?;?$', '', sql, flags=re.I).strip()
-            stmt = f"CREATE OR ALTER VIEW [dbo].[{safe}] AS {clean_sql}"
+        @self.app.get("/matviews")
+        def matviews(set_id: int = 2):
+            return {"status": "success",
+                    "views": self._get_model(set_id).matviews.list()}
 
+        @self.app.post("/replica/sync")
+        def replica_sync(set_id: int = 2):
+            rep = self._get_model(set_id).replica
+            if rep is None:
+                raise HTTPException(status_code=404,
+                                    detail=f"Set {set_id} için yerel kopya kapalı (REPLICA_SETS)")
+            return {"status": "success", "tables": rep.sync()}
 
+        @self.app.post("/matviews/{name}/refresh")
+        def matview_refresh(name: str, set_id: int = 2, full: bool = False):
+            # full=1 → kaynakta güncellenen / silinen satırlar için tam yeniden yazım
             try:
-                with engine.begin() as conn:
-                    conn.execute(text(stmt))
-                return {"status": "success",
-                        "msg": f"VIEW {safe} oluşturuldu / güncellendi"}
-            except Exception as e:
-                return {"status": "error", "msg": str(e)}
+                res = self._get_model(set_id).matviews.refresh(name, full=full)
+            except KeyError:
+                raise HTTPException(status_code=404, detail=f"Kalıcı görünüm yok: {name}")
+            if res["status"] == "success" and self.result_cache is not None:
+                self.result_cache.invalidate([res["name"]])
+            return res
 
     # ─────────── Sunucuları başlat ───────────
     def run(self):
@@ -123,8 +812,11 @@ class Main:
                         log_level="warning")
         threading.Thread(target=start_api, daemon=True).start()
 
-        # Gradio UI (ui.py)
-        ui = QueryUI(api_host=self.api_host, api_port=self.api_port)
+        # Gradio UI – yalnız burada yüklenir; API-only (server.py) Gradio'yu hiç import etmez
+        from helper.interface_helper import QueryUI
+        # UI_MODE=local (vars.) → HTTP yerine doğrudan çağrı
+        local = self if os.getenv("UI_MODE", "local") == "local" else None
+        ui = QueryUI(api_host=self.api_host, api_port=self.api_port, local=local)
         ui.launch(server_name="127.0.0.1", server_port=self.ui_port)
 
 # ─── main ───────────────────────────────────────────────────────────────
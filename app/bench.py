@@ -0,0 +1,520 @@
+"""
+bench.py – Azure kimlik bilgisi gerektirmeyen çevrimdışı benchmark
+
+  python app/bench.py --scale 10k --requests 200 --concurrency 1,8,32 \\
+                      --llm-latency-ms 300 --out bench_results.json
+  python app/bench.py --scale 1m --compare bench_results.json
+
+Ölçülenler:
+  • aşama bazında p50/p95/p99 (prompt → LLM → SQL ayıklama → doğrulama
+    → DB yürütme)
+  • FastAPI uygulamasına karşı N eşzamanlı istemciyle throughput
+  • geniş tablolarda sonuç biçimi (rows / columnar / arrow) başına
+    sunucu kodlama süresi, yük boyutu ve istemcide DataFrame'e çevirme
+  • tracemalloc tepe bellek + süreç RSS tepe değeri
+  • soğuk açılış: temiz yorumlayıcıda API-only import (server.py),
+    create_app() ve ilk /ask süresi, yüklenen ağır paketler ve
+    ``-X importtime`` ile en pahalı importlar
+  • ``--hedge``: yerel OpenAI uyumlu stub sunucusuna karşı tek çağrı /
+    hedge / katmanlı / ikisi birden politikalarında NL → SQL gecikmesi,
+    geçerli SQL oranı ve istek başına LLM çağrısı
+  • ``--replica``: set 2/3 kopyasının ilk / artımlı senkron süresi ve
+    analitik sorguların kaynak ↔ DuckDB kopyası p50/p95'i (duckdb gerekir)
+Sonuç JSON olarak yazılır; ``--compare`` iki commit arasını karşılaştırır
+(taban çalıştırmadan önce okunur, ``--out`` ile aynı dosya olabilir).
+"""
+
+import os, sys, glob, json, time, asyncio, argparse, subprocess, tracemalloc, platform
+from decimal import Decimal
+from typing import Dict, List
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR)
+
+from helper.bench_helper import (FakeLLMClient, BENCH_QUESTIONS, CANNED_SQL, build_fixture,
+                                 parse_scale, percentiles)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"],
+                                       cwd=BASE_DIR, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def _peak_rss_mb() -> float:
+    try:
+        import resource
+        kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(kb / 1024 if platform.system() != "Darwin" else kb / 1024 / 1024, 1)
+    except Exception:
+        return -1.0
+
+
+# ───────────────────── Aşama ölçümü ─────────────────────
+def bench_stages(args, dsn: str) -> Dict[str, Dict]:
+    from helper.api_helper import LLModel
+
+    timings: Dict[str, List[float]] = {}
+
+    def clock(name, fn, *a, **kw):
+        t0 = time.perf_counter()
+        out = fn(*a, **kw)
+        timings.setdefault(name, []).append((time.perf_counter() - t0) * 1000)
+        return out
+
+    for set_id, questions in BENCH_QUESTIONS.items():
+        client = FakeLLMClient(set_id, latency_ms=args.llm_latency_ms,
+                               jitter_ms=args.llm_jitter_ms, seed=args.seed)
+        model = LLModel(table_set=set_id, client=client, dsn=dsn)
+        for i in range(args.stage_iterations):
+            q = questions[i % len(questions)]
+            t0 = time.perf_counter()
+            msgs = clock("prompt", model._prompt_messages, q)
+            resp = clock("llm", model._complete, model=model.deployment_name,
+                         temperature=0.0, max_tokens=256, messages=msgs)
+            sql = clock("extract", model._extract_sql, resp.choices[0].message.content)
+            clock("validate", model.validate, sql)
+            clock("execute", model._run, sql)
+            timings.setdefault("total", []).append((time.perf_counter() - t0) * 1000)
+
+    return {k: percentiles(v) for k, v in timings.items()}
+
+
+# ───────────────────── Sonuç biçimleri ─────────────────────
+FORMAT_QUERIES = {"PlcTag": (1, "SELECT * FROM PlcTag"),
+                  "Pursu_hat_verileri": (3, "SELECT * FROM Pursu_hat_verileri")}
+
+
+def bench_formats(args, dsn: str) -> Dict[str, Dict]:
+    """Biçim başına: _run + JSON/Arrow kodlama (sunucu) ve DataFrame (istemci)."""
+    import pandas as pd
+    from app import QueryResponse
+    from helper.api_helper import LLModel
+    from helper.format_helper import arrow_available, to_arrow_ipc, from_arrow_ipc, to_dataframe
+
+    formats = ["rows", "columnar"] + (["arrow"] if arrow_available() else [])
+    out: Dict[str, Dict] = {}
+    for table, (set_id, sql) in FORMAT_QUERIES.items():
+        model = LLModel(table_set=set_id, client=FakeLLMClient(set_id, latency_ms=0), dsn=dsn)
+        for fmt in formats:
+            server, client, size = [], [], 0
+            for _ in range(args.stage_iterations):
+                t0 = time.perf_counter()
+                res = model._run(sql, fmt=fmt)
+                if fmt == "arrow":
+                    body = to_arrow_ipc(res["columns"], res["data"], {"sql": sql})
+                else:
+                    body = QueryResponse(status="success", sql=sql, rows=res.get("rows"),
+                                         columns=res.get("columns"),
+                                         data=res.get("data")).model_dump_json().encode()
+                t1 = time.perf_counter()
+                if fmt == "arrow":
+                    df = from_arrow_ipc(body)[0].to_pandas()
+                elif fmt == "columnar":
+                    d = json.loads(body)
+                    df = to_dataframe(d["columns"], d["data"])
+                else:
+                    df = pd.DataFrame(json.loads(body)["rows"])
+                t2 = time.perf_counter()
+                server.append((t1 - t0) * 1000)
+                client.append((t2 - t1) * 1000)
+                size = len(body)
+            out[f"{table}/{fmt}"] = {"rows": len(df), "columns": len(df.columns),
+                                     "payload_bytes": size,
+                                     "server_ms": percentiles(server),
+                                     "client_df_ms": percentiles(client)}
+    return out
+
+
+# ───────────────────── Yerel kopya (DuckDB / Parquet) ─────────────────────
+def _append_rows(db: str, table: str, n: int) -> int:
+    """Tablonun ilk ``n`` satırını su seviyesinin ötesine kaydırıp yeniden ekler."""
+    import sqlite3
+    conn = sqlite3.connect(db)
+    cols = [r[1] for r in conn.execute(f'PRAGMA table_info("{table}")')]
+    top, mark = conn.execute(f'SELECT MAX(Id), MAX(date_time) FROM "{table}"').fetchone()
+    exprs = [f"Id + {top}" if c == "Id"
+             else f"datetime('{mark}', '+' || Id || ' seconds')" if c == "date_time"
+             else f'"{c}"' for c in cols]
+    names = ", ".join(f'"{c}"' for c in cols)
+    cur = conn.execute(f'INSERT INTO "{table}" ({names}) '
+                       f'SELECT {", ".join(exprs)} FROM "{table}" ORDER BY Id LIMIT {n}')
+    conn.commit()
+    conn.close()
+    return cur.rowcount
+
+
+def _rounded(data: List[List]) -> List[tuple]:
+    rows = zip(*data) if data else ()
+    return sorted(tuple(round(float(v), 6) if isinstance(v, (float, Decimal)) else str(v)
+                        for v in r) for r in rows)
+
+
+def bench_replica(args, db: str) -> Dict:
+    """Set 2/3 analitik sorguları: kaynak (SQLite) ↔ yerel kopya (DuckDB).
+
+    Fikstürün kopyası üzerinde çalışır (artımlı senkron için satır eklenir).
+    """
+    import shutil
+    from helper.api_helper import LLModel
+    from helper.replica_helper import Replica, replica_available, is_analytical
+
+    if not replica_available():
+        return {"error": "duckdb kurulu değil"}
+    src = os.path.join(args.data_dir, "replica_src.db")
+    rdir = os.path.join(args.data_dir, "replica")
+    shutil.copyfile(db, src)
+    shutil.rmtree(rdir, ignore_errors=True)
+    dsn = f"sqlite:///{os.path.abspath(src)}"
+
+    models = {s: LLModel(table_set=s, client=FakeLLMClient(s, latency_ms=0), dsn=dsn)
+              for s in (2, 3)}
+    rep = Replica(models[2].engine, rdir)
+    rep.track(t for m in models.values() for t in m.catalog.tables()
+              if t.lower() in m.prompt.tables)
+
+    t0 = time.perf_counter()
+    initial = rep.sync()
+    initial_s = time.perf_counter() - t0
+
+    added = {t: _append_rows(src, t, max(1, args.replica_append))
+             for t in rep.tables.values()}
+    t0 = time.perf_counter()
+    incremental = rep.sync()
+    incremental_ms = (time.perf_counter() - t0) * 1000
+
+    queries: Dict[str, Dict] = {}
+    for set_id, model in models.items():
+        for i, sql in enumerate(CANNED_SQL[set_id]):
+            if not is_analytical(sql):
+                continue
+            out, result = {}, {}
+            for path, replica in (("source", None), ("replica", rep)):
+                model.replica = replica
+                lat, res = [], {}
+                for _ in range(args.replica_iterations):
+                    t0 = time.perf_counter()
+                    res = model._run(sql, fmt="columnar")
+                    lat.append((time.perf_counter() - t0) * 1000)
+                result[path] = _rounded(res["data"])
+                out[path] = {"ms": percentiles(lat), "rows": len(result[path]),
+                             "routed": res["replica"]}
+            model.replica = None
+            out["speedup_p50"] = round(out["source"]["ms"]["p50"]
+                                       / max(out["replica"]["ms"]["p50"], 1e-6), 2)
+            # float toplamları motorlar arasında son hanelerde ayrışabilir
+            out["rows_match"] = result["source"] == result["replica"]
+            queries[f"set{set_id}/q{i}"] = out
+
+    size = sum(os.path.getsize(f) for f in glob.glob(os.path.join(rep.dir, "**", "*.parquet"),
+                                                     recursive=True))
+    return {"initial_sync_s": round(initial_s, 3), "initial": initial,
+            "appended": added, "incremental_sync_ms": round(incremental_ms, 1),
+            "incremental": incremental, "parquet_bytes": size, "queries": queries}
+
+
+# ───────────────────── LLM hedge / katman ─────────────────────
+HEDGE_POLICIES = {"single": {},
+                  "hedge": {"LLM_HEDGE": "1"},
+                  "tiered": {"LLM_TIERS": "stub-small,stub-large"},
+                  "tiered+hedge": {"LLM_TIERS": "stub-small,stub-large", "LLM_HEDGE": "1"}}
+
+
+def bench_hedge(args, dsn: str) -> Dict[str, Dict]:
+    """Yerel stub sunucusuna karşı (gerçek openai istemcisi) politika başına NL → SQL.
+
+    stub-large: --llm-latency-ms; stub-small: %40'ı, %15 geçersiz SQL.
+    İkisinde de isteklerin %3'ü 8 kat yavaştır (kuyruk gecikmesi).
+    """
+    import importlib.util
+    from concurrent.futures import ThreadPoolExecutor
+    from helper.api_helper import LLModel
+    from helper.llm_router_helper import reset_stats
+    from helper.llm_stub_helper import StubLLMServer, StubProfile
+
+    if importlib.util.find_spec("openai") is None:
+        return {"error": "openai kurulu değil"}
+    base = args.llm_latency_ms
+    questions = [q for qs in BENCH_QUESTIONS.values() for q in qs]
+    out: Dict[str, Dict] = {}
+    for name, env in HEDGE_POLICIES.items():
+        stub = StubLLMServer({
+            "stub-small": StubProfile(latency_ms=base * 0.4, jitter_ms=base * 0.1,
+                                      slow_p=0.03, slow_x=8, invalid_p=0.15),
+            "stub-large": StubProfile(latency_ms=base, jitter_ms=base * 0.1,
+                                      slow_p=0.03, slow_x=8)},
+            CANNED_SQL[3], seed=args.seed).start()
+        saved = {k: os.environ.get(k) for k in
+                 ("AZURE_OPENAI_ENDPOINT", "AZURE_OPENAI_KEY", "AZURE_DEPLOYMENT_NAME",
+                  "LLM_TIERS", "LLM_HEDGE", "LLM_STATS_MIN_SAMPLES")}
+        os.environ.update({"AZURE_OPENAI_ENDPOINT": stub.url, "AZURE_OPENAI_KEY": "stub",
+                           "AZURE_DEPLOYMENT_NAME": "stub-large", "LLM_STATS_MIN_SAMPLES": "20",
+                           "LLM_TIERS": "", "LLM_HEDGE": "0", **env})
+        reset_stats()
+        try:
+            model = LLModel(table_set=3, dsn=dsn)
+
+            def one(i):
+                t0 = time.perf_counter()
+                sql = model.nl_to_sql(f"{questions[i % len(questions)]} #{i}")
+                ms = (time.perf_counter() - t0) * 1000
+                try:
+                    model.validate(sql)
+                    return ms, True
+                except ValueError:
+                    return ms, False
+
+            with ThreadPoolExecutor(args.hedge_concurrency) as pool:
+                res = list(pool.map(one, range(args.hedge_requests)))
+            time.sleep(0.2)                 # iptal edilen akışlar stub'da sayılsın
+        finally:
+            stub.stop()
+            for k, v in saved.items():
+                if v is None:
+                    os.environ.pop(k, None)
+                else:
+                    os.environ[k] = v
+        calls = sum(d["requests"] for d in stub.stats.values())
+        out[name] = {"latency_ms": percentiles([ms for ms, _ in res]),
+                     "valid_rate": round(sum(ok for _, ok in res) / len(res), 3),
+                     "llm_calls_per_request": round(calls / len(res), 3),
+                     "stub": stub.stats,
+                     "router": model.router.stats() if model.router else None}
+    return out
+
+
+# ───────────────────── Soğuk açılış ─────────────────────
+_STARTUP_SNIPPET = r'''
+import json, sys, time, asyncio
+t0 = time.perf_counter()
+import server
+t1 = time.perf_counter()
+app = server.create_app()
+t2 = time.perf_counter()
+from app import Main
+from helper.api_helper import LLModel
+from helper.bench_helper import FakeLLMClient
+import httpx
+factory = lambda *, table_set, **kw: LLModel(table_set=table_set, client=FakeLLMClient(table_set, latency_ms=0), **kw)
+main = Main(model_factory=factory)
+async def ask():
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://s") as c:
+        t = time.perf_counter()
+        r = await c.post("/ask", json={"question": "Makineleri listele", "set_id": 1})
+        return (time.perf_counter() - t) * 1000, r.json()["status"]
+first_ms, status = asyncio.run(ask())
+main.query_log.close()
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "create_app_ms": (t2 - t1) * 1000,
+                  "first_ask_ms": first_ms, "status": status,
+                  "loaded": {m: m in sys.modules for m in HEAVY}}))
+'''
+HEAVY = ("gradio", "pandas", "openai", "pyarrow", "numpy", "langchain_community")
+
+
+def _importtime_top(stderr: str, n: int = 10) -> List[Dict]:
+    """``-X importtime`` çıktısından en pahalı üst düzey importlar."""
+    rows = []
+    for line in stderr.splitlines():
+        parts = line.split("|")
+        if not line.startswith("import time:") or len(parts) != 3 or "cumulative" in line:
+            continue
+        depth = (len(parts[2]) - len(parts[2].lstrip()) - 1) // 2
+        if depth <= 1:                      # snippet'in doğrudan import ettikleri + bir alt
+            rows.append((int(parts[1]), parts[2].strip()))
+    return [{"module": m, "cumulative_ms": round(us / 1000, 1)}
+            for us, m in sorted(rows, reverse=True)[:n]]
+
+
+def bench_startup(args, dsn: str) -> Dict:
+    env = {**os.environ, "DB_URL": dsn, "WARMUP_SETS": "", "RESULT_CACHE": "1"}
+    runs: Dict[str, List[float]] = {}
+    last, top = {}, []
+    for i in range(args.startup_runs):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                               f"HEAVY = {HEAVY!r}\n" + _STARTUP_SNIPPET],
+                              cwd=BASE_DIR, env=env, capture_output=True, text=True)
+        if proc.returncode != 0:
+            return {"error": proc.stderr.strip().splitlines()[-1]}
+        last = json.loads(proc.stdout.strip().splitlines()[-1])
+        for k in ("import_ms", "create_app_ms", "first_ask_ms"):
+            runs.setdefault(k, []).append(last[k])
+        if i == 0:
+            top = _importtime_top(proc.stderr)
+    return {**{k: percentiles(v) for k, v in runs.items()},
+            "status": last.get("status"), "loaded": last.get("loaded"),
+            "top_imports": top}
+
+
+# ───────────────────── Throughput ─────────────────────
+async def _load(app, n_requests: int, concurrency: int) -> Dict:
+    import httpx
+
+    sem = asyncio.Semaphore(concurrency)
+    lat: List[float] = []
+    status: Dict[str, int] = {}
+    items = [(s, q) for s, qs in BENCH_QUESTIONS.items() for q in qs]
+
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app),
+                                 base_url="http://bench", timeout=600) as client:
+        async def one(i):
+            set_id, q = items[i % len(items)]
+            async with sem:
+                t0 = time.perf_counter()
+                r = await client.post("/ask", json={"question": q, "set_id": set_id,
+                                                    "no_cache": True})
+                lat.append((time.perf_counter() - t0) * 1000)
+            key = str(r.status_code) if r.status_code != 200 else r.json()["status"]
+            status[key] = status.get(key, 0) + 1
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(n_requests)))
+        wall = time.perf_counter() - t0
+
+    return {"concurrency": concurrency,
+            "requests": n_requests,
+            "wall_s": round(wall, 3),
+            "rps": round(n_requests / wall, 2),
+            "status": status,
+            "latency_ms": percentiles(lat)}
+
+
+def bench_throughput(args, dsn: str) -> List[Dict]:
+    from app import Main
+    from helper.api_helper import LLModel
+
+    def factory(*, table_set, **kw):
+        client = FakeLLMClient(table_set, latency_ms=args.llm_latency_ms,
+                               jitter_ms=args.llm_jitter_ms, seed=args.seed)
+        return LLModel(table_set=table_set, client=client, dsn=dsn, **kw)
+
+    out = []
+    for c in args.concurrency:
+        main = Main(model_factory=factory)
+        out.append(asyncio.run(_load(main.app, args.requests, c)))
+        main.query_log.close()
+    return out
+
+
+# ───────────────────── Karşılaştırma ─────────────────────
+def compare(old: Dict, new: Dict):
+    print(f"\n=== {old.get('commit')} → {new.get('commit')} ===")
+    for stage, cur in new.get("stages", {}).items():
+        prev = old.get("stages", {}).get(stage)
+        if not prev or "p50" not in prev:
+            continue
+        for p in ("p50", "p95", "p99"):
+            d = cur[p] - prev[p]
+            pct = (d / prev[p] * 100) if prev[p] else 0.0
+            print(f"{stage:>14} {p}: {prev[p]:9.3f} → {cur[p]:9.3f} ms ({pct:+.1f}%)")
+    old_tp = {t["concurrency"]: t for t in old.get("throughput", [])}
+    for t in new.get("throughput", []):
+        prev = old_tp.get(t["concurrency"])
+        if prev:
+            print(f"  c={t['concurrency']:<4} rps: {prev['rps']:8.2f} → {t['rps']:8.2f}")
+    for k in ("import_ms", "create_app_ms", "first_ask_ms"):
+        prev, cur = old.get("startup", {}).get(k), new.get("startup", {}).get(k)
+        if prev and cur:
+            print(f"{'startup ' + k:>28} p50: {prev['p50']:9.1f} → {cur['p50']:9.1f} ms")
+    for name, cur in new.get("formats", {}).items():
+        prev = old.get("formats", {}).get(name)
+        if prev:
+            print(f"{name:>28} server p50: {prev['server_ms']['p50']:8.3f} → "
+                  f"{cur['server_ms']['p50']:8.3f} ms  bytes: {prev['payload_bytes']} → "
+                  f"{cur['payload_bytes']}")
+    for name, cur in new.get("hedge", {}).items():
+        prev = old.get("hedge", {}).get(name)
+        if prev and "latency_ms" in prev and "latency_ms" in cur:
+            print(f"{'hedge ' + name:>28} p99: {prev['latency_ms']['p99']:8.1f} → "
+                  f"{cur['latency_ms']['p99']:8.1f} ms  calls/req: "
+                  f"{prev['llm_calls_per_request']} → {cur['llm_calls_per_request']}")
+    for name, cur in new.get("replica", {}).get("queries", {}).items():
+        prev = old.get("replica", {}).get("queries", {}).get(name)
+        if prev:
+            print(f"{'replica ' + name:>28} p50: source {prev['source']['ms']['p50']:8.2f} → "
+                  f"{cur['source']['ms']['p50']:8.2f} ms  replica "
+                  f"{prev['replica']['ms']['p50']:8.2f} → {cur['replica']['ms']['p50']:8.2f} ms")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="NL→SQL çevrimdışı benchmark")
+    ap.add_argument("--scale", default="10k", help="büyük tablo satır sayısı (10k, 1m, 10m)")
+    ap.add_argument("--data-dir", default=os.path.join(BASE_DIR, "..", "bench_data"))
+    ap.add_argument("--seed", type=int, default=42)
+    ap.add_argument("--llm-latency-ms", type=float, default=300.0)
+    ap.add_argument("--llm-jitter-ms", type=float, default=0.0)
+    ap.add_argument("--stage-iterations", type=int, default=30)
+    ap.add_argument("--requests", type=int, default=100)
+    ap.add_argument("--concurrency", default="1,8,32",
+                    type=lambda s: [int(x) for x in s.split(",") if x])
+    ap.add_argument("--skip-throughput", action="store_true")
+    ap.add_argument("--skip-formats", action="store_true")
+    ap.add_argument("--startup-runs", type=int, default=5)
+    ap.add_argument("--skip-startup", action="store_true")
+    ap.add_argument("--hedge", action="store_true",
+                    help="LLM hedge / katman politikaları: yerel stub sunucusuna karşı p50/p95/p99")
+    ap.add_argument("--hedge-requests", type=int, default=300)
+    ap.add_argument("--hedge-concurrency", type=int, default=8)
+    ap.add_argument("--replica", action="store_true",
+                    help="set 2/3 analitik sorguları: kaynak ↔ DuckDB kopyası (duckdb gerekir)")
+    ap.add_argument("--replica-iterations", type=int, default=10)
+    ap.add_argument("--replica-append", type=int, default=10000,
+                    help="artımlı senkron ölçümü için tablo başına eklenen satır")
+    ap.add_argument("--out", default="bench_results.json")
+    ap.add_argument("--compare", help="önceki sonuç JSON'u")
+    args = ap.parse_args()
+
+    # taban sonuç önce okunur: --out aynı dosyaysa üzerine yazılmadan önce
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    scale = parse_scale(args.scale)
+    os.makedirs(args.data_dir, exist_ok=True)
+    db = os.path.abspath(os.path.join(args.data_dir, f"fixture_{scale}_{args.seed}.db"))
+    t0 = time.perf_counter()
+    build_fixture(db, scale, seed=args.seed)
+    fixture_s = time.perf_counter() - t0
+    dsn = f"sqlite:///{db}"
+    # uygulamanın kendi engine'i / logu da fikstür dizinini kullansın
+    os.environ["DB_URL"] = dsn
+    os.environ.setdefault("QUERY_LOG_FILE", os.path.join(args.data_dir, "bench_query_logs.jsonl"))
+
+    tracemalloc.start()
+    stages = bench_stages(args, dsn)
+    _, stage_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "config": {"scale": scale, "seed": args.seed,
+                   "llm_latency_ms": args.llm_latency_ms,
+                   "llm_jitter_ms": args.llm_jitter_ms,
+                   "stage_iterations": args.stage_iterations,
+                   "requests": args.requests,
+                   "concurrency": args.concurrency},
+        "fixture_build_s": round(fixture_s, 2),
+        "stages": stages,
+        "formats": {} if args.skip_formats else bench_formats(args, dsn),
+        "startup": {} if args.skip_startup else bench_startup(args, dsn),
+        "throughput": [] if args.skip_throughput else bench_throughput(args, dsn),
+        "replica": bench_replica(args, db) if args.replica else {},
+        "hedge": bench_hedge(args, dsn) if args.hedge else {},
+        "memory": {"stage_peak_mb": round(stage_peak / 1024 / 1024, 2),
+                   "rss_peak_mb": _peak_rss_mb()},
+    }
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+
+    if baseline is not None:
+        compare(baseline, result)
+
+
+if __name__ == "__main__":
+    main()
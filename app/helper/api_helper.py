@@ -1,23 +1,28 @@
 # app/models/rag_model.py  –  tek dosyada 3 şema + 3 Bad/Good seçimi
 
-from langchain_community.utilities import SQLDatabase
-from sqlalchemy import create_engine, inspect
-from urllib.parse import quote_plus
-import re, textwrap, time, contextlib, os
-from typing import Dict, List
+import re, textwrap, time, contextlib, os, random, logging, functools, itertools
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional
 from dotenv import load_dotenv
-import os
-from openai import AzureOpenAI
-from .db_helper import get_engine
+from .db_helper import get_engine, checkout, statement_timeout_for, interrupt, StatementTimeout
+from .schema_helper import get_catalog
+from .cache_helper import SQLCache
+from .paging_helper import limit_sql, count_sql
+from .metrics_helper import (StageTimer, stage, record_usage, PROMPT_TOKENS_SAVED,
+                             REPAIRS, REPAIR_SECONDS, QUERY_GUARD, REPLICA_QUERIES)
+from .prompt_helper import PromptBuilder, PromptBuild
+from .validator_helper import SQLValidator, SQLValidationError, canonical_sql
+from .result_cache_helper import ResultCache, to_columnar
+from .format_helper import FORMATS, to_columns
+from .cost_helper import CostGuard, QueryTooExpensive
+from .concurrency_helper import CancelToken, Cancelled
+from .matview_helper import get_matviews
+from .replica_helper import get_replica, replica_available, replica_sets
+from .llm_router_helper import LLMRouter
+
+if TYPE_CHECKING:                       # NumPy'ı yalnız anlamsal önbellek açıkken yükle
+    from .semantic_helper import SemanticCache
 load_dotenv()
-OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-OPENAI_API_BASE = os.getenv('OPENAI_API_BASE')
-
-# OpenAI istemcisi örneği
-openai_client = AzureOpenAI(
-    api_key=OPENAI_API_KEY,
-    api_base=OPENAI_API_BASE
-)
+log = logging.getLogger("app.llm")
 # ───────────────────── Açıklamalı Şema Blokları ───────────────────────
 DDL_BLOCKS = {
     1: """\
@@ -169,6 +174,21 @@ CREATE TABLE [dbo].[Pursu_hat_verileri] (
 """
 }
 
+# Sorudaki Türkçe kelimelerden tabloya ulaşmak için (DDL budama).
+# Kolon adları ayrıca otomatik eşleştirilir; burada yalnız tablo eş anlamlıları.
+TABLE_KEYWORDS = {
+    1: {"Factory": ["fabrika"],
+        "Area":    ["alan", "bölge"],
+        "Line":    ["hat"],
+        "Station": ["istasyon"],
+        "Unit":    ["ünite", "birim"],
+        "Machine": ["makine", "makina"],
+        "Plc":     ["plc"],
+        "PlcTag":  ["tag", "etiket", "alarm", "sensör"]},
+    2: {"Pursu_hammadde_verimleri": ["hammadde", "malzeme", "stok"]},
+    3: {"Pursu_hat_verileri": ["hat", "üretim", "verim"]},
+}
+
 # ───────────────────── Bad ↔ Good Örnekleri 3 Set ──────────────────────
 BAD_GOOD_BLOCKS = {
     1: """
@@ -310,6 +330,18 @@ Sorguyu otomatik yeniden oluştur
     3: """""".strip()}
 
 
+# Prompt metni (RULES / örnekler / şablon) değişince artırılmalı →
+# eski önbellek kayıtları kendiliğinden geçersiz olur.
+PROMPT_VERSION = "3"
+
+
+@functools.lru_cache(maxsize=None)
+def get_prompt_builder(table_set: int) -> PromptBuilder:
+    """Set başına tek PromptBuilder (sabit önek süreç boyunca bir kez hazırlanır)."""
+    return PromptBuilder(ddl=DDL_BLOCKS[table_set], rules=RULES[table_set],
+                         examples=BAD_GOOD_BLOCKS[table_set],
+                         table_keywords=TABLE_KEYWORDS[table_set])
+
 # ───────────────────────────── LLModel ──────────────────────────────
 class LLModel:
     """
@@ -318,7 +350,13 @@ class LLModel:
     def __init__(self, *, table_set: int = 1,
                  endpoint: str | None = None,
                  api_key: str | None = None,
-                 deployment: str | None = None):
+                 deployment: str | None = None,
+                 sql_cache: SQLCache | None = None,
+                 semantic_cache: "SemanticCache | None" = None,
+                 result_cache: ResultCache | None = None,
+                 cost_guard: CostGuard | None = None,
+                 client=None,
+                 dsn: str | None = None):
         if table_set not in {1, 2, 3}:
             raise ValueError("table_set 1, 2 veya 3 olmalı")
         
@@ -328,46 +366,97 @@ class LLModel:
         api_key    = api_key    or os.getenv("AZURE_OPENAI_KEY")
         deployment = deployment or os.getenv("AZURE_DEPLOYMENT_NAME")
 
-        if not all([endpoint, api_key, deployment]):
-            raise ValueError("Azure OpenAI .env bilgileri eksik "
-                             "(AZURE_OPENAI_ENDPOINT / KEY / DEPLOYMENT_NAME).")
+        if client is not None:
+            # dışarıdan verilen (ör. benchmark stub'ı) istemci
+            self.client = client
+            deployment  = deployment or "stub"
+        else:
+            if not all([endpoint, api_key, deployment]):
+                raise ValueError("Azure OpenAI .env bilgileri eksik "
+                                 "(AZURE_OPENAI_ENDPOINT / KEY / DEPLOYMENT_NAME).")
+            # openai paketi ağır (~0.6 sn) → yalnız gerçek istemci gerektiğinde yüklenir
+            from openai import AzureOpenAI
 
-        self.client          = AzureOpenAI(
-            azure_endpoint = endpoint,
-            api_key        = api_key,
-            api_version    = "2023-12-01-preview"
-        )
+            self.client          = AzureOpenAI(
+                azure_endpoint = endpoint,
+                api_key        = api_key,
+                # stream_options (akışta usage) 2024-09-01-preview ve sonrasında var
+                api_version    = os.getenv("AZURE_OPENAI_API_VERSION", "2024-10-21")
+            )
         self.deployment_name = deployment
+        # LLM_TIERS / LLM_HEDGE varsa NL → SQL çağrısı yönlendiriciden geçer (None → tek çağrı)
+        self.router = LLMRouter.from_env(self._call_deployment, deployment)
+        # onarım en güçlü (son) katmana gider
+        self.repair_deployment = self.router.tiers[-1] if self.router else deployment
 
         # ─── DB / Şema ───
-        self.engine      = get_engine(fast=True)
+        self.engine      = get_engine(dsn)
+        self.catalog     = get_catalog(self.engine)     # engine başına tek yansıtma
+        # set bazında ifade zaman aşımı (DB_SET_TIMEOUTS, yoksa DB_STATEMENT_TIMEOUT)
+        self.statement_timeout = statement_timeout_for(table_set, self.engine)
+        self.validator   = SQLValidator(self.catalog)
         self.ddl_block   = DDL_BLOCKS[table_set]
         self.bad_good    = BAD_GOOD_BLOCKS[table_set]
         self.rules       = RULES[table_set]
+        self.table_set   = table_set
+        # sabit prompt parçaları set başına bir kez hazırlanır
+        self.prompt      = get_prompt_builder(table_set)
+
+        # ─── NL → SQL önbelleği (süreç içinde paylaşılabilir) ───
+        self.sql_cache   = sql_cache if sql_cache is not None else SQLCache()
+        # Anlamsal önbellek isteğe bağlı (None → kapalı)
+        self.semantic_cache = semantic_cache
+        # SQL → sonuç önbelleği isteğe bağlı (None → kapalı)
+        self.result_cache = result_cache
+        # yürütme öncesi plan / maliyet kontrolü isteğe bağlı (None → kapalı)
+        self.cost_guard = cost_guard
+        # /save_view materialize=True ile kaydedilen görünümler (engine başına)
+        self.matviews    = get_matviews(self.engine)
+        # REPLICA_SETS'teki setlerde analitik sorgular yerel DuckDB kopyasında çalışır
+        self.replica     = None
+        if table_set in replica_sets():
+            if replica_available():
+                self.replica = get_replica(self.engine)
+                self.replica.track(t for t in self.catalog.tables()
+                                   if t.lower() in self.prompt.tables)
+            else:
+                log.warning("REPLICA_SETS=%s ama duckdb kurulu değil; yerel kopya kapalı",
+                            os.getenv("REPLICA_SETS"))
 
     # ───────────── PROMPT OLUŞTURMA ─────────────
+    def _build_prompt(self, question: str, timer: Optional[StageTimer] = None) -> PromptBuild:
+        """Budanmış prompt + token raporu (tahmini / kazanılan)."""
+        with stage(timer, "prompt_build"):
+            built = self.prompt.build(question)
+        rep = built.report
+        PROMPT_TOKENS_SAVED.inc(rep["saved"], set_id=self.table_set)
+        if timer is not None:
+            timer.usage["prompt_est"] = rep["tokens"]
+            timer.usage["prompt_saved_est"] = rep["saved"]
+        log.debug("Prompt  set=%s  tokens=%s  saved=%s  tables=%s", self.table_set,
+                  rep["tokens"], rep["saved"], rep["tables"])
+        if rep["over_budget"]:
+            log.warning("Prompt bütçeyi aşıyor  set=%s  tokens=%s  budget=%s",
+                        self.table_set, rep["tokens"], rep["budget"])
+        return built
+
     def _prompt_messages(self, question: str) -> List[dict]:
-        user_prompt = textwrap.dedent(f"""
-            {RULES}                          
-            
-            ### KÖTÜ–İYİ ÖRNEKLER (BAD ↔ GOOD)
-            {self.bad_good}
-
-            Sadece MSSQL SELECT sorgusu yaz.
-
-            ### SORU
-            {question}
-
-            ### DDL TABLO BLOĞU // BU DDL'E SADIK KALINACAK
-            {self.ddl_block}
-
-            SQL:
-        """).strip()
-        return [
-            {"role": "system",
-             "content": "You are an expert SQL generator for Microsoft SQL Server."},
-            {"role": "user", "content": user_prompt}
-        ]
+        return self.prompt.build(question).messages
+
+    WARMUP_QUESTION = "Tablodaki ilk kaydı getir."
+
+    def warm_up(self) -> Dict:
+        """Sabit öneki sağlayıcı önbelleğine almak için tek token'lık çağrı."""
+        t0 = time.perf_counter()
+        built = self.prompt.build(self.WARMUP_QUESTION)
+        response = self._complete(model=self.deployment_name, temperature=0.0,
+                                  max_tokens=1, messages=built.messages)
+        usage = record_usage(StageTimer(self.table_set), getattr(response, "usage", None))
+        return {"set_id": self.table_set,
+                "layout": built.report["layout"],
+                "prefix_tokens": built.report.get("prefix_tokens"),
+                "cached_tokens": usage.get("cached"),
+                "ms": round((time.perf_counter() - t0) * 1000, 1)}
 
     # ───────────── PARANTEZ / ; DÜZELTİCİ ─────────────
     @staticmethod
@@ -375,16 +464,70 @@ class LLModel:
         return sql.strip().rstrip(';') + ';'
 
     # ───────────── NL → SQL ─────────────
-    def nl_to_sql(self, question: str) -> str:
-        response = self.client.chat.completions.create(
-            model       = self.deployment_name,
-            temperature = 0.0,
-            max_tokens  = 256,
-            messages    = self._prompt_messages(question),
-        )
-        print(response)
-        raw = response.choices[0].message.content
+    # ─── Hız limiti (429) için yeniden deneme ───
+    LLM_MAX_RETRIES  = int(os.getenv("LLM_MAX_RETRIES", "4"))
+    LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+
+    def _complete(self, **kwargs):
+        """chat.completions.create + 429'da üstel geri çekilme (Retry-After'a uyar)."""
+        for attempt in range(self.LLM_MAX_RETRIES + 1):
+            try:
+                return self.client.chat.completions.create(**kwargs)
+            except Exception as e:
+                if getattr(e, "status_code", None) != 429 or attempt == self.LLM_MAX_RETRIES:
+                    raise
+                headers = getattr(getattr(e, "response", None), "headers", None) or {}
+                try:
+                    delay = float(headers.get("retry-after"))
+                except (TypeError, ValueError):
+                    delay = self.LLM_BACKOFF_BASE * (2 ** attempt)
+                time.sleep(delay * (1 + random.random() * 0.25))
+
+    def nl_to_sql(self, question: str, timer: Optional[StageTimer] = None,
+                  cancel: Optional[CancelToken] = None) -> str:
+        """``cancel`` verilirse tamamlama akışla alınır ve iptalde yarıda kesilir.
+
+        Yönlendirici açıksa (LLM_TIERS / LLM_HEDGE) katman + hedge onun
+        üzerinden yürür; dönen SQL doğrulamadan geçmiş olabilir (bkz.
+        llm_router_helper).
+        """
+        messages = self._build_prompt(question, timer).messages
+        if self.router is not None:
+            with stage(timer, "llm_request"):
+                return self.router.complete(messages, self._checked_sql,
+                                            timer=timer, cancel=cancel)
+        if cancel is not None:
+            with stage(timer, "llm_request"):
+                raw = "".join(self._stream_completion(messages, timer, cancel))
+            with stage(timer, "sql_extract"):
+                return self._extract_sql(raw)
+        with stage(timer, "llm_request"):
+            response = self._complete(
+                model       = self.deployment_name,
+                temperature = 0.0,
+                max_tokens  = 256,
+                messages    = messages,
+            )
+        usage = record_usage(timer, getattr(response, "usage", None))
+        log.debug("LLM yanıtı  set=%s  tokens=%s", self.table_set, usage)
+        with stage(timer, "sql_extract"):
+            return self._extract_sql(response.choices[0].message.content)
 
+    def _call_deployment(self, deployment: str, messages: List[dict],
+                         cancel: CancelToken, timer: Optional[StageTimer] = None) -> str:
+        """Yönlendiricinin tek denemesi: akışla tamamlama (iptal edilebilir)."""
+        return "".join(self._stream_completion(messages, timer, cancel, deployment=deployment))
+
+    def _checked_sql(self, raw: str):
+        """Ham yanıt → (sql, doğrulama hatası | None); SELECT yoksa ValueError."""
+        sql = self._extract_sql(raw)
+        try:
+            self.validator.validate(sql)
+        except SQLValidationError as e:
+            return sql, e
+        return sql, None
+
+    def _extract_sql(self, raw: str) -> str:
         # ```sql …``` bloğunu veya ilk SELECT'i yakala
         m = re.search(r"```sql\s*([\s\S]*?)```", raw, re.I)
         if not m:
@@ -395,69 +538,582 @@ class LLModel:
         sql = m.group(1) if m.lastindex else m.group(0)
         return self._post_fix(sql)
 
+    def nl_to_sql_stream(self, question: str, timer: Optional[StageTimer] = None,
+                         cancel: Optional[CancelToken] = None) -> Iterator[str]:
+        """Tamamlamayı parça parça döndürür (stream=True).
+
+        Token'lar canlı iletildiğinden burada hedge / katman yoktur.
+        """
+        yield from self._stream_completion(self._build_prompt(question, timer).messages,
+                                           timer, cancel)
+
+    def _stream_completion(self, messages: List[dict], timer: Optional[StageTimer] = None,
+                           cancel: Optional[CancelToken] = None, *,
+                           deployment: Optional[str] = None) -> Iterator[str]:
+        """stream=True tamamlama; iptalde HTTP akışı kapatılır.
+
+        İlk token'dan önceki bekleme (prompt işleme) kesilemez; iptal ilk
+        parçada fark edilir ve kalan üretim okunmadan bağlantı kapanır.
+        Token sayıları (``usage``) ``include_usage`` ile gelen son, seçeneksiz
+        parçadan okunur; akış yarıda kesilirse o istek için sayım olmaz.
+        """
+        stream = self._complete(
+            model          = deployment or self.deployment_name,
+            temperature    = 0.0,
+            max_tokens     = 256,
+            messages       = messages,
+            stream         = True,
+            stream_options = {"include_usage": True},
+        )
+        usage = None
+        try:
+            for chunk in stream:
+                if cancel is not None:
+                    cancel.raise_if_cancelled()
+                usage = getattr(chunk, "usage", None) or usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+            record_usage(timer, usage)
+
     # ───────────── GÜVENLİ SELECT ÇALIŞTIR ─────────────
-    SAFE_RE = re.compile(r"(?i)^\s*(select|with)\b")
-    BAD_RE  = re.compile(r"(?i)\b(insert|update|delete|alter|drop|create|merge|exec|into|truncate)\b")
-
-    def _is_safe(self, sql: str) -> bool:
-        sql_nc = re.sub(r"--.*?$|/\*.*?\*/", "", sql, flags=re.M|re.S).strip()
-        return (sql_nc.count(";") <= 1 and
-                self.SAFE_RE.match(sql_nc) and
-                not self.BAD_RE.search(sql_nc))
-
-    def _columns_exist(self, sql: str) -> bool:
-        inspector    = inspect(self.engine)
-        # yalnızca dbo şemasındaki tabloları geçerli kabul et
-        valid_tables = {t.lower() for t in inspector.get_table_names(schema='dbo')}
-
-        # schema prefix (örn. dbo.) varsa önce temizlemek istersen şu satırı aç:
-        # sql = re.sub(r'\b\w+\.', '', sql)
-
-        for tbl, col in re.findall(r'([A-Za-z_][\w]*)\.([A-Za-z_][\w]*)', sql):
-            # dbo ya da alias gibi geçersiz isimleri atla
-            if tbl.lower() not in valid_tables:
-                continue
-            # sadece geçerli tablo üzerinde kolon kontrolü yap
-            cols = {c['name'].lower()
-                    for c in inspector.get_columns(tbl, schema='dbo')}
-            if col.lower() not in cols:
-                return False
-        return True
-
-    def execute_safe(self, sql: str):
-        if not self._columns_exist(sql):
-            raise ValueError("Model olmayan kolon üretti, SQL yürütülmedi.")
-        if not self._is_safe(sql):
-            raise ValueError("Yalnız SELECT sorgularına izin var.")
-        with contextlib.closing(self.engine.raw_connection()) as conn:
-            cur   = conn.cursor()
-            cur.execute(sql)
+    def validate(self, sql: str, timer: Optional[StageTimer] = None):
+        """Salt-okunur + tablo/alias/kolon kontrolü (DB turu yok).
+
+        Geçmezse ``SQLValidationError`` (ValueError) – ``.issues`` yapılandırılmış.
+        """
+        with stage(timer, "sql_validation"):
+            self.validator.validate(sql)
+
+    # ─── Satır limiti: fetch sırasında uygulanır, mümkünse SQL'e de eklenir ───
+    MAX_ROWS    = int(os.getenv("MAX_RESULT_ROWS", "1000"))
+    FETCH_BATCH = int(os.getenv("FETCH_BATCH_ROWS", "500"))
+
+    def _iter_chunks(self, sql: str, *, offset: int = 0, limit: int,
+                     timer: Optional[StageTimer] = None,
+                     cancel: Optional[CancelToken] = None):
+        """Cursor'dan en fazla ``limit + 1`` satırı parça parça okur.
+
+        Her adımda ``(kolonlar, satır tuple listesi)`` verir; sonuç boşsa
+        kolon adları için bir kez ``(kolonlar, [])``.  Bağlantı, tüketici
+        durduğunda (generator kapanınca) da serbest bırakılır.
+
+        Sorgu set zaman aşımıyla çalışır; ``cost_guard`` varsa önce plan
+        tahmini kontrol edilir; ``cancel`` iptal edilirse cursor kesilir.
+        """
+        dialect = self.engine.dialect.name
+        # limit+1 satır iste → fazlası gelirse sonuç kesilmiş demektir
+        run_sql, server_offset = limit_sql(sql, dialect, offset, limit + 1)
+
+        t0 = time.perf_counter()
+        try:
+            with checkout(self.engine, timeout=self.statement_timeout) as conn:
+                if timer is not None:
+                    timer.add("db_checkout", time.perf_counter() - t0, t0)
+                if self.cost_guard is not None:
+                    with stage(timer, "cost_check"):
+                        est = self.cost_guard.check(self.engine, conn, run_sql,
+                                                    self.validator.source_tables(sql))
+                    if est is not None and timer is not None:
+                        timer.usage["est_rows"] = int(est["rows"])
+                cur = conn.cursor()
+                bound = (cancel.bind(lambda: interrupt(conn, cur)) if cancel is not None
+                         else contextlib.nullcontext())
+                try:
+                    with bound:
+                        yield from self._fetch_chunks(cur, run_sql, offset, server_offset,
+                                                      limit, timer)
+                except Exception as e:
+                    if cancel is not None and cancel.cancelled and not isinstance(e, Cancelled):
+                        raise Cancelled(f"İstek iptal edildi ({cancel.reason})") from e
+                    raise
+                finally:
+                    cur.close()
+        except (QueryTooExpensive, StatementTimeout, Cancelled) as e:
+            QUERY_GUARD.inc(set_id=self.table_set, outcome=self._error_code(e))
+            raise
+
+    def _iter_replica(self, sql: str, *, offset: int = 0, limit: int,
+                      timer: Optional[StageTimer] = None,
+                      cancel: Optional[CancelToken] = None):
+        """``_iter_chunks``'ın yerel kopya (DuckDB) karşılığı; ``sql`` çevrilmiş olmalı."""
+        run_sql, server_offset = limit_sql(sql, "duckdb", offset, limit + 1)
+        try:
+            with self.replica.cursor(self.statement_timeout) as cur:
+                bound = (cancel.bind(cur.interrupt) if cancel is not None
+                         else contextlib.nullcontext())
+                try:
+                    with bound:
+                        yield from self._fetch_chunks(cur, run_sql, offset, server_offset,
+                                                      limit, timer)
+                except Exception as e:
+                    if cancel is not None and cancel.cancelled and not isinstance(e, Cancelled):
+                        raise Cancelled(f"İstek iptal edildi ({cancel.reason})") from e
+                    raise
+        except (StatementTimeout, Cancelled) as e:
+            QUERY_GUARD.inc(set_id=self.table_set, outcome=self._error_code(e))
+            raise
+
+    @staticmethod
+    def _first_chunk(chunks, what: str):
+        """Yönlendirilen sorgunun ilk parçası → (True, parça); hata → (False, None)."""
+        try:
+            return True, next(chunks, None)
+        except (QueryTooExpensive, StatementTimeout, Cancelled):
+            raise
+        except Exception as e:
+            log.warning("%s okunamadı, özgün SQL kaynakta çalışıyor: %s", what, e)
+            return False, None
+
+    def _iter_routed(self, sql: str, info: Dict, **kwargs):
+        """``_iter_chunks`` + kalıcı görünüm / yerel kopya yönlendirmesi.
+
+        SQL kayıtlı bir görünümle eşleşirse görünüm tablosu, değilse ve set
+        kopyalanıyorsa analitik sorgu DuckDB kopyası okunur; bu okuma ilk
+        parçadan önce hata verirse özgün SQL kaynakta çalışır.  Kullanılan yol
+        ``info["materialized"]`` (görünüm adı) / ``info["replica"]``'ya yazılır.
+        """
+        target, mv = self.matviews.route(self.table_set, sql)
+        info["materialized"], info["replica"] = None, False
+        chunks, ok, first = None, False, None
+        if mv is not None:
+            chunks = self._iter_chunks(target, **kwargs)
+            ok, first = self._first_chunk(chunks, f"Kalıcı görünüm {mv}")
+            if ok:
+                info["materialized"] = mv
+        elif self.replica is not None:
+            duck = self.replica.route(sql, self.validator.referenced_tables(sql))
+            if duck is not None:
+                chunks = self._iter_replica(duck, **kwargs)
+                ok, first = self._first_chunk(chunks, "Yerel kopya")
+                outcome = "routed" if ok else "fallback"
+                if ok:
+                    self.replica.routed += 1
+                    info["replica"] = True
+                else:
+                    self.replica.fallbacks += 1
+                REPLICA_QUERIES.inc(set_id=self.table_set, outcome=outcome)
+        if ok:
+            if first is not None:
+                yield first
+            yield from chunks
+            return
+        yield from self._iter_chunks(sql, **kwargs)
+
+    def _fetch_chunks(self, cur, run_sql: str, offset: int, server_offset: bool,
+                      limit: int, timer: Optional[StageTimer] = None):
+        fetch_s = 0.0                   # parçalar arası tüketici süresi sayılmaz
+        try:
+            with stage(timer, "db_execute"):
+                cur.execute(run_sql)
             cols  = [d[0] for d in cur.description]
-            rows  = [dict(zip(cols, r)) for r in cur.fetchall()]
-            return rows
+
+            skip = 0 if server_offset else offset
+            while skip > 0:
+                t1 = time.perf_counter()
+                chunk = cur.fetchmany(min(self.FETCH_BATCH, skip))
+                fetch_s += time.perf_counter() - t1
+                if not chunk:
+                    break
+                skip -= len(chunk)
+
+            left = limit + 1
+            while left > 0:
+                t1 = time.perf_counter()
+                chunk = cur.fetchmany(min(self.FETCH_BATCH, left))
+                fetch_s += time.perf_counter() - t1
+                if not chunk:
+                    break
+                left -= len(chunk)
+                yield cols, chunk
+            if left == limit + 1:
+                yield cols, []          # boş sonuçta da kolon adları gitsin
+        finally:
+            if timer is not None and fetch_s:
+                timer.add("db_fetch", fetch_s)
+
+    def _count(self, sql: str):
+        count_q = count_sql(sql, self.engine.dialect.name)
+        if not count_q:
+            return None
+        try:
+            with checkout(self.engine, timeout=self.statement_timeout) as conn:
+                cur = conn.cursor()
+                cur.execute(count_q)
+                return cur.fetchone()[0]
+        except Exception:
+            return None             # sayım isteğe bağlı; sonucu bozmasın
+
+    def _watermark(self, table: str):
+        """Tablonun su seviyesi (ör. MAX(date_time)); kolon yoksa None.
+
+        Kontrol, kurtaracağı sorgudan uzun sürmesin: RESULT_CACHE_WATERMARK_TIMEOUT
+        ile set ifade zaman aşımının kısası uygulanır; aşılırsa StatementTimeout
+        (önbellek bunu "bilinmiyor" → ıska sayar).
+        """
+        col = self.catalog.columns(table)
+        wm  = self.result_cache.watermark_column.lower()
+        real = next((c for c in col if c.lower() == wm), None)
+        if real is None:
+            return None
+        q = self.engine.dialect.identifier_preparer.quote
+        name = next((t for t in self.catalog.tables() if t.lower() == table), table)
+        if self.catalog.schema:
+            name = f"{q(self.catalog.schema)}.{q(name)}"
+        else:
+            name = q(name)
+        limits = [t for t in (self.result_cache.watermark_timeout, self.statement_timeout) if t]
+        with checkout(self.engine, timeout=min(limits) if limits else None) as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute(f"SELECT MAX({q(real)}) FROM {name}")
+                return cur.fetchone()[0]
+            finally:
+                cur.close()
+
+    def _run(self, sql: str, *, offset: int = 0, max_rows: int | None = None,
+             with_total: bool = False, timer: Optional[StageTimer] = None,
+             cache: bool = False, fmt: str = "rows",
+             cancel: Optional[CancelToken] = None) -> Dict:
+        """``cache=True`` ise sonuç, kanonik SQL + sayfa anahtarıyla
+        ``result_cache``'ten okunur / yazılır (``result_cached`` alanı).
+
+        ``fmt="rows"`` → ``rows`` satır dict'leri; ``columnar`` / ``arrow`` →
+        ``columns`` + ``data`` (kolon başına değer listesi, dict üretilmez).
+        """
+        if fmt not in FORMATS:
+            raise ValueError(f"Geçersiz biçim: {fmt} (rows | columnar | arrow)")
+        limit = min(max_rows or self.MAX_ROWS, self.MAX_ROWS)
+        rc = self.result_cache if cache else None
+        if rc is not None:
+            with stage(timer, "result_cache"):
+                key = rc.key(self.table_set, self.engine.dialect.name,
+                             canonical_sql(sql), offset, limit, with_total)
+                tables = self.validator.referenced_tables(sql)
+                hit = rc.get(key, tables, self._watermark)
+            if hit is not None:
+                data, meta = hit
+                with stage(timer, "row_serialize"):
+                    out = ({"rows": data.rows()} if fmt == "rows" else
+                           {"columns": data.columns, "data": data.column_lists()})
+                return {**out, **meta, "result_cached": True}
+
+        cols, raw, info = [], [], {}
+        for cols, chunk in self._iter_routed(sql, info, offset=offset, limit=limit,
+                                             timer=timer, cancel=cancel):
+            raw.extend(chunk)
+
+        truncated = len(raw) > limit
+        del raw[limit:]
+        with stage(timer, "row_serialize"):
+            out = ({"rows": [dict(zip(cols, r)) for r in raw]} if fmt == "rows" else
+                   {"columns": cols, "data": to_columns(cols, raw)})
+        total = None
+        if with_total:
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            with stage(timer, "db_count"):
+                total = self._count(sql)
+        meta = {"truncated": truncated,
+                "total_rows": total,
+                "next_offset": offset + limit if truncated else None,
+                "limit": limit,
+                "materialized": info["materialized"],
+                "replica": info["replica"]}
+        if rc is not None:
+            if info["materialized"]:
+                # görünüm yenilenince (invalidate) bu kayıt da düşsün
+                tables = tables | {info["materialized"].lower()}
+            with stage(timer, "result_cache"):
+                rc.put(key, to_columnar(cols, raw), meta, tables, self._watermark)
+        return {**out, **meta, "result_cached": False}
+
+    def execute_safe(self, sql: str, *, max_rows: int | None = None):
+        self.validate(sql)
+        return self._run(sql, max_rows=max_rows)["rows"]
+
+    # ───────────── Otomatik onarım ─────────────
+    REPAIR_MAX_ATTEMPTS = int(os.getenv("REPAIR_MAX_ATTEMPTS", "2"))     # 0 → kapalı
+    REPAIR_BUDGET_MS    = float(os.getenv("REPAIR_BUDGET_MS", "15000"))  # istek başına toplam
+    # zaman aşımı / iptal / havuz hataları SQL'in suçu değil → onarılmaz
+    _NO_REPAIR_RE = re.compile(r"(?i)interrupted|time ?out|timed out|HYT00|cancel|QueuePool")
+
+    def _can_repair(self, e: Exception, attempts: int, enabled: bool, t0: float) -> bool:
+        return (enabled and attempts < self.REPAIR_MAX_ATTEMPTS
+                and not isinstance(e, (Cancelled, StatementTimeout))
+                and (time.perf_counter() - t0) * 1000 < self.REPAIR_BUDGET_MS
+                and not self._NO_REPAIR_RE.search(str(e)))
+
+    @staticmethod
+    def _repair_note(e: Exception) -> str:
+        lines = [f"Hata: {str(e)[:500]}"]
+        for i in getattr(e, "issues", ()):
+            hint = f" → öneri: {i.suggestion}" if i.suggestion else ""
+            lines.append(f"- {i.code}: {i.message}{hint}")
+        return "\n".join(lines)
+
+    def _repair(self, question: str, sql: str, e: Exception, t0: float,
+                timer: Optional[StageTimer] = None) -> str:
+        """Hatalı SQL + hata ayrıntısını modele geri verip düzeltilmiş SQL ister.
+
+        Aynı prompt öneki kullanılır → sağlayıcı önbelleği onarımda da geçerli.
+        """
+        remaining = max(1.0, (self.REPAIR_BUDGET_MS - (time.perf_counter() - t0) * 1000) / 1000)
+        messages = self.prompt.build(question).messages + [
+            {"role": "assistant", "content": f"```sql\n{sql}\n```"},
+            {"role": "user", "content":
+                "Bu SQL çalıştırılamadı.\n" + self._repair_note(e) +
+                "\n\nDDL'e sadık kalarak düzeltilmiş tek bir MSSQL SELECT sorgusu yaz."},
+        ]
+        with stage(timer, "repair"):
+            response = self._complete(model=self.repair_deployment, temperature=0.0,
+                                      max_tokens=256, messages=messages, timeout=remaining)
+            record_usage(timer, getattr(response, "usage", None))
+            return self._extract_sql(response.choices[0].message.content)
+
+    def _repair_done(self, attempts: int, t_fail: Optional[float], ok: bool):
+        if not attempts:
+            return
+        REPAIRS.inc(set_id=self.table_set, outcome="success" if ok else "failed")
+        REPAIR_SECONDS.observe(time.perf_counter() - t_fail, set_id=self.table_set)
 
     # ───────────── Kamu API'si ─────────────
-    def answer(self, question: str, *, debug=False) -> Dict:
+    def _cached_sql(self, question: str, use_cache: bool,
+                    timer: Optional[StageTimer] = None):
+        """Önce birebir, sonra anlamsal önbellek.  → (anahtar, sql|None, benzerlik)"""
+        key = self.sql_cache.key(self.table_set, self.deployment_name,
+                                 PROMPT_VERSION, question)
+        if not use_cache:
+            return key, None, None
+        with stage(timer, "cache_lookup"):
+            sql = self.sql_cache.get(key)
+        if sql is not None:
+            return key, sql, None
+
+        if self.semantic_cache is not None:
+            with stage(timer, "semantic_lookup"):
+                hit = self.semantic_cache.lookup(self.table_set, question)
+            if hit is not None:
+                try:
+                    self.validate(hit.sql)
+                    return key, hit.sql, round(hit.score, 3)
+                except ValueError:
+                    pass            # uyarlanan SQL geçersiz → LLM'e sor
+        return key, None, None
+
+    def _remember_sql(self, key: str, question: str, sql: str, gen_ms: float):
+        # yalnız doğrulamadan geçen SQL önbelleğe girer
+        self.sql_cache.put(key, sql)
+        if self.semantic_cache is not None:
+            self.semantic_cache.add(self.table_set, question, sql, gen_ms)
+
+    def answer(self, question: str, *, debug=False, use_cache: bool = True,
+               max_rows: int | None = None, include_total: bool = False,
+               repair: bool = True, fmt: str = "rows",
+               cancel: Optional[CancelToken] = None) -> Dict:
+        """``stages`` aşama başına ms, ``usage`` LLM token sayıları, ``spans``
+        zaman çizelgesi (istek bazlı iz) içerir.  ``exec_ms`` yalnız DB
+        tarafıdır; doğrulama ``stages`` altında ayrıca görünür.
+
+        Doğrulama ya da DB hatasında (``repair=True`` ise) SQL en fazla
+        REPAIR_MAX_ATTEMPTS kez, REPAIR_BUDGET_MS içinde modele düzelttirilir.
+        ``fmt`` sonuç biçimidir (bkz. ``_run``).  ``cancel`` iptal edilirse
+        (istemci ayrıldı) LLM akışı ve DB sorgusu kesilir, onarım yapılmaz.
+        """
         t0  = time.perf_counter()
+        timer = StageTimer(self.table_set)
+        attempts, errors, t_fail = 0, [], None
         try:
-            sql = self._post_fix(self.nl_to_sql(question))
+            key, sql, similarity = self._cached_sql(question, use_cache, timer)
+            cached = sql is not None
+            if not cached:
+                if cancel is not None:
+                    cancel.raise_if_cancelled()
+                sql = self._post_fix(self.nl_to_sql(question, timer, cancel))
             gen_ms = (time.perf_counter() - t0) * 1000
-            rows = self.execute_safe(sql)
-            exec_ms = (time.perf_counter() - t0 - gen_ms/1000) * 1000
+
+            while True:
+                try:
+                    self.validate(sql, timer)
+                    t1 = time.perf_counter()
+                    page = self._run(sql, max_rows=max_rows, with_total=include_total,
+                                     timer=timer, cache=use_cache, fmt=fmt, cancel=cancel)
+                    break
+                except Exception as e:
+                    if not self._can_repair(e, attempts, repair, t0):
+                        raise
+                    if cancel is not None:
+                        cancel.raise_if_cancelled()
+                    t_fail = t_fail or time.perf_counter()
+                    attempts += 1
+                    errors.append(str(e))
+                    sql = self._post_fix(self._repair(question, sql, e, t0, timer))
+            self._repair_done(attempts, t_fail, True)
+            # yalnız doğrulanıp çalışan SQL önbelleğe girer (onarılmışsa eskisinin yerine)
+            if not cached or attempts:
+                self._remember_sql(key, question, sql, gen_ms)
+            exec_ms = (time.perf_counter() - t1) * 1000
 
             if debug:
                 print("SQL →", sql)
-                print("Rows→", rows[:5] if rows else "(yok)")
+                print("Rows→", page.get("rows", page.get("data"))[:5] or "(yok)")
 
             return {"status": "success",
                     "sql": sql,
-                    "rows": rows,
+                    **page,
+                    "cached": cached,
+                    "similarity": similarity,
                     "gen_ms": round(gen_ms,1),
-                    "exec_ms": round(exec_ms,1)}
+                    "exec_ms": round(exec_ms,1),
+                    "repairs": attempts,
+                    "repair_errors": errors,
+                    "stages": timer.stages,
+                    "usage": timer.usage,
+                    "spans": timer.spans}
+
+        # ⇣—— HER TÜRLÜ HATA BURADA YAKALANIR ————————————
+        except Exception as e:
+            self._repair_done(attempts, t_fail, False)
+            return {"status": "error", "error": str(e), **self._error_detail(e),
+                    "repairs": attempts, "repair_errors": errors,
+                    "stages": timer.stages, "usage": timer.usage, "spans": timer.spans}
+
+    @staticmethod
+    def _error_code(e: Exception) -> Optional[str]:
+        if isinstance(e, QueryTooExpensive):
+            return "too_expensive"
+        if isinstance(e, StatementTimeout):
+            return "timeout"
+        if isinstance(e, Cancelled):
+            return "cancelled"
+        return None
+
+    @classmethod
+    def _error_detail(cls, e: Exception) -> Dict:
+        if isinstance(e, (SQLValidationError, QueryTooExpensive)):
+            return {"error_detail": e.as_dict()}
+        code = cls._error_code(e)
+        return {"error_detail": {"code": code}} if code else {}
 
-        # ⇣—— HER TÜRLÜ HATA BURADA YAKALANIR ————————————
+    def stream_answer(self, question: str, *, use_cache: bool = True,
+                      max_rows: int | None = None, repair: bool = True,
+                      fmt: str = "rows",
+                      cancel: Optional[CancelToken] = None) -> Iterator[Dict]:
+        """``answer``'ın olay akışı hâli.
+
+        Sırasıyla: ``token``* → ``sql`` → ``repair``* → ``validated`` → ``rows``*
+        → ``done`` (herhangi bir adımda ``error`` ile biter).  Onarım yalnız ilk
+        satır gönderilmeden önceki hatalar (doğrulama / yürütme) için yapılır.
+        ``fmt="columnar"`` ise ``rows`` olayları ``rows`` yerine ``data``
+        (kolon başına değerler) taşır; akışta arrow yoktur.  ``cancel``
+        iptal edilince (istemci ayrıldı) LLM akışı ve cursor kesilir.
+        """
+        if fmt not in ("rows", "columnar"):
+            yield {"event": "error", "error": f"Akışta desteklenmeyen biçim: {fmt} (rows | columnar)"}
+            return
+        t0 = time.perf_counter()
+        timer = StageTimer(self.table_set)
+        attempts, t_fail = 0, None
+        try:
+            key, sql, similarity = self._cached_sql(question, use_cache, timer)
+            cached = sql is not None
+            if not cached:
+                parts, ttft_ms = [], None
+                t_llm = time.perf_counter()
+                for delta in self.nl_to_sql_stream(question, timer, cancel):
+                    if ttft_ms is None:
+                        ttft_ms = round((time.perf_counter() - t0) * 1000, 1)
+                    parts.append(delta)
+                    yield {"event": "token", "text": delta}
+                # akışta istemci tüketim süresi de dahildir
+                timer.add("llm_request", time.perf_counter() - t_llm, t_llm)
+                with timer.stage("sql_extract"):
+                    sql = self._extract_sql("".join(parts))
+            gen_ms = (time.perf_counter() - t0) * 1000
+            yield {"event": "sql", "sql": sql, "cached": cached,
+                   "similarity": similarity, "gen_ms": round(gen_ms, 1),
+                   **({} if cached else {"ttft_ms": ttft_ms})}
+
+            limit, info = min(max_rows or self.MAX_ROWS, self.MAX_ROWS), {}
+            while True:
+                try:
+                    self.validate(sql, timer)
+                    t1 = time.perf_counter()
+                    chunks = self._iter_routed(sql, info, limit=limit, timer=timer,
+                                               cancel=cancel)
+                    first = next(chunks, None)      # yürütme hatası burada gelir
+                    break
+                except Exception as e:
+                    if not self._can_repair(e, attempts, repair, t0):
+                        raise
+                    if cancel is not None:
+                        cancel.raise_if_cancelled()
+                    t_fail = t_fail or time.perf_counter()
+                    attempts += 1
+                    sql = self._post_fix(self._repair(question, sql, e, t0, timer))
+                    yield {"event": "repair", "attempt": attempts, "error": str(e),
+                           **self._error_detail(e), "sql": sql}
+            self._repair_done(attempts, t_fail, True)
+            if not cached or attempts:
+                self._remember_sql(key, question, sql, gen_ms)
+            yield {"event": "validated"}
+
+            sent, first_row_ms, truncated = 0, None, False
+            for cols, chunk in itertools.chain([first] if first else [], chunks):
+                if sent + len(chunk) > limit:
+                    chunk, truncated = chunk[:limit - sent], True
+                if not chunk:
+                    break
+                with timer.stage("row_serialize"):
+                    ev = {"event": "rows", "columns": cols}
+                    if fmt == "rows":
+                        ev["rows"] = [dict(zip(cols, r)) for r in chunk]
+                    else:
+                        ev["data"] = to_columns(cols, chunk)
+                if first_row_ms is None:
+                    first_row_ms = round((time.perf_counter() - t1) * 1000, 1)
+                    ev["first_row_ms"] = first_row_ms
+                sent += len(chunk)
+                yield ev
+
+            yield {"event": "done",
+                   "sql": sql,
+                   "row_count": sent,
+                   "truncated": truncated,
+                   "gen_ms": round(gen_ms, 1),
+                   "exec_ms": round((time.perf_counter() - t1) * 1000, 1),
+                   "first_row_ms": first_row_ms,
+                   "materialized": info.get("materialized"),
+                   "replica": info.get("replica", False),
+                   "repairs": attempts,
+                   "stages": timer.stages}
+
+        except Exception as e:
+            self._repair_done(attempts, t_fail, False)
+            yield {"event": "error", "error": str(e), **self._error_detail(e),
+                   "repairs": attempts, "stages": timer.stages}
+
+    def page(self, sql: str, *, offset: int, max_rows: int | None = None,
+             include_total: bool = False, fmt: str = "rows",
+             cancel: Optional[CancelToken] = None) -> Dict:
+        """Daha önce üretilmiş SQL'in sonraki sayfası (LLM çağrısı yok)."""
+        timer = StageTimer(self.table_set)
+        try:
+            self.validate(sql, timer)
+            t0 = time.perf_counter()
+            page = self._run(sql, offset=offset, max_rows=max_rows,
+                             with_total=include_total, timer=timer, cache=True, fmt=fmt,
+                             cancel=cancel)
+            return {"status": "success", "sql": sql, "cached": True,
+                    "similarity": None, **page, "gen_ms": 0.0,
+                    "exec_ms": round((time.perf_counter() - t0) * 1000, 1),
+                    "stages": timer.stages, "usage": timer.usage, "spans": timer.spans}
         except Exception as e:
-            return {"status": "error", "error": str(e)}
+            return {"status": "error", "error": str(e), **self._error_detail(e),
+                    "stages": timer.stages, "usage": timer.usage, "spans": timer.spans}
 
 
 # ─── Hızlı test ───────────────────────────────────────────────────────
@@ -0,0 +1,246 @@
+"""
+bench_helper.py – Azure'suz ölçüm için sahte LLM + tohumlu SQLite fikstürü
+
+``FakeLLMClient`` AzureOpenAI istemcisinin kullandığımız yüzeyini
+(``chat.completions.create``, ``stream=True`` dahil) taklit eder; sabit
++ rastgele gecikme ekler ve soruya göre deterministik olarak hazır SQL
+döndürür.  ``build_fixture`` DDL_BLOCKS 1–3'ü SQLite'a çevirip istenen
+ölçekte tohumlu (seed) veriyle doldurur.
+"""
+
+import os, re, time, random, sqlite3, hashlib, threading
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+
+from .api_helper import DDL_BLOCKS
+
+__all__ = ["FakeLLMClient", "CANNED_SQL", "BENCH_QUESTIONS", "build_fixture",
+           "sqlite_ddl", "parse_scale", "percentiles"]
+
+# ───────────────────── Hazır SQL / sorular ─────────────────────
+CANNED_SQL: Dict[int, List[str]] = {
+    1: [
+        "SELECT M.Id, M.Definition FROM Machine M;",
+        "SELECT L.Definition AS LineName, COUNT(M.Id) AS MachineCount "
+        "FROM Line L JOIN Station S ON S.LineId = L.Id JOIN Unit U ON U.StationId = S.Id "
+        "JOIN Machine M ON M.UnitId = U.Id GROUP BY L.Definition;",
+        "SELECT PT.TagName, PT.Value FROM PlcTag PT WHERE PT.IsAlarm = 1 "
+        "AND PT.CreatedDate >= '2025-06-01' AND PT.CreatedDate < '2025-07-01';",
+        "SELECT F.Definition, P.Definition FROM Factory F JOIN Area A ON A.FactoryId = F.Id "
+        "JOIN Line L ON L.AreaId = A.Id JOIN Station S ON S.LineId = L.Id "
+        "JOIN Unit U ON U.StationId = S.Id JOIN Machine M ON M.UnitId = U.Id "
+        "JOIN Plc P ON P.MachineId = M.Id WHERE F.Id = 1;",
+    ],
+    2: [
+        "SELECT H.Malzeme_kodu, SUM(H.Kalan_miktar) AS Kalan FROM Pursu_hammadde_verimleri H "
+        "GROUP BY H.Malzeme_kodu;",
+        "SELECT H.Malzeme_adi, H.Kalan_miktar, H.date_time FROM Pursu_hammadde_verimleri H "
+        "WHERE H.date_time >= '2025-06-01' AND H.date_time < '2025-06-02';",
+        "SELECT H.Malzeme_kodu, AVG(H.Gunluk_kullanim) AS Ort FROM Pursu_hammadde_verimleri H "
+        "WHERE H.Malzeme_kodu = 'MK-0003' GROUP BY H.Malzeme_kodu;",
+    ],
+    3: [
+        "SELECT HV.hat_name, AVG(HV.operasyonel_verimlilik) AS Verim FROM Pursu_hat_verileri HV "
+        "GROUP BY HV.hat_name;",
+        "SELECT HV.hat_name, SUM(HV.uretim_zamani_dk) AS Dk FROM Pursu_hat_verileri HV "
+        "WHERE HV.date_time >= '2025-06-01' AND HV.date_time < '2025-07-01' GROUP BY HV.hat_name;",
+        "SELECT HV.hat_name, HV.teknik_durus_kayip_orani, HV.date_time FROM Pursu_hat_verileri HV "
+        "WHERE HV.hat_name = 'Hat 2' ORDER BY HV.date_time DESC;",
+    ],
+}
+
+BENCH_QUESTIONS: Dict[int, List[str]] = {
+    1: ["Makineleri listele", "Hat başına makine sayısı", "Haziran alarmları",
+        "Fabrika 1'in PLC'leri"],
+    2: ["Malzeme bazında kalan miktar", "1 Haziran hammadde verileri",
+        "MK-0003 ortalama günlük kullanım"],
+    3: ["Hat bazında ortalama verim", "Haziran üretim dakikaları",
+        "Hat 2 teknik duruş oranları"],
+}
+
+
+# ───────────────────── Sahte LLM ─────────────────────
+class FakeLLMClient:
+    """AzureOpenAI yerine geçen, gecikmesi ayarlanabilir yerel stub."""
+
+    def __init__(self, table_set: int, *,
+                 latency_ms: float = 800.0,
+                 jitter_ms: float = 0.0,
+                 seed: int = 0,
+                 sqls: Optional[List[str]] = None):
+        self.sqls = sqls or CANNED_SQL[table_set]
+        self.latency_ms, self.jitter_ms = latency_ms, jitter_ms
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self._prefixes = set()
+        self.chat = SimpleNamespace(completions=self)
+
+    def _pick(self, messages) -> str:
+        # son kullanıcı mesajının hash'i → hep aynı SQL
+        text = messages[-1]["content"] if messages else ""
+        h = int(hashlib.md5(text.encode("utf-8")).hexdigest(), 16)
+        return self.sqls[h % len(self.sqls)]
+
+    def _sleep(self):
+        with self._lock:
+            self.calls += 1
+            extra = self._rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0
+        time.sleep((self.latency_ms + extra) / 1000)
+
+    def _cached(self, messages) -> int:
+        # sağlayıcı önbelleği taklidi: son mesaj hariç önek ≥1024 token ve
+        # daha önce görülmüşse 128'lik bloklar hâlinde "cached" sayılır
+        prefix = "".join(m["content"] for m in messages[:-1])
+        tokens = len(prefix) // 4
+        with self._lock:
+            seen = prefix in self._prefixes
+            self._prefixes.add(prefix)
+        return tokens // 128 * 128 if seen and tokens >= 1024 else 0
+
+    def create(self, *, model=None, messages=None, stream=False, stream_options=None, **_):
+        self._sleep()
+        content = f"```sql\n{self._pick(messages)}\n```"
+        prompt_tokens = sum(len(m["content"]) for m in messages or []) // 4
+        usage = SimpleNamespace(prompt_tokens=prompt_tokens,
+                                completion_tokens=len(content) // 4,
+                                total_tokens=prompt_tokens + len(content) // 4,
+                                prompt_tokens_details=SimpleNamespace(
+                                    cached_tokens=self._cached(messages or [])))
+        if stream:
+            chunks = [SimpleNamespace(choices=[SimpleNamespace(
+                          delta=SimpleNamespace(content=content[i:i + 16]))], usage=None)
+                      for i in range(0, len(content), 16)]
+            if (stream_options or {}).get("include_usage"):
+                # OpenAI gibi: usage yalnız son, choices'ı boş parçada gelir
+                chunks.append(SimpleNamespace(choices=[], usage=usage))
+            return iter(chunks)
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=usage)
+
+
+# ───────────────────── SQLite fikstürü ─────────────────────
+def sqlite_ddl(ddl: str) -> str:
+    """MSSQL DDL bloğunu SQLite'ın kabul edeceği hale getirir."""
+    ddl = re.sub(r"\[dbo\]\.", "", ddl)
+    ddl = re.sub(r"\[([^\]]+)\]", r'"\1"', ddl)
+    ddl = re.sub(r"IDENTITY\(\d+,\s*\d+\)", "", ddl, flags=re.I)
+    ddl = re.sub(r"GETDATE\(\)", "CURRENT_TIMESTAMP", ddl, flags=re.I)
+    ddl = re.sub(r",\s*\)\s*;", "\n);", ddl)          # sondaki fazla virgül
+    return ddl
+
+
+def parse_scale(text: str) -> int:
+    """'10k', '1m', '10M', '25000' → satır sayısı"""
+    m = re.fullmatch(r"(?i)\s*(\d+(?:\.\d+)?)\s*([km]?)\s*", str(text))
+    if not m:
+        raise ValueError(f"Geçersiz ölçek: {text}")
+    mult = {"": 1, "k": 1_000, "m": 1_000_000}[m.group(2).lower()]
+    return int(float(m.group(1)) * mult)
+
+
+def _insert(conn, table: str, cols: List[str], rows_iter, batch: int = 50_000):
+    q = f'INSERT INTO "{table}" ({", ".join(cols)}) VALUES ({", ".join("?" * len(cols))})'
+    buf = []
+    for r in rows_iter:
+        buf.append(r)
+        if len(buf) >= batch:
+            conn.executemany(q, buf)
+            buf.clear()
+    if buf:
+        conn.executemany(q, buf)
+
+
+def build_fixture(path: str, scale: int, *, seed: int = 42, force: bool = False) -> str:
+    """Üç tablo setini ``scale`` satırlık büyük tablolarla oluşturur.
+
+    Zaman serisi tabloları (set 2/3) ve PlcTag ``scale`` satır alır;
+    hiyerarşi tabloları bunlarla orantılı küçük boyuttadır.  Dosya zaten
+    varsa (ve ``force`` değilse) yeniden üretilmez.
+    """
+    if os.path.exists(path) and not force:
+        return path
+    if os.path.exists(path):
+        os.remove(path)
+
+    rng = random.Random(seed)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=OFF")
+    conn.execute("PRAGMA synchronous=OFF")
+    for ddl in DDL_BLOCKS.values():
+        conn.executescript(sqlite_ddl(ddl))
+
+    # ─── Set 1: hiyerarşi ───
+    n_fac = 3
+    n_area, n_line = n_fac * 4, n_fac * 12
+    n_station, n_unit = n_line * 5, n_line * 15
+    n_machine = max(n_unit * 2, scale // 1000)
+    n_plc = n_machine
+    stamp = "2025-01-01 00:00:00"
+
+    def hier(n, parent_n):
+        return ((i, f"D{i}", rng.randint(1, parent_n), stamp, None) for i in range(1, n + 1))
+
+    _insert(conn, "Factory", ["Id", "Definition", "CreateDate", "UpdateDate"],
+            ((i, f"Fabrika {i}", stamp, None) for i in range(1, n_fac + 1)))
+    _insert(conn, "Area", ["Id", "Definition", "FactoryId", "CreateDate", "UpdateDate"],
+            hier(n_area, n_fac))
+    _insert(conn, "Line", ["Id", "Definition", "AreaId", "CreateDate", "UpdateDate"],
+            hier(n_line, n_area))
+    _insert(conn, "Station", ["Id", "Definition", "LineId", "CreateDate", "UpdateDate"],
+            hier(n_station, n_line))
+    _insert(conn, "Unit", ["Id", "Definition", "StationId", "CreateDate", "UpdateDate"],
+            hier(n_unit, n_station))
+    _insert(conn, "Machine", ["Id", "Definition", "UnitId", "SapCode", "CreateDate"],
+            ((i, f"Makine {i}", rng.randint(1, n_unit), rng.randint(1000, 9999), stamp)
+             for i in range(1, n_machine + 1)))
+    _insert(conn, "Plc", ["Id", "Definition", "MachineId", "IpAddress", "CreateDate", "Status"],
+            ((i, f"PLC {i}", i, f"10.0.{i // 250 % 250}.{i % 250}", stamp, 1)
+             for i in range(1, n_plc + 1)))
+
+    def day(i):
+        return f"2025-{1 + i % 12:02d}-{1 + i % 28:02d} {i % 24:02d}:{i % 60:02d}:00"
+
+    _insert(conn, "PlcTag",
+            ["Id", "FactoryId", "PlcId", "Title", "TagName", "Value", "IsAlarm", "CreatedDate"],
+            ((i, rng.randint(1, n_fac), rng.randint(1, n_plc), f"Tag {i}", f"T{i}",
+              f"{rng.uniform(0, 100):.2f}", int(rng.random() < 0.05), day(i))
+             for i in range(1, scale + 1)))
+
+    # ─── Set 2: hammadde zaman serisi ───
+    _insert(conn, "Pursu_hammadde_verimleri",
+            ["Id", "Seri_No", "Malzeme_kodu", "Malzeme_adi", "Kullanilan_miktar", "Fire",
+             "Kalan_miktar", "Gunluk_kullanim", "date_time"],
+            ((i, i, f"MK-{i % 50:04d}", f"Malzeme {i % 50}", rng.randint(0, 500),
+              rng.randint(0, 20), rng.randint(0, 10_000), round(rng.uniform(0, 300), 3), day(i))
+             for i in range(1, scale + 1)))
+
+    # ─── Set 3: hat zaman serisi ───
+    _insert(conn, "Pursu_hat_verileri",
+            ["Id", "hat_name", "urun1_deger", "uretim_zamani_dk", "net_uretim_zamani_dk",
+             "operasyonel_verimlilik", "uretim_verimlilik", "teknik_durus_kayip_orani",
+             "date", "date_time"],
+            ((i, f"Hat {i % 12}", rng.randint(0, 1000), rng.randint(0, 1440),
+              rng.randint(0, 1440), rng.random(), rng.random(), rng.random() * 0.2,
+              day(i)[:10], day(i))
+             for i in range(1, scale + 1)))
+
+    conn.commit()
+    conn.close()
+    return path
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"n": 0}
+    v = sorted(values)
+
+    def pct(p):
+        return v[min(len(v) - 1, int(round(p / 100 * (len(v) - 1))))]
+    return {"n": len(v),
+            "mean": round(sum(v) / len(v), 3),
+            "p50": round(pct(50), 3),
+            "p95": round(pct(95), 3),
+            "p99": round(pct(99), 3),
+            "max": round(v[-1], 3)}
@@ -0,0 +1,134 @@
+"""
+cache_helper.py – NL → SQL sonuç önbelleği
+
+Aynı soru (normalize edilmiş hâliyle) aynı tablo seti, deployment ve
+prompt sürümü için tekrar sorulduğunda LLM'e gitmeden daha önce üretilmiş
+ve doğrulanmış SQL döner.  Bellekte LRU + TTL, isteğe bağlı olarak SQLite
+dosyasında kalıcı tutulur (yeniden başlatmada korunur).
+
+Ortam değişkenleri:
+  SQL_CACHE_SIZE   bellekteki en fazla kayıt       (vars. 1024)
+  SQL_CACHE_TTL    saniye; 0 → süresiz              (vars. 86400)
+  SQL_CACHE_PATH   SQLite dosyası; boşsa yalnız bellek
+"""
+
+import os, re, time, sqlite3, hashlib, threading, unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+__all__ = ["SQLCache", "normalize_question"]
+
+_TR_LOWER = str.maketrans({"I": "ı", "İ": "i"})
+_SPACE_RE = re.compile(r"\s+")
+_EDGE_PUNCT = " \t\n?!.,;:…\"'"
+
+
+def normalize_question(question: str) -> str:
+    """Önbellek anahtarı için soruyu sadeleştirir.
+
+    NFKC + Türkçe küçük harf (I→ı, İ→i), boşlukları teke indirir,
+    baştaki/sondaki noktalama işaretlerini atar.
+    """
+    q = unicodedata.normalize("NFKC", question).translate(_TR_LOWER).lower()
+    return _SPACE_RE.sub(" ", q).strip(_EDGE_PUNCT)
+
+
+class SQLCache:
+    """LRU/TTL bellek önbelleği + isteğe bağlı SQLite arka depo."""
+
+    def __init__(self, *,
+                 max_entries: Optional[int] = None,
+                 ttl: Optional[float] = None,
+                 path: Optional[str] = None):
+        self.max_entries = max_entries or int(os.getenv("SQL_CACHE_SIZE", "1024"))
+        self.ttl = float(os.getenv("SQL_CACHE_TTL", "86400")) if ttl is None else ttl
+        self.path = path if path is not None else (os.getenv("SQL_CACHE_PATH") or None)
+
+        self._mem: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.disk_hits = 0
+
+        self._db: Optional[sqlite3.Connection] = None
+        if self.path:
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.execute("""CREATE TABLE IF NOT EXISTS sql_cache (
+                                    key     TEXT PRIMARY KEY,
+                                    sql     TEXT NOT NULL,
+                                    expires REAL NOT NULL)""")
+            self._db.commit()
+            self.purge_expired()
+
+    # ─────────── Anahtar ───────────
+    @staticmethod
+    def key(table_set: int, deployment: str, prompt_version: str, question: str) -> str:
+        raw = "\x1f".join((str(table_set), deployment or "", prompt_version,
+                           normalize_question(question)))
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _expiry(self) -> float:
+        return time.time() + self.ttl if self.ttl else float("inf")
+
+    # ─────────── Oku / yaz ───────────
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            hit = self._mem.get(key)
+            if hit and hit[1] > now:
+                self._mem.move_to_end(key)
+                self.hits += 1
+                return hit[0]
+            if hit:
+                del self._mem[key]
+
+            if self._db is not None:
+                row = self._db.execute("SELECT sql, expires FROM sql_cache WHERE key = ?",
+                                       (key,)).fetchone()
+                if row and row[1] > now:
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return row[0]
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, sql: str):
+        expires = self._expiry()
+        with self._lock:
+            self._remember(key, sql, expires)
+            if self._db is not None:
+                # inf SQLite'a REAL olarak yazılabilir
+                self._db.execute("INSERT OR REPLACE INTO sql_cache (key, sql, expires) VALUES (?, ?, ?)",
+                                 (key, sql, expires))
+                self._db.commit()
+
+    def _remember(self, key: str, sql: str, expires: float):
+        self._mem[key] = (sql, expires)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM sql_cache")
+                self._db.commit()
+
+    def purge_expired(self) -> int:
+        """Süresi dolmuş disk kayıtlarını siler, silinen sayısını döner."""
+        if self._db is None:
+            return 0
+        with self._lock:
+            cur = self._db.execute("DELETE FROM sql_cache WHERE expires <= ?", (time.time(),))
+            self._db.commit()
+            return cur.rowcount
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "size": len(self._mem),
+                "persistent": self._db is not None}
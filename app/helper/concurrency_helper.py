@@ -0,0 +1,213 @@
+"""
+concurrency_helper.py – /ask için sınırlı eşzamanlılık + geri basınç
+
+Her tablo seti (set_id) için ayrı bir eşzamanlılık limiti ve kuyruk
+derinliği tutulur.  Bloklayan iş (LLM çağrısı + DB sorgusu) event loop
+yerine ortak bir ThreadPoolExecutor'da çalışır; kuyruk doluysa
+``SetSaturated`` fırlatılır ve endpoint 429 döner.
+
+``CancelToken`` istemci ayrıldığında süren işi durdurmak içindir: iş
+kontrol noktalarında ``raise_if_cancelled()`` çağırır, bloklayan çağrılar
+(DB cursor'u) ``bind()`` ile bir kesme fonksiyonu kaydeder.
+
+Ortam değişkenleri:
+  ASK_MAX_CONCURRENCY   set başına aynı anda çalışan istek (vars. 4)
+  ASK_MAX_QUEUE         set başına bekleyebilecek istek     (vars. 16)
+  ASK_SET_LIMITS        set bazında geçersiz kılma, ör. "1:2,3:8"
+"""
+
+import asyncio, os, time, threading, functools, contextlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+__all__ = ["SetLimiter", "SetSaturated", "CancelToken", "Cancelled"]
+
+
+class SetSaturated(Exception):
+    """Set kuyruğu dolu – istemci daha sonra tekrar denemeli (HTTP 429)."""
+
+    def __init__(self, set_id: int, pending: int, capacity: int):
+        self.set_id, self.pending, self.capacity = set_id, pending, capacity
+        super().__init__(f"set {set_id} dolu ({pending}/{capacity} istek bekliyor)")
+
+
+class Cancelled(Exception):
+    """İş iptal edildi (ör. istemci bağlantıyı kapattı)."""
+
+
+class CancelToken:
+    """Thread'ler arası iptal bayrağı + iptalde çağrılacak kesme fonksiyonları."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+        self.reason: Optional[str] = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self, reason: str = "istemci bağlantıyı kapattı"):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self.reason = reason
+            self._event.set()
+            for cb in list(self._callbacks):
+                try:
+                    cb()
+                except Exception:
+                    pass            # kesme en iyi çaba; iş kontrol noktasında durur
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise Cancelled(f"İstek iptal edildi ({self.reason})")
+
+    @contextlib.contextmanager
+    def bind(self, callback: Callable[[], Any]):
+        """Blok süresince iptalde ``callback`` çağrılır; çıkıştan sonra asla.
+
+        Kilit sayesinde geri çağrı, bağlantı havuza döndükten sonra
+        (başka bir isteğin sorgusunu kesecek şekilde) çalışamaz.
+        """
+        with self._lock:
+            self.raise_if_cancelled()
+            self._callbacks.append(callback)
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._callbacks.remove(callback)
+
+
+def _parse_set_limits(spec: str) -> Dict[int, int]:
+    out: Dict[int, int] = {}
+    for part in filter(None, (p.strip() for p in spec.split(","))):
+        sid, _, lim = part.partition(":")
+        out[int(sid)] = int(lim)
+    return out
+
+
+class _SetStats:
+    __slots__ = ("done", "rejected", "in_flight", "queued",
+                 "wait_ms_sum", "wait_ms_max", "work_ms_sum", "work_ms_max")
+
+    def __init__(self):
+        self.done = self.rejected = self.in_flight = self.queued = 0
+        self.wait_ms_sum = self.wait_ms_max = 0.0
+        self.work_ms_sum = self.work_ms_max = 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        n = self.done or 1
+        return {
+            "done": self.done,
+            "rejected": self.rejected,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "wait_ms_avg": round(self.wait_ms_sum / n, 1),
+            "wait_ms_max": round(self.wait_ms_max, 1),
+            "work_ms_avg": round(self.work_ms_sum / n, 1),
+            "work_ms_max": round(self.work_ms_max, 1),
+        }
+
+
+class SetLimiter:
+    """set_id başına semafor + kuyruk limiti, ortak thread havuzu."""
+
+    KNOWN_SETS = (1, 2, 3)
+
+    def __init__(self, *,
+                 max_concurrency: Optional[int] = None,
+                 max_queue: Optional[int] = None,
+                 set_limits: Optional[Dict[int, int]] = None):
+        self.max_concurrency = max_concurrency or int(os.getenv("ASK_MAX_CONCURRENCY", "4"))
+        self.max_queue = max_queue if max_queue is not None else int(os.getenv("ASK_MAX_QUEUE", "16"))
+        self.set_limits = set_limits if set_limits is not None else \
+            _parse_set_limits(os.getenv("ASK_SET_LIMITS", ""))
+
+        workers = sum(self.limit(s) for s in set(self.KNOWN_SETS) | set(self.set_limits))
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ask")
+
+        self._sems: Dict[int, asyncio.Semaphore] = {}
+        self._stats: Dict[int, _SetStats] = {}
+        self._lock = threading.Lock()
+
+    # ─────────── Limit / durum ───────────
+    def limit(self, set_id: int) -> int:
+        return self.set_limits.get(set_id, self.max_concurrency)
+
+    def capacity(self, set_id: int) -> int:
+        return self.limit(set_id) + self.max_queue
+
+    def _sem(self, set_id: int) -> asyncio.Semaphore:
+        if set_id not in self._sems:
+            self._sems[set_id] = asyncio.Semaphore(self.limit(set_id))
+        return self._sems[set_id]
+
+    def _st(self, set_id: int) -> _SetStats:
+        with self._lock:
+            return self._stats.setdefault(set_id, _SetStats())
+
+    # ─────────── Slot al / bırak ───────────
+    def check(self, set_id: int) -> _SetStats:
+        """Kuyruk doluysa ``SetSaturated`` fırlatır; slot almaz.
+
+        Akış yanıtı başlamadan düz 429 dönebilmek için; slotun kendisi
+        akışın içinde ``slot()`` ile alınır.
+        """
+        st = self._st(set_id)
+        if st.in_flight + st.queued >= self.capacity(set_id):
+            st.rejected += 1
+            raise SetSaturated(set_id, st.in_flight + st.queued, self.capacity(set_id))
+        return st
+
+    @contextlib.asynccontextmanager
+    async def slot(self, set_id: int):
+        """Kuyruğa gir, çalışma hakkı alınca bekleme süresini (ms) ver.
+
+        Kuyruk doluysa beklemeden ``SetSaturated`` fırlatır.
+        """
+        st = self.check(set_id)
+        st.queued += 1
+        t0 = time.perf_counter()
+        try:
+            await self._sem(set_id).acquire()
+        finally:
+            st.queued -= 1
+        wait_ms = (time.perf_counter() - t0) * 1000
+
+        st.in_flight += 1
+        t1 = time.perf_counter()
+        try:
+            yield wait_ms
+        finally:
+            work_ms = (time.perf_counter() - t1) * 1000
+            st.in_flight -= 1
+            self._sem(set_id).release()
+            st.done += 1
+            st.wait_ms_sum += wait_ms
+            st.work_ms_sum += work_ms
+            st.wait_ms_max = max(st.wait_ms_max, wait_ms)
+            st.work_ms_max = max(st.work_ms_max, work_ms)
+
+    async def run(self, set_id: int, fn: Callable[..., Any], *args, **kwargs) -> Tuple[Any, float]:
+        """``fn``'i set limiti altında thread havuzunda çalıştırır.
+
+        Returns:
+            (sonuç, kuyrukta bekleme ms)
+        """
+        async with self.slot(set_id) as wait_ms:
+            loop = asyncio.get_running_loop()
+            res = await loop.run_in_executor(self.executor,
+                                             functools.partial(fn, *args, **kwargs))
+            return res, wait_ms
+
+    def stats(self) -> Dict[int, Dict[str, float]]:
+        with self._lock:
+            items = list(self._stats.items())
+        return {sid: {"limit": self.limit(sid), "capacity": self.capacity(sid), **st.as_dict()}
+                for sid, st in items}
+
+    def shutdown(self, wait: bool = True):
+        self.executor.shutdown(wait=wait)
@@ -0,0 +1,210 @@
+"""
+cost_helper.py – üretilen SQL için yürütme öncesi maliyet tahmini
+
+Sorgu çalışmadan önce aynı bağlantıda planı istenir ve tahmin eşiği
+aşıyorsa ``QueryTooExpensive`` fırlatılır (onarım döngüsü modele daha
+seçici bir sorgu yazdırabilir).
+
+  sqlite  ``EXPLAIN QUERY PLAN`` satırları → taranacak satır tahmini.
+          Aynı seviyedeki SCAN / SEARCH adımları iç içe döngüdür (çarpılır);
+          MATERIALIZE / CO-ROUTINE / alt sorgular ayrıca eklenir.
+          SCAN → tablonun satır sayısı, birincil anahtar / unique indeksle
+          eşitlik SEARCH'ü → 1, diğer SEARCH'ler → satırların 1/10'u.
+          Satır sayıları sqlite_stat1'den (ANALYZE yapılmışsa), yoksa
+          MAX(rowid) / COUNT(*) ile okunur ve ROWCOUNT_TTL boyunca saklanır.
+  mssql   ``SET SHOWPLAN_XML ON`` → StatementSubTreeCost / StatementEstRows.
+  diğer   kontrol yapılmaz.
+
+Tahmin kaba bir üst sınırdır: WHERE seçiciliği ve LIMIT'in erken durması
+hesaba katılmaz.  Plan alınamazsa (ör. SQL hatalı) sorgu engellenmez;
+hata yürütmede ortaya çıkar.
+
+Ortam değişkenleri:
+  QUERY_COST_CHECK       1 → açık (vars. 0)
+  QUERY_COST_MAX_ROWS    taranacak tahmini satır üst sınırı (vars. 50000000)
+  QUERY_COST_MAX         MSSQL StatementSubTreeCost üst sınırı (vars. 500)
+  QUERY_COST_ROWCOUNT_TTL  tablo satır sayısı önbelleği sn (vars. 300)
+"""
+
+import os, re, time, threading, logging
+from typing import Dict, List, Optional, Tuple
+
+__all__ = ["CostGuard", "QueryTooExpensive", "sqlite_plan_estimate"]
+
+log = logging.getLogger("app.cost")
+
+_LOOP_RE = re.compile(r"^(SCAN|SEARCH)\s+(?:TABLE\s+)?(\S+)(?:\s+AS\s+(\S+))?(.*)$", re.I)
+_SUBPLAN_RE = re.compile(r"^(MATERIALIZE|CO-ROUTINE)\s+(\S+)", re.I)
+_EQ_ONLY_RE = re.compile(r"\((\w+=\?)(\s+AND\s+\w+=\?)*\)\s*$")
+_MSSQL_COST_RE = re.compile(r'StatementSubTreeCost="([\d.eE+-]+)"')
+_MSSQL_ROWS_RE = re.compile(r'StatementEstRows="([\d.eE+-]+)"')
+
+# tablo / CTE çözülemezse varsayılan satır tahmini
+_UNKNOWN_ROWS = 1000
+
+
+class QueryTooExpensive(ValueError):
+    """Tahmini maliyet eşiği aşıyor; ``estimate`` plan özetini taşır."""
+
+    def __init__(self, estimate: Dict, limit: float, kind: str = "rows"):
+        self.estimate, self.limit, self.kind = estimate, limit, kind
+        value = estimate.get("rows") if kind == "rows" else estimate.get("cost")
+        what = "taranacak satır" if kind == "rows" else "plan maliyeti"
+        super().__init__(f"Sorgu çok maliyetli: tahmini {what} ~{value:,.0f} (sınır {limit:,.0f}). "
+                         "Daha seçici WHERE filtresi, TOP ya da eksik JOIN koşulu ekleyin.")
+
+    def as_dict(self) -> Dict:
+        return {"code": "too_expensive", "kind": self.kind, "limit": self.limit,
+                "estimate": self.estimate}
+
+
+# ───────────────────── SQLite ─────────────────────
+def sqlite_plan_estimate(plan: List[tuple], rows_of) -> Dict:
+    """``EXPLAIN QUERY PLAN`` satırları (id, parent, _, detail) → tahmin.
+
+    ``rows_of(ad)`` plan satırındaki tablo / takma ad için satır sayısı döner
+    (bilinmiyorsa None).
+    """
+    children: Dict[int, List[tuple]] = {}
+    for node_id, parent, _, detail in plan:
+        children.setdefault(parent, []).append((node_id, detail))
+    ctes: Dict[str, int] = {}
+    temp_btree = any("USE TEMP B-TREE" in d.upper() for _, _, _, d in plan)
+
+    def loop_rows(kind: str, name: str, rest: str) -> int:
+        n = ctes.get(name.lower())
+        if n is None:
+            n = rows_of(name)
+        if n is None:
+            n = _UNKNOWN_ROWS
+        if kind == "SEARCH":
+            rest_u = rest.upper()
+            unique = ("PRIMARY KEY" in rest_u or "SQLITE_AUTOINDEX" in rest_u)
+            if unique and _EQ_ONLY_RE.search(rest):
+                return 1
+            return max(1, n // 10)
+        return max(1, n)
+
+    def visit(parent: int) -> int:
+        loops, extra, has_loop = 1, 0, False
+        for node_id, detail in children.get(parent, ()):
+            m = _LOOP_RE.match(detail)
+            if m and not detail.upper().startswith("SCAN CONSTANT ROW"):
+                loops *= loop_rows(m.group(1).upper(), m.group(3) or m.group(2), m.group(4))
+                has_loop = True
+                continue
+            sub = visit(node_id)
+            m = _SUBPLAN_RE.match(detail)
+            if m:
+                ctes[m.group(2).lower()] = max(1, sub)
+            # ilişkili alt sorgu dış döngünün her satırında yeniden çalışır
+            extra += sub * (loops if "CORRELATED" in detail.upper() else 1)
+        return (loops if has_loop else 0) + extra
+
+    return {"rows": visit(0), "temp_btree": temp_btree,
+            "plan": [d for _, _, _, d in plan]}
+
+
+# ───────────────────── MSSQL ─────────────────────
+def _mssql_estimate(cur, sql: str) -> Dict:
+    cur.execute("SET SHOWPLAN_XML ON")
+    try:
+        cur.execute(sql)
+        xml = "".join(str(r[0]) for r in cur.fetchall())
+    finally:
+        cur.execute("SET SHOWPLAN_XML OFF")
+    costs = [float(v) for v in _MSSQL_COST_RE.findall(xml)]
+    rows = [float(v) for v in _MSSQL_ROWS_RE.findall(xml)]
+    return {"cost": max(costs, default=0.0), "rows": max(rows, default=0.0)}
+
+
+class CostGuard:
+    """Yürütme öncesi plan tahmini + eşik kontrolü (bağlantı çağırandan gelir)."""
+
+    def __init__(self, *, max_rows: Optional[float] = None,
+                 max_cost: Optional[float] = None,
+                 rowcount_ttl: Optional[float] = None):
+        self.max_rows = max_rows or float(os.getenv("QUERY_COST_MAX_ROWS", "50000000"))
+        self.max_cost = max_cost or float(os.getenv("QUERY_COST_MAX", "500"))
+        self.rowcount_ttl = (float(os.getenv("QUERY_COST_ROWCOUNT_TTL", "300"))
+                             if rowcount_ttl is None else rowcount_ttl)
+        self._counts: Dict[Tuple[str, str], Tuple[float, Optional[int]]] = {}
+        self._lock = threading.Lock()
+        self.checks = self.rejected = self.errors = 0
+
+    # ─────────── Satır sayıları (SQLite) ───────────
+    def _table_rows(self, db: str, conn, table: str) -> Optional[int]:
+        key, now = (db, table.lower()), time.monotonic()
+        with self._lock:
+            hit = self._counts.get(key)
+        if hit is not None and now - hit[0] < self.rowcount_ttl:
+            return hit[1]
+        n = None
+        cur = conn.cursor()
+        try:
+            ident = '"' + table.replace('"', '""') + '"'
+            for q, args in (("SELECT stat FROM sqlite_stat1 WHERE tbl = ? COLLATE NOCASE", (table,)),
+                            (f"SELECT MAX(rowid) FROM {ident}", ()),
+                            (f"SELECT COUNT(*) FROM {ident}", ())):
+                try:
+                    row = cur.execute(q, args).fetchone()
+                except Exception:
+                    continue            # sqlite_stat1 yok / WITHOUT ROWID tablo
+                if row and row[0] is not None:
+                    n = int(str(row[0]).split()[0])
+                    break
+        finally:
+            cur.close()
+        with self._lock:
+            self._counts[key] = (now, n)
+        return n
+
+    # ─────────── Tahmin / kontrol ───────────
+    def estimate(self, engine, conn, sql: str,
+                 tables: Optional[Dict[str, str]] = None) -> Optional[Dict]:
+        """Plan özeti; dialect desteklenmiyorsa ya da plan alınamazsa None.
+
+        ``tables`` plan satırlarındaki takma adları gerçek tabloya çevirir
+        (küçük harf alias → tablo).
+        """
+        dialect = engine.dialect.name
+        try:
+            if dialect == "sqlite":
+                cur = conn.cursor()
+                try:
+                    plan = cur.execute("EXPLAIN QUERY PLAN " + sql.rstrip().rstrip(";")).fetchall()
+                finally:
+                    cur.close()
+                db = str(engine.url)
+                aliases = tables or {}
+                return sqlite_plan_estimate(
+                    plan, lambda name: self._table_rows(db, conn, aliases.get(name.lower(), name)))
+            if dialect == "mssql":
+                cur = conn.cursor()
+                try:
+                    return _mssql_estimate(cur, sql)
+                finally:
+                    cur.close()
+        except Exception as e:
+            self.errors += 1
+            log.debug("Plan alınamadı (%s): %s", dialect, e)
+        return None
+
+    def check(self, engine, conn, sql: str,
+              tables: Optional[Dict[str, str]] = None) -> Optional[Dict]:
+        """Eşik aşılırsa ``QueryTooExpensive``; aksi hâlde tahmini döner."""
+        est = self.estimate(engine, conn, sql, tables)
+        self.checks += 1
+        if est is None:
+            return None
+        if est.get("cost") is not None and est["cost"] > self.max_cost:
+            self.rejected += 1
+            raise QueryTooExpensive(est, self.max_cost, kind="cost")
+        if est["rows"] > self.max_rows:
+            self.rejected += 1
+            raise QueryTooExpensive(est, self.max_rows)
+        return est
+
+    def stats(self) -> Dict:
+        return {"checks": self.checks, "rejected": self.rejected, "errors": self.errors,
+                "max_rows": self.max_rows, "max_cost": self.max_cost}
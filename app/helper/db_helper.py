@@ -1,9 +1,246 @@
-from sqlalchemy import create_engine
-import os
+"""
+db_helper.py – süreç geneli engine kaydı + bağlantı havuzu ayarları
+
+``get_engine()`` aynı DSN için her zaman aynı Engine'i döndürür; havuz
+boyutu, taşma, pre-ping, recycle ve ifade (statement) zaman aşımı ortam
+değişkenlerinden okunur.  ``checkout()`` ham DBAPI bağlantısını verirken
+havuzdan bekleme süresini ve aynı anda kullanılan bağlantı sayısını ölçer.
+Süre dolan SQLite sorgusu ``StatementTimeout`` olarak yükselir;
+``interrupt()`` çalışan sorguyu başka bir thread'den keser.
+``redacted_url()`` DSN'i /stats, /metrics ve çıktı dosyaları için kimlik
+bilgisi içermeyen bir etikete çevirir (``odbc_connect`` içindeki UID/PWD
+dahil).
+
+Ortam değişkenleri:
+  DB_URL                 tam SQLAlchemy DSN (öncelikli)
+  MSSQL_SERVER / MSSQL_DATABASE / MSSQL_USER / MSSQL_PASSWORD / MSSQL_DRIVER
+                         DB_URL yoksa ve MSSQL_SERVER verilmişse MSSQL (pyodbc)
+  DB_PATH                yukarıdakiler yoksa SQLite dosyası (vars. entegre_veritabani.db)
+  DB_POOL_SIZE (5) · DB_MAX_OVERFLOW (10) · DB_POOL_TIMEOUT (30 sn)
+  DB_POOL_RECYCLE (1800 sn) · DB_POOL_PRE_PING (1) · DB_STATEMENT_TIMEOUT (0 → yok)
+  DB_SET_TIMEOUTS        tablo seti bazında ifade zaman aşımı sn, ör. "1:10,3:60"
+"""
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+import os, re, time, threading, contextlib
+from typing import Dict, Optional
+from urllib.parse import quote_plus
 from dotenv import load_dotenv
 
-def get_engine():
+__all__ = ["get_engine", "default_dsn", "redacted_url", "checkout", "pool_stats",
+           "statement_timeout_for", "interrupt", "StatementTimeout"]
+
+_ENGINES: Dict[str, object] = {}
+_STATS: Dict[str, "_PoolStats"] = {}
+_LOCK = threading.Lock()
+
+
+def default_dsn() -> str:
     load_dotenv()
+    if os.getenv('DB_URL'):
+        return os.getenv('DB_URL')
+    if os.getenv('MSSQL_SERVER'):
+        odbc = (f"DRIVER={{{os.getenv('MSSQL_DRIVER', 'ODBC Driver 18 for SQL Server')}}};"
+                f"SERVER={os.getenv('MSSQL_SERVER')};"
+                f"DATABASE={os.getenv('MSSQL_DATABASE', '')};"
+                f"UID={os.getenv('MSSQL_USER', '')};"
+                f"PWD={os.getenv('MSSQL_PASSWORD', '')};"
+                "TrustServerCertificate=yes")
+        return f"mssql+pyodbc:///?odbc_connect={quote_plus(odbc)}"
     db_path = os.getenv('DB_PATH', 'entegre_veritabani.db')
-    engine = create_engine(f'sqlite:///{db_path}')
-    return engine
+    return f'sqlite:///{db_path}'
+
+
+# ODBC bağlantı dizesi: ANAHTAR=değer; … (değer {…} içinde ';' içerebilir)
+_ODBC_PAIR = re.compile(r"\s*([^=;]+?)\s*=\s*(\{(?:[^}]|\}\})*\}|[^;]*);?")
+_SECRET_PARAMS = {"uid", "user", "user id", "username", "pwd", "password"}
+
+
+def redacted_url(engine_or_dsn) -> str:
+    """Kimlik bilgisi olmadan DSN etiketi (havuz anahtarı, metrik etiketi, rapor).
+
+    ``odbc_connect`` kullanan MSSQL DSN'i ``mssql+pyodbc://SUNUCU/VERİTABANI``
+    olur; diğerlerinde parola maskelenir ve UID/PWD benzeri sorgu
+    parametreleri atılır.
+    """
+    url = getattr(engine_or_dsn, "url", None) or make_url(str(engine_or_dsn))
+    odbc = url.query.get("odbc_connect")
+    if odbc:
+        if isinstance(odbc, tuple):
+            odbc = odbc[0]
+        pairs = {k.lower(): v.strip("{}") for k, v in _ODBC_PAIR.findall(odbc)}
+        return f"{url.drivername}://{pairs.get('server', '')}/{pairs.get('database', '')}"
+    query = {k: v for k, v in url.query.items() if k.lower() not in _SECRET_PARAMS}
+    return url.set(query=query).render_as_string(hide_password=True)
+
+
+class _PoolStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.checkouts = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.wait_ms_sum = 0.0
+        self.wait_ms_max = 0.0
+
+    def as_dict(self) -> Dict[str, float]:
+        n = self.checkouts or 1
+        return {"checkouts": self.checkouts,
+                "in_use": self.in_use,
+                "peak_in_use": self.peak_in_use,
+                "wait_ms_avg": round(self.wait_ms_sum / n, 2),
+                "wait_ms_max": round(self.wait_ms_max, 2)}
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.getenv(name, str(default)))
+
+
+class StatementTimeout(Exception):
+    """İfade zaman aşımı doldu; sorgu DB tarafında kesildi."""
+
+    def __init__(self, seconds: float):
+        self.seconds = seconds
+        super().__init__(f"Sorgu zaman aşımı: {seconds:g} sn içinde bitmedi (statement timeout)")
+
+
+def statement_timeout_for(table_set: int, engine) -> float:
+    """DB_SET_TIMEOUTS'taki set değeri, yoksa engine varsayılanı (sn, 0 → yok)."""
+    for part in filter(None, (p.strip() for p in os.getenv("DB_SET_TIMEOUTS", "").split(","))):
+        sid, _, secs = part.partition(":")
+        if int(sid) == table_set:
+            return float(secs)
+    return getattr(engine, "statement_timeout", 0)
+
+
+def _install_timeout(engine, seconds: float):
+    """Varsayılan ifade zaman aşımını bağlantı açılışında kurar."""
+    dialect = engine.dialect.name
+
+    @event.listens_for(engine, "connect")
+    def _on_connect(dbapi_conn, record):
+        if dialect == "mssql":
+            dbapi_conn.timeout = int(seconds)          # pyodbc: sorgu başına sn
+        elif dialect == "sqlite":
+            info = record.info
+
+            # VM her ~10k adımda bir sorar; süre dolduysa sorguyu keser
+            def _guard():
+                deadline = info.get("deadline")
+                return 1 if deadline and time.monotonic() > deadline else 0
+            dbapi_conn.set_progress_handler(_guard, 10000)
+
+    @event.listens_for(engine, "checkin")
+    def _on_checkin(dbapi_conn, record):
+        # checkout(timeout=…) ile verilen geçici süreyi geri al
+        record.info.pop("deadline", None)
+        if dialect == "mssql" and dbapi_conn is not None:
+            dbapi_conn.timeout = int(seconds)
+
+
+def get_engine(dsn: Optional[str] = None):
+    """DSN başına tek Engine (ilk çağrıdaki ayarlarla oluşturulur)."""
+    dsn = dsn or default_dsn()
+    with _LOCK:
+        if dsn in _ENGINES:
+            return _ENGINES[dsn]
+
+        kwargs = {"pool_pre_ping": os.getenv('DB_POOL_PRE_PING', '1') == '1'}
+        in_memory = dsn.startswith('sqlite') and (dsn in ('sqlite://', 'sqlite:///:memory:'))
+        if not in_memory:
+            kwargs.update(pool_size=_env_int('DB_POOL_SIZE', 5),
+                          max_overflow=_env_int('DB_MAX_OVERFLOW', 10),
+                          pool_timeout=_env_int('DB_POOL_TIMEOUT', 30),
+                          pool_recycle=_env_int('DB_POOL_RECYCLE', 1800))
+        if dsn.startswith('sqlite'):
+            # havuzdaki bağlantılar farklı thread'lerden kullanılır
+            kwargs["connect_args"] = {"check_same_thread": False}
+
+        engine = create_engine(dsn, **kwargs)
+        engine.statement_timeout = float(os.getenv('DB_STATEMENT_TIMEOUT', '0') or 0)
+        if engine.dialect.name in ("mssql", "sqlite"):
+            _install_timeout(engine, engine.statement_timeout)
+
+        _ENGINES[dsn] = engine
+        _STATS[dsn] = _PoolStats()
+        return engine
+
+
+def _stats_for(engine) -> _PoolStats:
+    key = next((k for k, e in _ENGINES.items() if e is engine), None)
+    if key is None:
+        with _LOCK:
+            key = f"unregistered:{id(engine)}"
+            _STATS.setdefault(key, _PoolStats())
+    return _STATS[key]
+
+
+@contextlib.contextmanager
+def checkout(engine, *, timeout: Optional[float] = None):
+    """Havuzdan ham DBAPI bağlantısı al; bekleme süresini ve kullanımı say.
+
+    ``timeout`` (sn) verilirse engine varsayılanı yerine bu bağlantıdaki
+    sorgular için geçerli olur.
+    """
+    st = _stats_for(engine)
+    t0 = time.perf_counter()
+    conn = engine.raw_connection()
+    wait_ms = (time.perf_counter() - t0) * 1000
+    with st.lock:
+        st.checkouts += 1
+        st.in_use += 1
+        st.peak_in_use = max(st.peak_in_use, st.in_use)
+        st.wait_ms_sum += wait_ms
+        st.wait_ms_max = max(st.wait_ms_max, wait_ms)
+    try:
+        secs = timeout if timeout is not None else getattr(engine, "statement_timeout", 0)
+        if secs:
+            if engine.dialect.name == "sqlite":
+                conn.info["deadline"] = time.monotonic() + secs
+            elif engine.dialect.name == "mssql":
+                conn.dbapi_connection.timeout = int(secs)
+        yield conn
+    except Exception as e:
+        # SQLite kesilen sorgu için yalnız "interrupted" der → süre mi doldu?
+        deadline = conn.info.get("deadline")
+        if deadline and time.monotonic() > deadline and "interrupt" in str(e).lower():
+            raise StatementTimeout(secs) from e
+        raise
+    finally:
+        with st.lock:
+            st.in_use -= 1
+        conn.close()
+
+
+def interrupt(conn, cursor=None) -> bool:
+    """Bağlantıda çalışan sorguyu keser (başka thread'den çağrılabilir).
+
+    SQLite → ``Connection.interrupt()``, pyodbc → ``Cursor.cancel()``.
+    Sorgu çalışmıyorsa etkisizdir.
+    """
+    raw = conn.dbapi_connection
+    if hasattr(raw, "interrupt"):
+        raw.interrupt()
+        return True
+    if cursor is not None and hasattr(cursor, "cancel"):
+        cursor.cancel()
+        return True
+    if hasattr(raw, "cancel"):
+        raw.cancel()
+        return True
+    return False
+
+
+def pool_stats() -> Dict[str, Dict]:
+    """Kayıtlı her engine için havuz durumu + checkout bekleme istatistikleri."""
+    out = {}
+    for dsn, engine in list(_ENGINES.items()):
+        pool = engine.pool
+        info = _STATS[dsn].as_dict()
+        for name in ("size", "checkedout", "checkedin", "overflow"):
+            fn = getattr(pool, name, None)
+            if callable(fn):
+                info[f"pool_{name}"] = fn()
+        out[redacted_url(engine)] = info
+    return out
@@ -0,0 +1,282 @@
+"""
+dialect_helper.py – modelin ürettiği MSSQL SELECT'ini DuckDB'ye çevirir
+
+Prompt'lar T-SQL ister (``TOP``, ``GETDATE()``, ``TRY_CONVERT``, köşeli
+parantezli adlar …); yerel kolonsal kopya (replica_helper) ise DuckDB'dir.
+Çeviri tokenizer (validator_helper) üzerinde parantez düzeyinde yapılır:
+
+  SELECT TOP (n) …            → … LIMIT n   (aynı parantez düzeyinin sonuna)
+  [ad] / `ad`                 → "ad";  ``dbo.`` öneki atılır
+  N'metin'                    → 'metin'
+  GETDATE() / SYSDATETIME()   → current_localtimestamp()
+  TRY_CONVERT(tip, x)         → TRY_CAST(x AS tip)   (CONVERT → CAST)
+  DATEADD(part, n, d)         → (d + INTERVAL (n) part)
+  DATEDIFF(part, a, b)        → date_diff('part', a, b)
+  DATEPART(part, x)           → date_part('part', x)
+  ISNULL / LEN / IIF / NEWID / EOMONTH / DATEFROMPARTS / CHARINDEX / STDEV …
+  NVARCHAR / DATETIME / BIT / MONEY / FLOAT … tipleri DuckDB karşılıklarına
+  WITH (NOLOCK) tablo ipuçları ve OPTION (…) atılır
+
+Anlamı DuckDB'de birebir karşılanamayan yapılar (TOP PERCENT / WITH TIES,
+UNION dalında TOP, APPLY, @değişken, CONVERT stil kodu, FORMAT / DATENAME,
+LIKE '[a-z]' karakter sınıfı, haftaya bağlı DATEPART / DATEDIFF …)
+``Untranslatable`` fırlatır; çağıran sorguyu kaynakta çalıştırır.
+
+Bilinen fark: MSSQL'de ``int / int`` tamsayı bölmesi, ``AVG(int)`` tamsayı
+döner; DuckDB'de ikisi de ondalıklıdır.
+"""
+
+from typing import List, Tuple
+
+from .validator_helper import Token, tokenize, _unquote
+
+__all__ = ["Untranslatable", "translate_to_duckdb"]
+
+
+class Untranslatable(ValueError):
+    """SQL DuckDB'ye güvenle çevrilemiyor (sorgu kaynakta çalışmalı)."""
+
+
+# MSSQL tarih parçası → DuckDB (fonksiyon başına desteklenenler)
+_PARTS = {"YEAR": "year", "YY": "year", "YYYY": "year",
+          "QUARTER": "quarter", "QQ": "quarter", "Q": "quarter",
+          "MONTH": "month", "MM": "month", "M": "month",
+          "DAYOFYEAR": "doy", "DY": "doy", "Y": "doy",
+          "DAY": "day", "DD": "day", "D": "day",
+          "WEEK": "week", "WK": "week", "WW": "week",
+          "ISO_WEEK": "isoweek", "ISOWK": "isoweek", "ISOWW": "isoweek",
+          "WEEKDAY": "weekday", "DW": "weekday",
+          "HOUR": "hour", "HH": "hour",
+          "MINUTE": "minute", "MI": "minute", "N": "minute",
+          "SECOND": "second", "SS": "second", "S": "second",
+          "MILLISECOND": "millisecond", "MS": "millisecond",
+          "MICROSECOND": "microsecond", "MCS": "microsecond"}
+# hafta / haftanın günü DATEFIRST ayarına bağlı → yalnız DATEADD'de (7 gün / 1 gün)
+_ADD_UNITS  = {"year", "quarter", "month", "day", "week", "hour", "minute", "second",
+               "millisecond", "microsecond", "doy", "weekday"}
+_DIFF_UNITS = {"year", "quarter", "month", "day", "hour", "minute", "second",
+               "millisecond", "microsecond"}
+_PART_UNITS = _DIFF_UNITS | {"doy", "isoweek"}
+
+# aynı argümanlarla yalnız adı değişen fonksiyonlar
+_RENAMES = {"ISNULL": "COALESCE", "LEN": "length", "IIF": "if", "NEWID": "gen_random_uuid",
+            "GETDATE": "current_localtimestamp", "SYSDATETIME": "current_localtimestamp",
+            "EOMONTH": "last_day", "DATEFROMPARTS": "make_date",
+            "STDEV": "stddev_samp", "STDEVP": "stddev_pop", "VAR": "var_samp",
+            "VARP": "var_pop", "COUNT_BIG": "count"}
+# DuckDB'de yok ya da aynı adla farklı çalışan fonksiyonlar
+_BLOCKED = frozenset("""FORMAT DATENAME STUFF PATINDEX GETUTCDATE SYSUTCDATETIME
+    STRING_SPLIT OPENJSON CHOOSE SOUNDEX DIFFERENCE QUOTENAME OBJECT_ID
+    SCOPE_IDENTITY SWITCHOFFSET TODATETIMEOFFSET""".split())
+
+_TEXT_TYPES = frozenset("CHAR VARCHAR NCHAR NVARCHAR TEXT NTEXT".split())
+_TYPE_MAP = {"DATETIME": "TIMESTAMP", "DATETIME2": "TIMESTAMP", "SMALLDATETIME": "TIMESTAMP",
+             "DATETIMEOFFSET": "TIMESTAMPTZ", "BIT": "BOOLEAN", "FLOAT": "DOUBLE",
+             "REAL": "FLOAT", "MONEY": "DECIMAL(19,4)", "SMALLMONEY": "DECIMAL(10,4)",
+             "UNIQUEIDENTIFIER": "UUID"}
+
+
+def _tok(kind: str, value: str) -> Token:
+    return Token(kind, value, -1)
+
+
+def _close(toks: List[Token], i: int) -> int:
+    """``toks[i] == "("`` için eşleşen ")" indeksi."""
+    depth = 0
+    for j in range(i, len(toks)):
+        if toks[j].value == "(":
+            depth += 1
+        elif toks[j].value == ")":
+            depth -= 1
+            if depth == 0:
+                return j
+    raise Untranslatable("Parantezler dengesiz.")
+
+
+def _split_args(toks: List[Token]) -> List[List[Token]]:
+    args, cur, depth = [], [], 0
+    for t in toks:
+        if t.value == "(":
+            depth += 1
+        elif t.value == ")":
+            depth -= 1
+        if t.value == "," and depth == 0:
+            args.append(cur)
+            cur = []
+        else:
+            cur.append(t)
+    if cur or args:
+        args.append(cur)
+    return args
+
+
+def _part(arg: List[Token], allowed, fn: str) -> str:
+    unit = _PARTS.get(arg[0].upper) if len(arg) == 1 else None
+    if unit not in allowed:
+        raise Untranslatable(f"{fn}: tarih parçası desteklenmiyor "
+                             f"({' '.join(t.value for t in arg)})")
+    return {"doy": "day", "weekday": "day"}.get(unit, unit) if fn == "DATEADD" else unit
+
+
+def _duck_type(toks: List[Token]) -> List[Token]:
+    if not toks:
+        raise Untranslatable("Eksik veri tipi.")
+    name = toks[0].upper
+    if name in _TEXT_TYPES:
+        return [_tok("ident", "VARCHAR")]           # uzunluk / MAX DuckDB'de önemsiz
+    if name in _TYPE_MAP and len(toks) <= 4:        # FLOAT(53) gibi duyarlılık atılır
+        return [_tok("ident", _TYPE_MAP[name])]
+    return toks
+
+
+def _cast(kind: str, expr: List[Token], typ: List[Token]) -> List[Token]:
+    return ([_tok("ident", kind), _tok("punct", "(")] + _tx(expr) +
+            [_tok("keyword", "AS")] + _duck_type(typ) + [_tok("punct", ")")])
+
+
+def _function(name: Token, inner: List[Token]) -> List[Token]:
+    u = name.upper
+    if u in _BLOCKED:
+        raise Untranslatable(f"{u}() DuckDB'de aynı anlamda yok.")
+    if u in ("CONVERT", "TRY_CONVERT"):
+        args = _split_args(inner)
+        if len(args) != 2:
+            raise Untranslatable(f"{u}: stil kodu desteklenmiyor.")
+        return _cast("TRY_CAST" if u == "TRY_CONVERT" else "CAST", args[1], args[0])
+    if u in ("CAST", "TRY_CAST"):
+        depth, at = 0, None
+        for k, t in enumerate(inner):
+            depth += (t.value == "(") - (t.value == ")")
+            if depth == 0 and t.upper == "AS":
+                at = k
+        if at is None:
+            raise Untranslatable(f"{u}: AS bulunamadı.")
+        return _cast(u, inner[:at], inner[at + 1:])
+    if u == "DATEADD":
+        args = _split_args(inner)
+        if len(args) != 3:
+            raise Untranslatable("DATEADD üç argüman almalı.")
+        unit = _part(args[0], _ADD_UNITS, u)
+        return ([_tok("punct", "(")] + _tx(args[2]) +
+                [_tok("op", "+"), _tok("ident", "INTERVAL"), _tok("punct", "(")] +
+                _tx(args[1]) + [_tok("punct", ")"), _tok("ident", unit), _tok("punct", ")")])
+    if u in ("DATEDIFF", "DATEPART"):
+        args = _split_args(inner)
+        if len(args) != (3 if u == "DATEDIFF" else 2):
+            raise Untranslatable(f"{u}: argüman sayısı hatalı.")
+        unit = _part(args[0], _DIFF_UNITS if u == "DATEDIFF" else _PART_UNITS, u)
+        out = [_tok("ident", "date_diff" if u == "DATEDIFF" else "date_part"),
+               _tok("punct", "("), _tok("string", f"'{unit}'")]
+        for a in args[1:]:
+            out += [_tok("punct", ",")] + _tx(a)
+        return out + [_tok("punct", ")")]
+    if u == "CHARINDEX":
+        args = _split_args(inner)
+        if len(args) != 2:
+            raise Untranslatable("CHARINDEX: başlangıç konumu desteklenmiyor.")
+        return ([_tok("ident", "strpos"), _tok("punct", "(")] + _tx(args[1]) +
+                [_tok("punct", ",")] + _tx(args[0]) + [_tok("punct", ")")])
+    head = _tok("ident", _RENAMES[u]) if u in _RENAMES else name
+    return [head, _tok("punct", "(")] + _tx(inner) + [_tok("punct", ")")]
+
+
+def _parse_top(toks: List[Token], i: int) -> Tuple[int, int]:
+    """``toks[i] == TOP`` → (satır sayısı, TOP ifadesinden sonraki indeks)."""
+    i += 1
+    paren = i < len(toks) and toks[i].value == "("
+    j = i + 1 if paren else i
+    if j >= len(toks) or toks[j].kind != "number" or not toks[j].value.isdigit():
+        raise Untranslatable("TOP yalnız sabit sayıyla çevrilebilir.")
+    n = int(toks[j].value)
+    j += 1
+    if paren:
+        if j >= len(toks) or toks[j].value != ")":
+            raise Untranslatable("TOP ifadesi çözülemedi.")
+        j += 1
+    if j < len(toks) and (toks[j].upper == "PERCENT" or
+                          (toks[j].upper == "WITH" and j + 1 < len(toks)
+                           and toks[j + 1].upper == "TIES")):
+        raise Untranslatable("TOP PERCENT / WITH TIES desteklenmiyor.")
+    return n, j
+
+
+def _tx(toks: List[Token]) -> List[Token]:
+    """Tek parantez düzeyini çevirir; iç parantezler özyinelemeli."""
+    out: List[Token] = []
+    limit, compound, after_like = None, False, False
+    i, n = 0, len(toks)
+    while i < n:
+        t, u = toks[i], toks[i].upper
+        nxt = toks[i + 1] if i + 1 < n else None
+        if t.value == "(":
+            j = _close(toks, i)
+            out += [t] + _tx(toks[i + 1:j]) + [toks[j]]
+            i = j + 1
+            continue
+        if t.kind == "keyword" and u == "SELECT":
+            out.append(t)
+            i += 1
+            if i < n and toks[i].upper in ("DISTINCT", "ALL"):
+                out.append(toks[i])
+                i += 1
+            if i < n and toks[i].upper == "TOP":
+                if limit is not None:
+                    raise Untranslatable("Aynı düzeyde birden çok TOP.")
+                limit, i = _parse_top(toks, i)
+            continue
+        if t.kind == "keyword" and u in ("UNION", "EXCEPT", "INTERSECT"):
+            compound = True
+        elif t.kind == "keyword" and u == "APPLY":
+            raise Untranslatable("CROSS / OUTER APPLY desteklenmiyor.")
+        elif t.kind == "var":
+            raise Untranslatable("@değişkenler desteklenmiyor.")
+        elif (t.kind == "keyword" and u in ("WITH", "OPTION")
+              and nxt is not None and nxt.value == "("):
+            i = _close(toks, i + 1) + 1             # WITH (NOLOCK) / OPTION (…) ipuçları
+            continue
+        elif (t.kind in ("ident", "qident") and _unquote(t).lower() == "dbo"
+              and nxt is not None and nxt.value == "."):
+            i += 2                                  # dbo.Tablo → Tablo
+            continue
+        elif t.kind == "ident" and nxt is not None and nxt.value == "(":
+            j = _close(toks, i + 1)
+            out += _function(t, toks[i + 2:j])
+            i = j + 1
+            continue
+        elif t.kind == "qident":
+            t = _tok("qident", '"' + _unquote(t).replace('"', '""') + '"')
+        elif t.kind == "string":
+            if after_like and "[" in t.value:
+                raise Untranslatable("LIKE '[...]' karakter sınıfı desteklenmiyor.")
+            if t.value[:1] in "Nn":
+                t = _tok("string", t.value[1:])
+        after_like = u == "LIKE"
+        out.append(t)
+        i += 1
+    if limit is not None:
+        if compound:
+            raise Untranslatable("UNION / EXCEPT dalında TOP desteklenmiyor.")
+        out += [_tok("keyword", "LIMIT"), _tok("number", str(limit))]
+    return out
+
+
+def _render(toks: List[Token]) -> str:
+    parts: List[str] = []
+    prev = None
+    for t in toks:
+        v = t.value
+        glue = (prev is None or v in (",", ")", ".", ";") or prev.value in ("(", ".")
+                or (v == "(" and prev.kind in ("ident", "qident", "keyword")))
+        parts.append(v if glue else " " + v)
+        prev = t
+    return "".join(parts)
+
+
+def translate_to_duckdb(sql: str) -> str:
+    """MSSQL SELECT → DuckDB SQL; güvenle çevrilemezse ``Untranslatable``."""
+    toks = tokenize(sql)
+    while toks and toks[-1].value == ";":
+        toks.pop()
+    if not toks:
+        raise Untranslatable("Boş SQL.")
+    return _render(_tx(toks)) + ";"
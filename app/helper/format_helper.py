@@ -0,0 +1,82 @@
+"""
+format_helper.py – /ask sonuç biçimleri (rows / columnar / arrow)
+
+  rows      [{kolon: değer, …}, …]  – eski biçim, satır başına bir dict
+  columnar  {"columns": [...], "data": [[kolon 1 değerleri], …]}
+            – kolon adları bir kez, değerler kolon başına dizi
+  arrow     Arrow IPC stream baytları (application/vnd.apache.arrow.stream);
+            yanıtın geri kalanı (sql, süreler …) şema metadata'sında
+            ``nl2sql`` anahtarıyla JSON olarak taşınır.  pyarrow isteğe
+            bağlıdır; kurulu değilse bu biçim hata döner.
+
+Kolon dizileri doğrudan cursor tuple'larından (``zip(*satırlar)``) çıkar;
+arada satır dict'i üretilmez.
+"""
+
+import json, importlib.util
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+__all__ = ["FORMATS", "ARROW_MEDIA_TYPE", "ARROW_META_KEY", "arrow_available",
+           "to_columns", "to_arrow_ipc", "from_arrow_ipc", "to_dataframe"]
+
+FORMATS = ("rows", "columnar", "arrow")
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+ARROW_META_KEY = b"nl2sql"
+
+
+def arrow_available() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
+
+
+def _pa():
+    # isteğe bağlı ve ağır bağımlılık → yalnız arrow istendiğinde yüklenir
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise RuntimeError("arrow biçimi için pyarrow kurulu olmalı (pip install pyarrow)")
+    return pa
+
+
+def to_columns(cols: Sequence[str], raw: Sequence[tuple]) -> List[list]:
+    """Satır tuple'ları → kolon başına liste (satır yoksa boş listeler)."""
+    if not raw:
+        return [[] for _ in cols]
+    return [list(c) for c in zip(*raw)]
+
+
+def _arrow_array(pa, values: list):
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError, TypeError):
+        # karışık tipli kolon (ör. sql_variant) → metin
+        return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+
+def to_arrow_ipc(cols: Sequence[str], data: Sequence[list],
+                 meta: Optional[Dict[str, Any]] = None) -> bytes:
+    pa = _pa()
+    arrays = [_arrow_array(pa, list(v)) for v in data]
+    schema = pa.schema([pa.field(c, a.type) for c, a in zip(cols, arrays)],
+                       metadata={ARROW_META_KEY: json.dumps(meta or {}, ensure_ascii=False,
+                                                            default=str).encode("utf-8")})
+    table = pa.Table.from_arrays(arrays, schema=schema)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def from_arrow_ipc(body: bytes) -> Tuple[Any, Dict[str, Any]]:
+    """Arrow IPC baytları → (pyarrow.Table, yanıt metadata'sı)."""
+    pa = _pa()
+    table = pa.ipc.open_stream(body).read_all()
+    raw = (table.schema.metadata or {}).get(ARROW_META_KEY, b"{}")
+    return table, json.loads(raw)
+
+
+def to_dataframe(columns: Sequence[str], data: Sequence[list]):
+    """Kolon dizilerinden DataFrame (aynı isimli kolonlar da korunur)."""
+    import pandas as pd
+    df = pd.DataFrame({i: v for i, v in enumerate(data)})
+    df.columns = list(columns)
+    return df
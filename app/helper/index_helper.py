@@ -0,0 +1,359 @@
+"""
+index_helper.py – üretilen SQL iş yükünden indeks önerisi
+
+Sorgu logundaki SQL'ler token düzeyinde taranır; her tablo için WHERE /
+ON eşitlik ve aralık koşulları, JOIN eşleşmeleri ve ORDER BY / GROUP BY
+kolonları çıkarılır.  Sorgu başına tablo başına bir aday oluşur:
+
+  eşitlik kolonları (görülme sırasıyla) + ilk aralık kolonu
+  (aralık yoksa aynı tablonun ORDER BY kolonları; eşitlik varsa GROUP BY)
+
+JOIN'in birincil anahtar olmayan tarafı (FK kolonu) ayrıca tek kolonlu
+aday olur.  Aday, sorgunun ``exec_ms``'i ile ağırlıklandırılır (en az
+1 ms; aynı SQL kaç kez çalıştıysa o kadar sayılır).  Başka bir adayın
+öneki olan aday ona katılır; mevcut bir indeksin ya da birincil anahtarın
+öneki olan aday önerilmez.
+
+Fonksiyona sarılmış kolonlar (``YEAR(date_time) = 2025``), ``<>``, ``NOT``
+ve ``LIKE '%x'`` indeks kullanamaz, sayılmaz; HAVING ve SELECT listesi
+yok sayılır.  OR ile bağlanan koşullar ayrı ayrı değerlendirilmez
+(eşitlik kolonları yine tek bileşik adayda toplanır).
+
+``IndexAdvisor.apply`` önerileri oluşturur (SQLite'ta ardından ANALYZE).
+İş yükü verilirse her indeks sırayla doğrulanır: indeksin tablosunu okuyan
+sorgular önce / sonra ``replay`` ile ölçülür, toplam süre en az
+``min_gain`` oranında düşmüyorsa indeks geri alınır.  (Planlayıcı yeni bir
+indeksi GROUP BY sıralaması için seçip tam taramayı rastgele erişime
+çevirebilir; yalnız ölçüm bunu yakalar.)  Komut satırı: app/index_advisor.py.
+"""
+
+import time, hashlib, statistics
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import inspect
+
+from .paging_helper import limit_sql
+from .schema_helper import get_catalog
+from .validator_helper import SQLValidator, Token, tokenize, _unquote
+
+__all__ = ["ColumnUsage", "extract_usage", "IndexAdvisor", "existing_indexes",
+           "index_name", "replay"]
+
+_RANGE_OPS = frozenset(("<", ">", "<=", ">=", "!<", "!>"))
+_REFS = ("ident", "qident")
+# bağlamı değiştiren anahtar kelimeler (parantez seviyesi başına)
+_CLAUSES = {"SELECT": "select", "FROM": "from", "JOIN": "from", "APPLY": "from",
+            "ON": "on", "WHERE": "where", "GROUP": "group", "ORDER": "order",
+            "HAVING": "other", "OPTION": "other", "OFFSET": "other", "FETCH": "other",
+            "LIMIT": "other", "UNION": "select", "EXCEPT": "select", "INTERSECT": "select"}
+
+
+# ───────────────────── Kolon kullanımı ─────────────────────
+@dataclass
+class ColumnUsage:
+    """Bir sorguda bir tablonun kolonları (katalogdaki adlar, görülme sırası)."""
+    eq: List[str] = field(default_factory=list)
+    range: List[str] = field(default_factory=list)
+    join: List[str] = field(default_factory=list)
+    order: List[str] = field(default_factory=list)
+    group: List[str] = field(default_factory=list)
+
+    def add(self, role: str, column: str):
+        cols = getattr(self, role)
+        if column not in cols:
+            cols.append(column)
+
+
+def _ref_at(toks: List[Token], i: int) -> Tuple[Optional[Tuple[Optional[str], str]], int]:
+    """``a`` / ``q.a`` / ``s.q.a`` → ((niteleyici, kolon), sonraki indeks).
+
+    Fonksiyon adıysa (ardından ``(`` geliyorsa) referans None döner.
+    """
+    parts = [_unquote(toks[i])]
+    j = i + 1
+    while j + 1 < len(toks) and toks[j].value == "." and toks[j + 1].kind in _REFS:
+        parts.append(_unquote(toks[j + 1]))
+        j += 2
+    if j < len(toks) and toks[j].value == "(":
+        return None, j
+    return ((parts[-2] if len(parts) > 1 else None), parts[-1]), j
+
+
+def _sargable_like(tok: Optional[Token]) -> bool:
+    v = tok.value if tok is not None and tok.kind == "string" else ""
+    return bool(v) and not v.lstrip("Nn").startswith(("'%", "'_"))
+
+
+def extract_usage(sql: str, validator: SQLValidator) -> Dict[str, ColumnUsage]:
+    """SQL'in tablo başına kolon kullanımı (tablo adları katalogdaki gibi)."""
+    catalog = validator.catalog
+    names = {t.lower(): t for t in catalog.tables()}
+    sources = {k: names.get(v.lower(), v) for k, v in validator.source_tables(sql).items()}
+    tables = set(sources.values())
+
+    def resolve(ref) -> Optional[Tuple[str, str]]:
+        qual, col = ref
+        cands = ([sources[qual.lower()]] if qual is not None and qual.lower() in sources
+                 else [] if qual is not None
+                 else [t for t in tables if catalog.has_column(t, col)])
+        if len(cands) != 1 or not catalog.has_column(cands[0], col):
+            return None
+        table = cands[0]
+        return table, next(c for c in catalog.columns(table) if c.lower() == col.lower())
+
+    usage: Dict[str, ColumnUsage] = {}
+
+    def add(res, role):
+        if res is not None:
+            usage.setdefault(res[0], ColumnUsage()).add(role, res[1])
+
+    toks = tokenize(sql)
+    n = len(toks)
+    stack: List[str] = []
+    clause = "select"
+    i = 0
+    while i < n:
+        t = toks[i]
+        if t.value == "(":
+            stack.append(clause)
+            if i > 0 and toks[i - 1].upper == "OVER":
+                clause = "window"               # PARTITION BY / ORDER BY indeks adayı değil
+            i += 1
+            continue
+        if t.value == ")":
+            clause = stack.pop() if stack else clause
+            i += 1
+            continue
+        if t.kind == "keyword":
+            if clause != "window" and t.upper in _CLAUSES:
+                clause = _CLAUSES[t.upper]
+            i += 1
+            continue
+        if t.kind not in _REFS or clause not in ("where", "on", "group", "order"):
+            i += 1
+            continue
+
+        ref, j = _ref_at(toks, i)
+        if ref is None:
+            i = j
+            continue
+        res = resolve(ref)
+        if clause in ("group", "order"):
+            add(res, clause)
+            i = j
+            continue
+
+        nxt = toks[j] if j < n else None
+        op = nxt.upper if nxt is not None else ""
+        after = toks[j + 1] if j + 1 < n else None
+        if op == "=" and after is not None and after.kind in _REFS:
+            other, k = _ref_at(toks, j + 1)
+            res2 = resolve(other) if other is not None else None
+            if res2 is not None and (k >= n or toks[k].kind != "op"):
+                if res is not None and res2[0] != res[0]:
+                    add(res, "join")
+                    add(res2, "join")
+                i = k
+                continue
+            add(res, "eq")
+        elif op in ("=", "IN", "IS"):
+            add(res, "eq")
+        elif op in _RANGE_OPS or op == "BETWEEN":
+            add(res, "range")
+        elif op == "LIKE":
+            if _sargable_like(after):
+                add(res, "range")
+        elif i > 0 and toks[i - 1].kind == "op" and (j >= n or toks[j].kind != "op"):
+            # literal = kolon  /  5 < kolon
+            prev = toks[i - 1].value
+            if prev == "=":
+                add(res, "eq")
+            elif prev in _RANGE_OPS:
+                add(res, "range")
+        i = j
+    return usage
+
+
+# ───────────────────── Adaylar ─────────────────────
+def _candidates(u: ColumnUsage, max_columns: int) -> List[Tuple[Tuple[str, ...], Dict]]:
+    out = []
+    key = list(u.eq)
+    tail = u.range[:1] or u.order or (u.group if u.eq else [])
+    key += [c for c in tail if c not in key]
+    if key:
+        key = key[:max_columns]
+        roles = {r: [c for c in getattr(u, r) if c in key]
+                 for r in ("eq", "range", "order", "group")}
+        out.append((tuple(key), {r: c for r, c in roles.items() if c}))
+    for c in u.join:
+        if not key or key[0] != c:
+            out.append(((c,), {"join": [c]}))
+    return out
+
+
+def _is_prefix(short: Tuple[str, ...], long: Tuple[str, ...]) -> bool:
+    return len(short) <= len(long) and \
+        all(a.lower() == b.lower() for a, b in zip(short, long))
+
+
+def existing_indexes(engine, tables: Iterable[str]) -> Dict[str, List[Tuple[str, ...]]]:
+    """Tablo → mevcut indekslerin (birincil anahtar dahil) kolon listeleri."""
+    insp = inspect(engine)
+    out: Dict[str, List[Tuple[str, ...]]] = {}
+    for t in tables:
+        cols = []
+        pk = insp.get_pk_constraint(t).get("constrained_columns") or []
+        if pk:
+            cols.append(tuple(pk))
+        for ix in insp.get_indexes(t):
+            names = tuple(c for c in ix.get("column_names") or () if c)
+            if names:
+                cols.append(names)
+        for uq in insp.get_unique_constraints(t):
+            if uq.get("column_names"):
+                cols.append(tuple(uq["column_names"]))
+        out[t] = cols
+    return out
+
+
+def index_name(table: str, columns: Tuple[str, ...]) -> str:
+    name = f"ix_{table}_{'_'.join(columns)}".lower()
+    if len(name) > 60:                  # MSSQL 128, ama okunaklı kalsın
+        digest = hashlib.sha1(name.encode("utf-8")).hexdigest()[:8]
+        name = f"{name[:51]}_{digest}"
+    return name
+
+
+class IndexAdvisor:
+    """İş yükünü ``add`` ile toplar, ``recommend`` sıralı öneri döndürür."""
+
+    MAX_COLUMNS = 3
+
+    def __init__(self, engine, catalog=None):
+        self.engine = engine
+        self.catalog = catalog or get_catalog(engine)
+        self.validator = SQLValidator(self.catalog)
+        self.candidates: Dict[Tuple[str, Tuple[str, ...]], Dict] = {}
+        self.queries = self.skipped = 0
+
+    def add(self, sql: str, exec_ms: Optional[float] = None, count: int = 1):
+        """Bir SQL'i (``count`` kez, ortalama ``exec_ms`` ile çalışmış) ekler."""
+        try:
+            usage = extract_usage(sql, self.validator)
+        except Exception:
+            self.skipped += count
+            return
+        self.queries += count
+        weight = max(float(exec_ms or 0.0), 1.0) * count
+        for table, u in usage.items():
+            for cols, roles in _candidates(u, self.MAX_COLUMNS):
+                c = self.candidates.setdefault((table, cols), {
+                    "score": 0.0, "count": 0, "exec_ms": 0.0, "roles": roles, "example": sql})
+                c["score"] += weight
+                c["count"] += count
+                c["exec_ms"] += float(exec_ms or 0.0) * count
+
+    def recommend(self, *, top: Optional[int] = None, min_count: int = 1) -> List[Dict]:
+        existing = existing_indexes(self.engine, {t for t, _ in self.candidates})
+        kept: List[Dict] = []
+        # uzun adaylar önce: kısa olan öneki olduğu adaya katılır
+        for (table, cols), c in sorted(self.candidates.items(), key=lambda kv: -len(kv[0][1])):
+            if any(_is_prefix(cols, ix) for ix in existing.get(table, ())):
+                continue
+            host = next((k for k in kept
+                         if k["table"] == table and _is_prefix(cols, k["columns"])), None)
+            if host is not None:
+                host["score"] += c["score"]
+                host["count"] += c["count"]
+                host["exec_ms"] += c["exec_ms"]
+                host["covers"].append(list(cols))
+                continue
+            kept.append({"table": table, "columns": cols, "score": c["score"],
+                         "count": c["count"], "exec_ms": c["exec_ms"],
+                         "roles": c["roles"], "covers": [], "example": c["example"]})
+
+        kept = [k for k in kept if k["count"] >= min_count]
+        kept.sort(key=lambda k: -k["score"])
+        for k in kept:
+            k["score"] = round(k["score"], 1)
+            k["exec_ms"] = round(k["exec_ms"], 1)
+            k["name"] = index_name(k["table"], k["columns"])
+            k["ddl"] = self.ddl(k["table"], k["columns"])
+            k["columns"] = list(k["columns"])
+        return kept[:top] if top else kept
+
+    def ddl(self, table: str, columns: Tuple[str, ...]) -> str:
+        q = self.engine.dialect.identifier_preparer.quote
+        return (f"CREATE INDEX {q(index_name(table, columns))} ON {q(table)} "
+                f"({', '.join(q(c) for c in columns)})")
+
+    # ─────────── Uygulama ───────────
+    def _exec(self, sql: str):
+        with self.engine.begin() as conn:
+            conn.exec_driver_sql(sql)
+            if self.engine.dialect.name == "sqlite":
+                conn.exec_driver_sql("ANALYZE")     # planlayıcı indeksi görsün / unutsun
+
+    def _drop(self, r: Dict):
+        q = self.engine.dialect.identifier_preparer.quote
+        on = f" ON {q(r['table'])}" if self.engine.dialect.name == "mssql" else ""
+        self._exec(f"DROP INDEX {q(r['name'])}{on}")
+
+    def apply(self, recommendations: List[Dict], *,
+              workload: Optional[List[Tuple[str, int]]] = None, repeat: int = 3,
+              max_rows: int = 1000, min_gain: float = 0.05) -> List[Dict]:
+        """Önerileri sırayla oluşturur; ``workload`` verilirse her birini doğrular."""
+        out = []
+        for r in recommendations:
+            affected = [(sql, n) for sql, n in workload or ()
+                        if r["table"].lower() in self.validator.referenced_tables(sql)]
+            before = replay(self.engine, affected, repeat=repeat,
+                            max_rows=max_rows) if affected else None
+            t0 = time.perf_counter()
+            try:
+                self._exec(r["ddl"])
+            except Exception as e:
+                out.append({"name": r["name"], "status": "error",
+                            "error": str(e).splitlines()[0]})
+                continue
+            item = {"name": r["name"], "status": "created",
+                    "ms": round((time.perf_counter() - t0) * 1000, 1)}
+            if before is not None:
+                after = replay(self.engine, affected, repeat=repeat, max_rows=max_rows)
+                item.update(before_ms=before["total_ms"], after_ms=after["total_ms"])
+                if after["total_ms"] > before["total_ms"] * (1 - min_gain):
+                    self._drop(r)
+                    item["status"] = "dropped"
+            out.append(item)
+        return out
+
+
+# ───────────────────── Tekrar ─────────────────────
+def replay(engine, workload: List[Tuple[str, int]], *, repeat: int = 3,
+           max_rows: int = 1000) -> Dict:
+    """İş yükünü uygulamadaki gibi (satır sınırıyla) çalıştırıp süreleri ölçer.
+
+    Her SQL bir kez ısınma için, ardından ``repeat`` kez çalışır; medyan
+    süre SQL'in logdaki sayısıyla çarpılarak ``total_ms``'e eklenir.
+    """
+    dialect = engine.dialect.name
+    queries, total, errors = [], 0.0, 0
+    for sql, count in workload:
+        run_sql, _ = limit_sql(sql, dialect, 0, max_rows + 1)
+        lat = []
+        try:
+            with engine.connect() as conn:
+                for k in range(repeat + 1):
+                    t0 = time.perf_counter()
+                    conn.exec_driver_sql(run_sql).fetchall()
+                    if k:
+                        lat.append((time.perf_counter() - t0) * 1000)
+        except Exception as e:
+            errors += 1
+            queries.append({"sql": sql, "count": count, "error": str(e).splitlines()[0]})
+            continue
+        ms = statistics.median(lat)
+        total += ms * count
+        queries.append({"sql": sql, "count": count, "ms": round(ms, 3)})
+    return {"total_ms": round(total, 1), "queries": queries, "errors": errors}
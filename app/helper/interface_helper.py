@@ -1,7 +1,12 @@
 import gradio as gr
 import pandas as pd
 import requests
-from typing import List, Dict, Any
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import json, os, threading
+from typing import List, Dict, Any, Optional
+
+from .format_helper import to_dataframe
 
 __all__ = ["QueryUI"]
 
@@ -22,69 +27,193 @@ body {background-color:#f0f8ff;}
 """
 
 
+class _UIRetry(Retry):
+    """POST yalnız sunucu işi başlatmadan reddettiyse (429 / 503) tekrarlanır.
+
+    502 / 504 geldiğinde LLM çağrısı ya da /save_view yazımı çoktan
+    çalışmış olabilir; yeniden göndermek onu ikinci kez çalıştırırdı.
+    """
+
+    POST_RETRY_STATUS = frozenset({429, 503})
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method and method.upper() == "POST" and status_code not in self.POST_RETRY_STATUS:
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
+
 class QueryUI:
-    """Gradio tabanlı arayüz – Chat & VIEW oluşturma sekmeleri (Mavi tema)"""
+    """Gradio tabanlı arayüz – Chat & VIEW oluşturma sekmeleri (Mavi tema)
+
+    Backend'e iki yoldan gidilir:
+      • HTTP  – süreç başına tek keep-alive ``requests.Session`` (havuzlu,
+                bağlantı hatası / 429 / 503 için, GET'te 502 / 504 için de
+                yeniden denemeli)
+      • local – ``local`` verilmişse (aynı süreçteki ``Main``) HTTP'siz,
+                ``local_stream`` / ``local_save_view`` doğrudan çağrılır
+
+    Ortam değişkenleri:
+      UI_CONNECT_TIMEOUT  bağlantı zaman aşımı sn (vars. 5)
+      UI_READ_TIMEOUT     okuma zaman aşımı sn   (vars. 120)
+      UI_RETRIES          yeniden deneme sayısı  (vars. 2)
+      UI_POOL_SIZE        keep-alive bağlantı    (vars. 8)
+    """
 
-    def __init__(self, *, api_host: str = "127.0.0.1", api_port: int = 8000):
+    def __init__(self, *, api_host: str = "127.0.0.1", api_port: int = 8000,
+                 local=None,
+                 connect_timeout: Optional[float] = None,
+                 read_timeout: Optional[float] = None,
+                 retries: Optional[int] = None,
+                 pool_size: Optional[int] = None):
         self.api_host = api_host
         self.api_port = api_port
+        self.local = local
+        self.connect_timeout = connect_timeout or float(os.getenv("UI_CONNECT_TIMEOUT", "5"))
+        self.read_timeout = read_timeout or float(os.getenv("UI_READ_TIMEOUT", "120"))
+        self.retries = retries if retries is not None else int(os.getenv("UI_RETRIES", "2"))
+        self.pool_size = pool_size or int(os.getenv("UI_POOL_SIZE", "8"))
+        self._session: Optional[requests.Session] = None
+        self._session_lock = threading.Lock()
 
     # ───────────────────────── Yardımcı Fonksiyonlar ──────────────────────────
     @staticmethod
-    def _rows_to_md(rows: List[Dict[str, Any]], max_rows: int = 100) -> str:
-        if not rows:
+    def _rows_to_md(df: pd.DataFrame, max_rows: int = 100) -> str:
+        if df.empty:
             return "(sonuç yok)"
-        df = pd.DataFrame(rows).head(max_rows)
-        return df.to_markdown(index=False)
+        return df.head(max_rows).to_markdown(index=False)
+
+    @property
+    def session(self) -> requests.Session:
+        """Gradio handler thread'lerinin paylaştığı keep-alive oturumu."""
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    # okuma hatası ve POST'ta 502/504 yeniden denenmez → LLM çağrısı
+                    # iki kez yapılmaz (bkz. _UIRetry)
+                    retry = _UIRetry(total=self.retries, connect=self.retries, read=0,
+                                  status=self.retries, backoff_factor=0.5,
+                                  status_forcelist=(429, 502, 503, 504),
+                                  allowed_methods=frozenset({"GET", "POST"}),
+                                  raise_on_status=False)
+                    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size,
+                                          max_retries=retry)
+                    s = requests.Session()
+                    s.mount("http://", adapter)
+                    s.mount("https://", adapter)
+                    self._session = s
+        return self._session
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+            self._session = None
 
-    def _post(self, path: str, payload: Dict[str, Any], *, timeout: int = 120):
+    def _timeout(self, read: Optional[float] = None):
+        return (self.connect_timeout, read or self.read_timeout)
+
+    def _post(self, path: str, payload: Dict[str, Any], *, timeout: Optional[float] = None):
         url = f"http://{self.api_host}:{self.api_port}{path}"
-        return requests.post(url, json=payload, timeout=timeout)
+        return self.session.post(url, json=payload, timeout=self._timeout(timeout))
+
+    def _stream(self, path: str, payload: Dict[str, Any], *, timeout: Optional[float] = None):
+        """NDJSON akışını satır satır olay sözlüğü olarak döndürür"""
+        if self.local is not None:
+            yield from self.local.local_stream(payload)
+            return
+        url = f"http://{self.api_host}:{self.api_port}{path}"
+        with self.session.post(url, json=payload, timeout=self._timeout(timeout),
+                               stream=True) as resp:
+            if resp.status_code != 200:
+                yield {"event": "error",
+                       "error": f"Sunucu HTTP {resp.status_code}: {resp.text[:300]}"}
+                return
+            for line in resp.iter_lines(decode_unicode=True):
+                if line:
+                    yield json.loads(line)
 
     # ───────────────────────── Event Handler'lar ──────────────────────────
-    def _talk(self, history: List, question: str, set_id: int, sql_code_md, table_df):
-        """Sohbet düğmesine basıldığında çalışır"""
+    @staticmethod
+    def _session_id(request: Optional[gr.Request]) -> Optional[str]:
+        # tarayıcı oturumu → sunucuda oturum başına son SQL (/save_view)
+        return getattr(request, "session_hash", None)
+
+    def _talk(self, history: List, question: str, set_id: int, sql_code_md, table_df,
+              request: gr.Request = None):
+        """Sohbet düğmesine basıldığında çalışır – /ask/stream olaylarıyla
+        ara durumları (üretilen SQL, gelen satırlar) anında gösterir"""
         question = question.strip()
         if not question:
-            return history, "", sql_code_md
+            yield history, "", sql_code_md, table_df
+            return
+
+        history.append((question, "⏳ SQL üretiliyor…"))
+        yield history, "", sql_code_md, table_df
 
         try:
-            resp = self._post("/ask", {"question": question, "set_id": set_id})
-            if resp.status_code != 200:
-                history.append((question, f"❌ Sunucu HTTP {resp.status_code}: {resp.text[:300]}"))
-                return history, "", sql_code_md
-
-            data = resp.json()
-            if data.get("status") != "success":
-                history.append((question, f"❌ Hata: {data.get('error', 'Bilinmeyen hata')}"))
-                return history, "", sql_code_md
-
-            # Başarılı
-            sql = data["sql"]
-            rows = data.get("rows", [])
-            df = pd.DataFrame(rows) 
-            table_md = self._rows_to_md(rows)
-            answer = (
-                f"**SQL:**\n```sql\n{sql}\n```\n\n" +
-                f"**Sonuç (ilk satırlar):**\n{table_md}\n\n" +
-                f"_LLM {data.get('gen_ms', '?')} ms | SQL {data.get('exec_ms', '?')} ms_"
-            )
-            history.append((question, answer))
-            sql_code_md = gr.update(value=f"```sql\n{sql}\n```", visible=True)
-            
-            table_df = gr.update(value=df, visible=True, interactive=False)
-            return history, "", sql_code_md, table_df
+            # columnar: satırlar kolon dizisi olarak gelir, DataFrame'e doğrudan girer
+            sql_text, cols, data, n_rows, sql = "", [], [], 0, None
+            for ev in self._stream("/ask/stream", {"question": question, "set_id": set_id,
+                                                   "format": "columnar",
+                                                   "session_id": self._session_id(request)}):
+                kind = ev["event"]
+                if kind == "token":
+                    sql_text += ev["text"]
+                    history[-1] = (question, f"⏳ SQL üretiliyor…\n```\n{sql_text}\n```")
+                elif kind == "sql":
+                    sql = ev["sql"]
+                    history[-1] = (question, f"**SQL:**\n```sql\n{sql}\n```\n\n⏳ Doğrulanıyor…")
+                elif kind == "repair":
+                    sql = ev["sql"]
+                    history[-1] = (question, f"**SQL (düzeltildi, deneme {ev['attempt']}):**\n"
+                                             f"```sql\n{sql}\n```\n\n⏳ Doğrulanıyor…")
+                elif kind == "validated":
+                    history[-1] = (question, f"**SQL:**\n```sql\n{sql}\n```\n\n⏳ Çalıştırılıyor…")
+                elif kind == "rows":
+                    if not data:
+                        cols, data = ev["columns"], [[] for _ in ev["columns"]]
+                    for acc, part in zip(data, ev["data"]):
+                        acc.extend(part)
+                    n_rows += len(ev["data"][0]) if ev["data"] else 0
+                    history[-1] = (question, f"**SQL:**\n```sql\n{sql}\n```\n\n"
+                                             f"⏳ {n_rows} satır alındı…")
+                elif kind == "error":
+                    history[-1] = (question, f"❌ Hata: {ev.get('error', 'Bilinmeyen hata')}")
+                    yield history, "", sql_code_md, table_df
+                    return
+                elif kind == "done":
+                    df = to_dataframe(cols, data)
+                    shown = f"{n_rows} satır"
+                    if ev.get("truncated"):
+                        shown += ", satır limiti nedeniyle kesildi"
+                    if ev.get("repairs"):
+                        shown += f", SQL {ev['repairs']} kez otomatik düzeltildi"
+                    answer = (
+                        f"**SQL:**\n```sql\n{sql}\n```\n\n" +
+                        f"**Sonuç ({shown}):**\n{self._rows_to_md(df)}\n\n" +
+                        f"_LLM {ev.get('gen_ms', '?')} ms | SQL {ev.get('exec_ms', '?')} ms"
+                        f" | ilk satır {ev.get('first_row_ms', '?')} ms_"
+                    )
+                    history[-1] = (question, answer)
+                    sql_code_md = gr.update(value=f"```sql\n{sql}\n```", visible=True)
+                    table_df = gr.update(value=df, visible=True, interactive=False)
+                yield history, "", sql_code_md, table_df
         except Exception as e:
-            history.append((question, f"❌ İstemci hatası: {e}"))
-            return history, "", sql_code_md, table_df
+            history[-1] = (question, f"❌ İstemci hatası: {e}")
+            yield history, "", sql_code_md, table_df
 
-    def _save_view(self, view_name: str, set_id: int):
+    def _save_view(self, view_name: str, set_id: int, materialize: bool = False,
+                   request: gr.Request = None):
         view_name = view_name.strip()
         if not view_name:
             return gr.Warning("VIEW adı boş olamaz.")
         try:
-            resp = self._post("/save_view", {"view_name": view_name, "set_id": set_id}, timeout=30)
-            data = resp.json()
+            payload = {"view_name": view_name, "set_id": set_id,
+                       "session_id": self._session_id(request),
+                       "materialize": bool(materialize)}
+            if self.local is not None:
+                data = self.local.local_save_view(payload)
+            else:
+                data = self._post("/save_view", payload, timeout=30).json()
             if data.get("status") == "success":
                 return gr.Success(data["msg"])
             return gr.Warning("❌ " + data.get("msg", "Bilinmeyen hata"))
@@ -125,6 +254,8 @@ class QueryUI:
                     sql_code_md = gr.Markdown(value="", visible=False)
                     view_name_box = gr.Textbox(label="VIEW adı",
                                                placeholder="ör. my_summary_view")
+                    materialize_box = gr.Checkbox(label="Kalıcı (sonuç tabloya yazılır, "
+                                                        "periyodik yenilenir)", value=False)
                     save_btn = gr.Button("VIEW'i Kaydet", variant="secondary")
 
             # Event bağlama
@@ -137,7 +268,7 @@ class QueryUI:
 
             save_btn.click(
                 fn=self._save_view,
-                inputs=[view_name_box, set_sel],
+                inputs=[view_name_box, set_sel, materialize_box],
                 outputs=None,  # modal mesaj döner
             )
 
@@ -0,0 +1,320 @@
+"""
+llm_router_helper.py – LLM çağrılarında hedging + katmanlı yönlendirme
+
+p99'u ara sıra gelen yavaş tamamlamalar belirler.  ``LLMRouter`` NL → SQL
+çağrısını şöyle yürütür:
+
+  katmanlı (LLM_TIERS="gpt-4o-mini,gpt-4o")
+      önce küçük / hızlı dağıtım; dönen SQL doğrulamadan geçmezse bir
+      sonrakine yükseltilir.  Son katmanın SQL'i geçersiz olsa da döner
+      (olağan onarım döngüsü devralır).  Son LLM_STATS_WINDOW çağrıda
+      geçerli SQL oranı LLM_TIER_MIN_VALID'in altındaki katman atlanır;
+      yine de her LLM_TIER_PROBE istekte bir denenir (iyileşirse geri döner).
+  hedging (LLM_HEDGE=1)
+      istek, dağıtımın gözlenen gecikme yüzdeliği (LLM_HEDGE_QUANTILE,
+      vars. p95) kadar sürede bitmezse aynı (ya da LLM_HEDGE_DEPLOYMENT)
+      dağıtıma ikinci istek gider; ilk *geçerli* SQL kazanır, diğeri
+      iptal edilir.  Yeterli örnek yokken LLM_HEDGE_DELAY_MS beklenir.
+      Hedge edilen isteklerin oranı LLM_HEDGE_BUDGET ile sınırlıdır (yük
+      yavaşlığın kendisiyken çağrı sayısını katlamamak için).
+
+Her deneme akışla (stream=True) alınır; iptal edilen deneme HTTP akışını
+ilk parçasında kapatır (ilk token'dan önceki bekleme kesilemez, bkz.
+``LLModel._stream_completion``).  Dağıtım başına gecikme / sonuç
+istatistikleri süreç genelidir (``llm_stats()`` → /stats).  İptal edilen
+denemenin süresi alt sınır olarak örneklere girer; yoksa hedging yavaş
+kuyruğu gizler ve yüzdelik kendi kendine küçülürdü.
+
+Ortam değişkenleri:
+  LLM_TIERS              virgülle sıralı dağıtımlar (vars. yalnız AZURE_DEPLOYMENT_NAME)
+  LLM_HEDGE              1 → açık (vars. 0)
+  LLM_HEDGE_DEPLOYMENT   ikinci isteğin dağıtımı (vars. aynı dağıtım)
+  LLM_HEDGE_QUANTILE     (vars. 0.95)
+  LLM_HEDGE_DELAY_MS     örnek yetersizken gecikme (vars. 2000)
+  LLM_HEDGE_MIN_MS       gecikme alt sınırı (vars. 100)
+  LLM_HEDGE_BUDGET       hedge edilebilecek istek oranı (vars. 0.2)
+  LLM_STATS_WINDOW       dağıtım başına son N deneme (vars. 200)
+  LLM_STATS_MIN_SAMPLES  yüzdelik / oran için en az örnek (vars. 20)
+  LLM_TIER_MIN_VALID     (vars. 0.3)
+  LLM_TIER_PROBE         (vars. 10)
+  LLM_ROUTER_WORKERS     denemeleri yürüten iş parçacığı sayısı (vars. 32)
+"""
+
+import os, time, math, threading, logging, contextlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .concurrency_helper import CancelToken, Cancelled
+from .metrics_helper import StageTimer, LLM_ATTEMPTS, LLM_ROUTING
+
+__all__ = ["LLMRouter", "DeploymentStats", "deployment_stats", "llm_stats", "reset_stats"]
+
+log = logging.getLogger("app.llm")
+
+# raw metin → (sql | None, doğrulama hatası | None)
+Check = Callable[[str], Tuple[Optional[str], Optional[Exception]]]
+
+
+# ───────────────────── Dağıtım istatistikleri ─────────────────────
+class DeploymentStats:
+    """Son N denemenin gecikmesi ve SQL geçerliliği (süreç geneli)."""
+
+    def __init__(self, name: str, window: int):
+        self.name = name
+        self._lat = deque(maxlen=window)        # ms; iptal edilenler alt sınır olarak
+        self._valid = deque(maxlen=window)      # tamamlanan denemenin SQL'i geçerli mi
+        self.calls = self.wins = self.cancelled = self.errors = self.invalid = 0
+        self._lock = threading.Lock()
+
+    def record(self, outcome: str, ms: Optional[float] = None):
+        with self._lock:
+            self.calls += 1
+            if ms is not None:
+                self._lat.append(ms)
+            if outcome in ("ok", "invalid"):
+                self._valid.append(outcome == "ok")
+            if outcome == "invalid":
+                self.invalid += 1
+            elif outcome == "cancelled":
+                self.cancelled += 1
+            elif outcome == "error":
+                self.errors += 1
+
+    def win(self):
+        with self._lock:
+            self.wins += 1
+
+    def quantile(self, q: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            lat = sorted(self._lat)
+        if len(lat) < max(min_samples, 1):
+            return None
+        return lat[min(len(lat) - 1, max(0, math.ceil(q * len(lat)) - 1))]
+
+    def valid_rate(self, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            n = len(self._valid)
+            ok = sum(self._valid)
+        return ok / n if n >= max(min_samples, 1) else None
+
+    def as_dict(self) -> Dict:
+        p50, p95 = self.quantile(0.5), self.quantile(0.95)
+        rate = self.valid_rate()
+        return {"calls": self.calls, "wins": self.wins, "cancelled": self.cancelled,
+                "errors": self.errors, "invalid": self.invalid,
+                "p50_ms": round(p50, 1) if p50 is not None else None,
+                "p95_ms": round(p95, 1) if p95 is not None else None,
+                "valid_rate": round(rate, 3) if rate is not None else None}
+
+
+_STATS: Dict[str, DeploymentStats] = {}
+_STATS_LOCK = threading.Lock()
+_POOL: Optional[ThreadPoolExecutor] = None
+
+
+def deployment_stats(name: str) -> DeploymentStats:
+    with _STATS_LOCK:
+        if name not in _STATS:
+            _STATS[name] = DeploymentStats(name, int(os.getenv("LLM_STATS_WINDOW", "200")))
+        return _STATS[name]
+
+
+def llm_stats() -> Dict[str, Dict]:
+    with _STATS_LOCK:
+        stats = dict(_STATS)
+    return {name: s.as_dict() for name, s in stats.items()}
+
+
+def reset_stats():
+    """Tüm dağıtım istatistiklerini siler (benchmark senaryoları arası)."""
+    with _STATS_LOCK:
+        _STATS.clear()
+
+
+def _pool() -> ThreadPoolExecutor:
+    global _POOL
+    with _STATS_LOCK:
+        if _POOL is None:
+            _POOL = ThreadPoolExecutor(max_workers=int(os.getenv("LLM_ROUTER_WORKERS", "32")),
+                                       thread_name_prefix="llm-router")
+        return _POOL
+
+
+# ───────────────────── Yönlendirici ─────────────────────
+class LLMRouter:
+    """``call(dağıtım, messages, cancel, timer)`` → ham tamamlama metni."""
+
+    def __init__(self, call: Callable, tiers: List[str], *, hedge: bool = False,
+                 hedge_deployment: Optional[str] = None, quantile: float = 0.95,
+                 delay_ms: float = 2000.0, min_delay_ms: float = 100.0,
+                 budget: float = 0.2, min_samples: int = 20, min_valid: float = 0.3,
+                 probe: int = 10):
+        if not tiers:
+            raise ValueError("En az bir dağıtım gerekli")
+        self.call, self.tiers = call, list(tiers)
+        self.hedge, self.hedge_deployment = hedge, hedge_deployment
+        self.quantile, self.delay_ms, self.min_delay_ms = quantile, delay_ms, min_delay_ms
+        self.budget, self.min_samples = budget, min_samples
+        self.min_valid, self.probe = min_valid, max(1, probe)
+        self._lock = threading.Lock()
+        self.requests = self.hedges = self.hedge_wins = self.escalations = self.tier_skips = 0
+
+    @classmethod
+    def from_env(cls, call: Callable, deployment: str) -> Optional["LLMRouter"]:
+        """LLM_TIERS (birden fazla) ya da LLM_HEDGE=1 yoksa None (tek doğrudan çağrı)."""
+        tiers = [t.strip() for t in os.getenv("LLM_TIERS", "").split(",") if t.strip()]
+        hedge = os.getenv("LLM_HEDGE", "0").strip().lower() in ("1", "true", "yes", "on")
+        if not hedge and len(tiers) <= 1:
+            return None
+        return cls(call, tiers or [deployment], hedge=hedge,
+                   hedge_deployment=os.getenv("LLM_HEDGE_DEPLOYMENT") or None,
+                   quantile=float(os.getenv("LLM_HEDGE_QUANTILE", "0.95")),
+                   delay_ms=float(os.getenv("LLM_HEDGE_DELAY_MS", "2000")),
+                   min_delay_ms=float(os.getenv("LLM_HEDGE_MIN_MS", "100")),
+                   budget=float(os.getenv("LLM_HEDGE_BUDGET", "0.2")),
+                   min_samples=int(os.getenv("LLM_STATS_MIN_SAMPLES", "20")),
+                   min_valid=float(os.getenv("LLM_TIER_MIN_VALID", "0.3")),
+                   probe=int(os.getenv("LLM_TIER_PROBE", "10")))
+
+    # ─────────── Politika ───────────
+    def hedge_delay(self, deployment: str) -> float:
+        """Hedge isteği öncesi bekleme (sn): gözlenen yüzdelik ya da varsayılan."""
+        q = deployment_stats(deployment).quantile(self.quantile, self.min_samples)
+        return max(q if q is not None else self.delay_ms, self.min_delay_ms) / 1000
+
+    def _hedge_allowed(self) -> bool:
+        with self._lock:
+            if self.hedges + 1 > self.budget * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+    def _skip(self, deployment: str, n: int) -> bool:
+        rate = deployment_stats(deployment).valid_rate(self.min_samples)
+        return rate is not None and rate < self.min_valid and n % self.probe != 0
+
+    # ─────────── Yürütme ───────────
+    def complete(self, messages: List[dict], check: Check, *,
+                 timer: Optional[StageTimer] = None,
+                 cancel: Optional[CancelToken] = None) -> str:
+        """İlk geçerli SQL'i döndürür; hiçbiri geçerli değilse son katmanınkini."""
+        with self._lock:
+            self.requests += 1
+            n = self.requests
+        last = len(self.tiers) - 1
+        attempts, hedged, used = 0, False, 0
+        sql, err = None, None
+        for tier, deployment in enumerate(self.tiers):
+            if tier < last and self._skip(deployment, n):
+                with self._lock:
+                    self.tier_skips += 1
+                LLM_ROUTING.inc(event="tier_skip", deployment=deployment)
+                continue
+            used = tier
+            sql, err, k, h = self._hedged(deployment, messages, check, timer, cancel)
+            attempts, hedged = attempts + k, hedged or h
+            if err is None:
+                break
+            if tier < last:
+                with self._lock:
+                    self.escalations += 1
+                LLM_ROUTING.inc(event="escalate", deployment=deployment)
+                log.debug("LLM katmanı yükseltiliyor  %s → %s: %s",
+                          deployment, self.tiers[tier + 1], err)
+        if timer is not None:
+            timer.usage["llm_attempts"] = timer.usage.get("llm_attempts", 0) + attempts
+            timer.usage["llm_hedged"] = timer.usage.get("llm_hedged", 0) + int(hedged)
+            timer.usage["llm_tier"] = used
+        if sql is None:
+            raise err
+        return sql
+
+    def _attempt(self, deployment: str, messages: List[dict], check: Check,
+                 token: CancelToken, timer: Optional[StageTimer]):
+        st = deployment_stats(deployment)
+        t0 = time.perf_counter()
+        try:
+            raw = self.call(deployment, messages, token, timer)
+        except Cancelled:
+            st.record("cancelled", (time.perf_counter() - t0) * 1000)
+            LLM_ATTEMPTS.inc(deployment=deployment, outcome="cancelled")
+            raise
+        except Exception:
+            st.record("error")
+            LLM_ATTEMPTS.inc(deployment=deployment, outcome="error")
+            raise
+        ms = (time.perf_counter() - t0) * 1000
+        try:
+            sql, err = check(raw)
+        except ValueError as e:             # SELECT bile yok
+            sql, err = None, e
+        st.record("ok" if err is None else "invalid", ms)
+        if err is not None:
+            LLM_ATTEMPTS.inc(deployment=deployment, outcome="invalid")
+        return sql, err
+
+    def _hedged(self, deployment: str, messages: List[dict], check: Check,
+                timer: Optional[StageTimer], cancel: Optional[CancelToken]):
+        """Tek katman: birincil + (gerekirse) hedge.  → (sql, hata, deneme, hedge?)"""
+        futures: Dict = {}
+        tokens: List[CancelToken] = []
+
+        def launch(dep: str):
+            tok = CancelToken()
+            tokens.append(tok)
+            futures[_pool().submit(self._attempt, dep, messages, check, tok, timer)] = dep
+
+        def stop_all(reason: str):
+            for t in tokens:
+                t.cancel(reason)
+
+        bind = (cancel.bind(lambda: stop_all("istemci bağlantıyı kapattı"))
+                if cancel is not None else contextlib.nullcontext())
+        with bind:
+            launch(deployment)
+            hedge_at = time.monotonic() + self.hedge_delay(deployment) if self.hedge else None
+            pending, hedged, fallback = set(futures), False, None
+            while pending:
+                timeout = max(0.0, hedge_at - time.monotonic()) if hedge_at else None
+                done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+                if not done:
+                    hedge_at = None
+                    if self._hedge_allowed():
+                        hedged = True
+                        LLM_ROUTING.inc(event="hedge", deployment=deployment)
+                        launch(self.hedge_deployment or deployment)
+                        pending = {f for f in futures if not f.done()}
+                    continue
+                for f in done:
+                    exc = f.exception()
+                    if exc is not None:
+                        if cancel is not None and cancel.cancelled:
+                            stop_all("istemci bağlantıyı kapattı")
+                            cancel.raise_if_cancelled()
+                        fallback = fallback or (None, exc)
+                        continue
+                    sql, err = f.result()
+                    if err is not None:
+                        fallback = fallback or (sql, err)
+                        continue
+                    stop_all("hedge: diğer istek önce bitti")
+                    winner = futures[f]
+                    deployment_stats(winner).win()
+                    LLM_ATTEMPTS.inc(deployment=winner, outcome="win")
+                    if hedged and f is not next(iter(futures)):
+                        with self._lock:
+                            self.hedge_wins += 1
+                        LLM_ROUTING.inc(event="hedge_win", deployment=winner)
+                    return sql, None, len(futures), hedged
+        sql, err = fallback
+        return sql, err, len(futures), hedged
+
+    def stats(self) -> Dict:
+        return {"tiers": self.tiers, "hedge": self.hedge,
+                "hedge_deployment": self.hedge_deployment,
+                "requests": self.requests, "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins, "escalations": self.escalations,
+                "tier_skips": self.tier_skips,
+                "hedge_delay_ms": {d: round(self.hedge_delay(d) * 1000, 1)
+                                   for d in self.tiers}}
@@ -0,0 +1,163 @@
+"""
+llm_stub_helper.py – yerel, OpenAI / Azure OpenAI uyumlu LLM stub sunucusu
+
+Gerçek ``openai`` istemcisi (AzureOpenAI dahil) ağ üzerinden bu sunucuya
+yönlendirilebilir; hedging / katmanlı yönlendirme Azure kimlik bilgisi
+olmadan uçtan uca denenir:
+
+  stub = StubLLMServer({"small": StubProfile(latency_ms=120, invalid_p=0.2),
+                        "large": StubProfile(latency_ms=300)}, sqls).start()
+  os.environ["AZURE_OPENAI_ENDPOINT"] = stub.url     # KEY herhangi bir değer
+
+Dağıtım başına profil: gecikme (± jitter), ``slow_p`` olasılıkla
+``slow_x`` kat yavaş yanıt (kuyruk gecikmesi), ``invalid_p`` olasılıkla
+şemada olmayan SQL.  Gecikmenin %20'si ilk token'a kadar, kalanı
+parçalara yayılır; istemci akışı erken kapatırsa bir sonraki yazma
+başarısız olur ve ``cancelled`` sayılır.  Yanıtlanan SQL son kullanıcı
+mesajının özetine göre ``sqls`` içinden seçilir (aynı soru → aynı SQL).
+``stream_options.include_usage`` istenirse OpenAI gibi son parçada
+(``choices`` boş) token sayıları gönderilir.
+
+Yollar: ``/openai/deployments/<dağıtım>/chat/completions`` (Azure) ve
+``/v1/chat/completions`` (dağıtım = gövdedeki ``model``).
+"""
+
+import json, time, random, hashlib, threading
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+__all__ = ["StubProfile", "StubLLMServer"]
+
+INVALID_SQL = "SELECT X.NoSuchColumn FROM NoSuchTable X;"
+
+
+@dataclass
+class StubProfile:
+    latency_ms: float = 300.0
+    jitter_ms: float = 50.0
+    slow_p: float = 0.0
+    slow_x: float = 10.0
+    invalid_p: float = 0.0
+    chunk_chars: int = 16
+
+
+class StubLLMServer:
+    """Arka planda çalışan ThreadingHTTPServer; ``stats`` dağıtım başına sayaçlar."""
+
+    def __init__(self, profiles: Dict[str, StubProfile], sqls: List[str], *,
+                 host: str = "127.0.0.1", port: int = 0, seed: int = 42):
+        self.profiles, self.sqls = profiles, sqls
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Dict[str, int]] = {}
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *_):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                parts = self.path.split("?")[0].strip("/").split("/")
+                deployment = (parts[2] if len(parts) > 3 and parts[:2] == ["openai", "deployments"]
+                              else body.get("model"))
+                if deployment not in stub.profiles:
+                    self.send_error(404, f"deployment {deployment} yok")
+                    return
+                stub._serve(self, deployment, body)
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubLLMServer":
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name="llm-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _count(self, deployment: str, key: str):
+        with self._lock:
+            d = self.stats.setdefault(deployment, {"requests": 0, "completed": 0,
+                                                   "cancelled": 0, "invalid": 0, "slow": 0})
+            d[key] += 1
+
+    # ─────────── Yanıt ───────────
+    def _plan(self, p: StubProfile, messages: List[dict]):
+        with self._lock:
+            latency = max(1.0, p.latency_ms + self._rng.uniform(-p.jitter_ms, p.jitter_ms))
+            slow = self._rng.random() < p.slow_p
+            invalid = self._rng.random() < p.invalid_p
+        text = messages[-1]["content"] if messages else ""
+        h = int(hashlib.md5(text.encode("utf-8")).hexdigest(), 16)
+        sql = INVALID_SQL if invalid else self.sqls[h % len(self.sqls)]
+        return latency * (p.slow_x if slow else 1.0) / 1000, slow, invalid, f"```sql\n{sql}\n```"
+
+    def _serve(self, req: BaseHTTPRequestHandler, deployment: str, body: Dict):
+        p = self.profiles[deployment]
+        self._count(deployment, "requests")
+        seconds, slow, invalid, content = self._plan(p, body.get("messages") or [])
+        if slow:
+            self._count(deployment, "slow")
+        base = {"id": "stub", "created": int(time.time()), "model": deployment}
+        prompt = sum(len(m.get("content") or "") for m in body.get("messages") or []) // 4
+        usage = {"prompt_tokens": prompt, "completion_tokens": len(content) // 4,
+                 "total_tokens": prompt + len(content) // 4}
+
+        if not body.get("stream"):
+            time.sleep(seconds)
+            data = json.dumps({**base, "object": "chat.completion", "usage": usage, "choices": [
+                {"index": 0, "finish_reason": "stop",
+                 "message": {"role": "assistant", "content": content}}]}).encode()
+            req.send_response(200)
+            req.send_header("Content-Type", "application/json")
+            req.send_header("Content-Length", str(len(data)))
+            req.end_headers()
+            req.wfile.write(data)
+            self._count(deployment, "completed")
+            if invalid:
+                self._count(deployment, "invalid")
+            return
+
+        pieces = [content[i:i + p.chunk_chars] for i in range(0, len(content), p.chunk_chars)]
+        gap = seconds * 0.8 / max(len(pieces), 1)
+        try:
+            req.send_response(200)
+            req.send_header("Content-Type", "text/event-stream")
+            req.send_header("Connection", "close")
+            req.end_headers()
+            req.wfile.flush()
+            time.sleep(seconds * 0.2)               # ilk token'a kadar
+            for i, piece in enumerate(pieces):
+                if i:
+                    time.sleep(gap)
+                chunk = {**base, "object": "chat.completion.chunk", "choices": [
+                    {"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                req.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                req.wfile.flush()
+            time.sleep(gap)
+            end = {**base, "object": "chat.completion.chunk", "choices": [
+                {"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            tail = f"data: {json.dumps(end)}\n\n"
+            if (body.get("stream_options") or {}).get("include_usage"):
+                usage_chunk = {**base, "object": "chat.completion.chunk",
+                               "choices": [], "usage": usage}
+                tail += f"data: {json.dumps(usage_chunk)}\n\n"
+            req.wfile.write(f"{tail}data: [DONE]\n\n".encode())
+            req.wfile.flush()
+        except OSError:                         # istemci akışı kapattı (hedge kaybedeni)
+            self._count(deployment, "cancelled")
+            return
+        self._count(deployment, "completed")
+        if invalid:
+            self._count(deployment, "invalid")
@@ -1,62 +1,252 @@
 import json
 from datetime import datetime
-import os
+import os, queue, threading, time, contextlib
+from typing import Dict, Iterator, List
+
+_STOP = object()
+
+
+def iter_logs(path):
+    """
+    Log dosyasındaki kayıtları sırayla döndürür
+
+    Hem yeni JSON-Lines biçimini hem de eski tek JSON dizisi
+    (``[ {...}, {...} ]``) biçimini okur.
+
+    Args:
+        path (str): Log dosyası
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        head = f.read(1)
+        while head and head.isspace():
+            head = f.read(1)
+        f.seek(0)
+        if head == '[':
+            yield from json.load(f)
+            return
+        for line in f:
+            line = line.strip()
+            if line:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue            # yarım yazılmış son satır
+
 
 class LogManager:
-    def __init__(self, log_file="query_logs.json"):
+    """
+    Sorgu logu – yalnız ekleme yapan JSON-Lines dosyası
+
+    ``log_interaction`` kaydı sınırlı bir kuyruğa bırakır ve hemen döner;
+    arka plandaki yazıcı thread kayıtları toplu halde dosyaya ekler.
+    Dosya boyut ya da süre sınırını aşınca ``.1``, ``.2`` … olarak döndürülür.
+    Aynı dosyaya birden çok süreç (uvicorn worker'ları) yazabilir; döndürme
+    ``<log>.lock`` kilit dosyasıyla tek sürece bırakılır, kilidi alamayan
+    süreç bu turu atlar ve eklemeye devam eder.
+    """
+
+    LOCK_TTL = 30.0     # sn; daha eski kilit çöken bir süreçten kalmıştır
+
+    def __init__(self, log_file="query_logs.jsonl", *,
+                 legacy_file="query_logs.json",
+                 max_queue=10000,
+                 batch_size=100,
+                 flush_interval=1.0,
+                 max_bytes=50 * 1024 * 1024,
+                 rotate_interval=None,
+                 backups=5):
         self.log_file = log_file
-        self._ensure_log_file_exists()
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_interval = rotate_interval
+        self.backups = backups
+        self.dropped = 0
+
+        self._migrate_legacy(legacy_file)
+        self._opened_at = time.time()
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._writer = threading.Thread(target=self._run, name="query-log", daemon=True)
+        self._writer.start()
 
-    def _ensure_log_file_exists(self):
-        """Log dosyasının varlığını kontrol eder ve yoksa oluşturur"""
-        if not os.path.exists(self.log_file):
-            with open(self.log_file, 'w', encoding='utf-8') as f:
-                json.dump([], f)
+    # ───────────────────────── Eski biçim ──────────────────────────
+    def _migrate_legacy(self, legacy_file):
+        """Eski JSON dizisi log dosyasını bir kereliğine JSON-Lines'a çevirir"""
+        if not legacy_file or not os.path.exists(legacy_file) or os.path.exists(self.log_file):
+            return
+        try:
+            with open(self.log_file, 'w', encoding='utf-8') as out:
+                for entry in iter_logs(legacy_file):
+                    out.write(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+            os.replace(legacy_file, legacy_file + ".migrated")
+        except Exception as e:
+            print(f"Log taşıma hatası: {str(e)}")
 
+    # ───────────────────────── Yazma ──────────────────────────
     def log_interaction(self, query, response):
         """
-        Kullanıcı sorusu ve sistem cevabını loglar
-        
+        Kullanıcı sorusu ve sistem cevabını loglar (bloklamaz)
+
         Args:
             query (str): Kullanıcının sorduğu soru
             response (dict/str): Sistemin verdiği cevap
         """
+        log_entry = {
+            "timestamp": datetime.now().isoformat(),
+            "query": query,
+            "response": response
+        }
         try:
-            # Mevcut logları oku
-            with open(self.log_file, 'r', encoding='utf-8') as f:
-                logs = json.load(f)
+            self._queue.put_nowait(log_entry)
+        except queue.Full:
+            # istek yolunu asla bekletme; kaybı say
+            self.dropped += 1
 
-            # Yeni log kaydı
-            log_entry = {
-                "timestamp": datetime.now().isoformat(),
-                "query": query,
-                "response": response
-            }
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            batch, stop = [], first is _STOP
+            if not stop:
+                batch.append(first)
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                else:
+                    batch.append(item)
 
-            # Logları güncelle
-            logs.append(log_entry)
-
-            # Güncellenmiş logları kaydet
-            with open(self.log_file, 'w', encoding='utf-8') as f:
-                json.dump(logs, f, ensure_ascii=False, indent=2)
+            if batch:
+                self._write(batch)
+            for _ in range(len(batch) + stop):
+                self._queue.task_done()
+            if stop:
+                return
 
+    def _write(self, batch):
+        try:
+            self._maybe_rotate()
+            lines = "".join(json.dumps(e, ensure_ascii=False, default=str) + "\n" for e in batch)
+            with open(self.log_file, 'a', encoding='utf-8') as f:
+                f.write(lines)
         except Exception as e:
             print(f"Loglama hatası: {str(e)}")
 
+    def _needs_rotation(self) -> bool:
+        size = os.path.getsize(self.log_file) if os.path.exists(self.log_file) else 0
+        too_old = (self.rotate_interval is not None and
+                   time.time() - self._opened_at >= self.rotate_interval)
+        return size > 0 and (size >= self.max_bytes or too_old)
+
+    def _acquire(self) -> bool:
+        path = f"{self.log_file}.lock"
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    stale = time.time() - os.path.getmtime(path) > self.LOCK_TTL
+                except OSError:
+                    stale = True        # bu arada silindi
+                if not stale:
+                    return False
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+                continue
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            return True
+        return False
+
+    def _release(self):
+        with contextlib.suppress(OSError):
+            os.remove(f"{self.log_file}.lock")
+
+    def _maybe_rotate(self):
+        if not self._needs_rotation() or not self._acquire():
+            return
+        try:
+            # kilit beklenirken başka bir worker döndürmüş olabilir
+            backup = f"{self.log_file}.1"
+            if os.path.exists(backup) and os.path.getmtime(backup) > self._opened_at:
+                self._opened_at = os.path.getmtime(backup)
+            if not self._needs_rotation():
+                return
+            for i in range(self.backups - 1, 0, -1):
+                src = f"{self.log_file}.{i}"
+                if os.path.exists(src):
+                    os.replace(src, f"{self.log_file}.{i + 1}")
+            if self.backups > 0:
+                os.replace(self.log_file, backup)
+            else:
+                os.remove(self.log_file)
+            self._opened_at = time.time()
+        finally:
+            self._release()
+
+    def flush(self):
+        """Kuyruktaki tüm kayıtlar diske yazılana kadar bekler"""
+        self._queue.join()
+
+    def close(self):
+        """Kalan kayıtları yazar ve yazıcı thread'i durdurur"""
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join()
+
+    # ───────────────────────── Okuma ──────────────────────────
+    def _tail(self, path, limit) -> List[Dict]:
+        """Dosyanın sonundan geriye doğru okuyup son ``limit`` kaydı döndürür"""
+        block, data = 8192, b""
+        with open(path, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            pos = f.tell()
+            while pos > 0 and data.count(b"\n") <= limit:
+                step = min(block, pos)
+                pos -= step
+                f.seek(pos)
+                data = f.read(step) + data
+        entries = []
+        for line in data.splitlines()[-(limit + 1):]:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue            # kesilmiş ilk satır / yarım son satır
+        return entries[-limit:]
+
     def get_recent_logs(self, limit=10):
         """
-        Son log kayıtlarını getirir
-        
+        Son log kayıtlarını getirir (dosyanın tamamını okumadan)
+
         Args:
             limit (int): Getirilecek log sayısı
-            
+
         Returns:
             list: Son log kayıtları
         """
+        logs: List[Dict] = []
         try:
-            with open(self.log_file, 'r', encoding='utf-8') as f:
-                logs = json.load(f)
-            return logs[-limit:]
+            paths = [self.log_file] + [f"{self.log_file}.{i}" for i in range(1, self.backups + 1)]
+            for path in paths:
+                if len(logs) >= limit:
+                    break
+                if os.path.exists(path):
+                    logs = self._tail(path, limit - len(logs)) + logs
+            return logs
         except Exception as e:
             print(f"Log okuma hatası: {str(e)}")
-            return [] 
\ No newline at end of file
+            return logs
+
+    def iter_all(self) -> Iterator[Dict]:
+        """Döndürülmüş dosyalar dahil tüm kayıtları eskiden yeniye döndürür"""
+        for i in range(self.backups, 0, -1):
+            path = f"{self.log_file}.{i}"
+            if os.path.exists(path):
+                yield from iter_logs(path)
+        if os.path.exists(self.log_file):
+            yield from iter_logs(self.log_file)
@@ -0,0 +1,392 @@
+"""
+matview_helper.py – /save_view için kalıcı (materialized) görünümler
+
+``materialize=True`` ile kaydedilen görünümün sonucu gerçek bir tabloya
+yazılır; kayıtlar aynı veritabanındaki ``nl2sql_matviews`` tablosunda
+tutulur (tüm worker'lar aynı kaydı görür).
+
+Yenileme su seviyesiyle (``date_time``) yapılır:
+  append     tek kaynak tablo, satır bazlı sorgu (GROUP BY / DISTINCT /
+             TOP / pencere / toplama / GETDATE() yok) ve çıktıda su
+             seviyesi kolonu varsa yalnız ``önceki < date_time <= yeni``
+             satırlar eklenir
+  full       diğer sorgular tek işlemde (DELETE + INSERT) yeniden yazılır;
+             ama yalnız kaynak tabloların MAX(date_time)'ı değiştiyse
+  unchanged  su seviyesi aynı → DB'ye yazılmaz
+
+Su seviyesi yalnız yeni satırları görür; kaynakta güncellenen / silinen
+satırlar için ``refresh(ad, full=True)`` (POST /matviews/{ad}/refresh?full=1)
+kullanılmalıdır.  Aynı görünümü iki worker aynı anda yenilemesin diye
+kayıt satırı ``claimed_until`` ile sahiplenilir.
+
+/ask, kanonik SQL'i (en dış ORDER BY hariç) kayıtlı bir görünümle aynı
+olan sorguyu ``SELECT * FROM <görünüm>`` ile yanıtlar (bkz. ``route``).
+
+Ortam değişkenleri:
+  MATVIEW_REFRESH_INTERVAL  varsayılan periyodik yenileme sn (vars. 300, 0 → yalnız elle)
+  MATVIEW_WATERMARK_COLUMN  (vars. date_time)
+  MATVIEW_SYNC_INTERVAL     kayıt tablosunun yeniden okunma aralığı sn (vars. 5)
+  MATVIEW_ROUTE             0 → /ask kalıcı kopyaya yönlendirilmez (vars. 1)
+"""
+
+import os, re, json, time, threading, logging
+from dataclasses import dataclass, asdict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import (MetaData, Table, Column, String, Integer, Float, Text,
+                        select, insert, update, delete, inspect, or_, text)
+
+from .paging_helper import strip_order_by, order_by_clause, split_with
+from .validator_helper import canonical_sql
+from .schema_helper import get_catalog
+from .metrics_helper import MATVIEW_REFRESH_SECONDS
+
+__all__ = ["MatView", "MatViewManager", "get_matviews", "all_matviews", "REGISTRY_TABLE"]
+
+log = logging.getLogger("app.matview")
+
+REGISTRY_TABLE = "nl2sql_matviews"
+
+_meta = MetaData()
+_registry = Table(
+    REGISTRY_TABLE, _meta,
+    Column("name", String(128), primary_key=True),
+    Column("set_id", Integer, nullable=False),
+    Column("sql", Text, nullable=False),
+    Column("canonical", Text, nullable=False),
+    Column("mode", String(16), nullable=False),            # append | full
+    Column("sources", Text, nullable=False),               # JSON: su seviyeli kaynak tablolar
+    Column("watermark", Text),                             # JSON: tablo → son MAX(date_time)
+    Column("interval_s", Float, nullable=False),
+    Column("status", String(16), nullable=False),          # ready | error
+    Column("error", Text),
+    Column("rows", Integer),
+    Column("last_rows", Integer),                          # son yenilemede yazılan satır
+    Column("last_mode", String(16)),                       # append | full | unchanged
+    Column("last_refresh_at", Float),
+    Column("last_refresh_ms", Float),
+    Column("refreshes", Integer, nullable=False),
+    Column("claimed_until", Float),
+    Column("created_at", Float, nullable=False),
+)
+
+# satır bazlı olmayan ya da zamana bağlı sorgular artımlı eklenemez
+_NOT_APPENDABLE_RE = re.compile(
+    r"(?i)\b(group\s+by|distinct|top|limit|offset|fetch|union|except|intersect|over|"
+    r"count|sum|avg|min|max|string_agg|group_concat|"
+    r"getdate|getutcdate|sysdatetime|current_timestamp|current_date|now|random|newid)\b")
+
+
+def _mark_str(v) -> Optional[str]:
+    """MAX(date_time) → karşılaştırılabilir / parametre olarak geçilebilir metin."""
+    if v is None or isinstance(v, str):
+        return v
+    try:
+        return v.isoformat(timespec="milliseconds")       # datetime (MSSQL dil ayarından bağımsız)
+    except TypeError:
+        return v.isoformat()                              # date
+    except AttributeError:
+        return str(v)
+
+
+@dataclass
+class MatView:
+    name: str
+    set_id: int
+    sql: str
+    canonical: str
+    mode: str
+    sources: List[str]
+    watermark: Dict[str, Optional[str]]
+    interval_s: float
+    status: str
+    error: Optional[str] = None
+    rows: Optional[int] = None
+    last_rows: Optional[int] = None
+    last_mode: Optional[str] = None
+    last_refresh_at: Optional[float] = None
+    last_refresh_ms: Optional[float] = None
+    refreshes: int = 0
+    claimed_until: Optional[float] = None
+    created_at: float = 0.0
+
+    @classmethod
+    def from_row(cls, row) -> "MatView":
+        d = dict(row)
+        d["sources"] = json.loads(d["sources"] or "[]")
+        d["watermark"] = json.loads(d["watermark"] or "{}")
+        return cls(**d)
+
+    def due(self, now: float) -> bool:
+        return (self.interval_s > 0 and
+                (self.last_refresh_at is None or now - self.last_refresh_at >= self.interval_s))
+
+    def as_dict(self) -> Dict:
+        d = asdict(self)
+        d.pop("claimed_until")
+        return d
+
+
+class MatViewManager:
+    """Tek engine için kalıcı görünüm kaydı, yenileme ve /ask yönlendirmesi."""
+
+    CLAIM_TTL = 600.0               # yenileme bu sürede bitmezse başka worker devralabilir
+
+    def __init__(self, engine, *, watermark_column: Optional[str] = None,
+                 default_interval: Optional[float] = None,
+                 sync_interval: Optional[float] = None):
+        self.engine = engine
+        self.catalog = get_catalog(engine)
+        self.watermark_column = watermark_column or os.getenv("MATVIEW_WATERMARK_COLUMN",
+                                                              "date_time")
+        self.default_interval = (float(os.getenv("MATVIEW_REFRESH_INTERVAL", "300"))
+                                 if default_interval is None else default_interval)
+        self.sync_interval = (float(os.getenv("MATVIEW_SYNC_INTERVAL", "5"))
+                              if sync_interval is None else sync_interval)
+        self.route_enabled = os.getenv("MATVIEW_ROUTE", "1") != "0"
+
+        self._views: Dict[str, MatView] = {}
+        self._by_canonical: Dict[Tuple[int, str], MatView] = {}
+        self._synced = float("-inf")
+        self._lock = threading.Lock()
+        self.routed = 0
+
+    # ─────────── Yardımcılar ───────────
+    def _q(self, name: str) -> str:
+        return self.engine.dialect.identifier_preparer.quote(name)
+
+    def _wm_column(self, table: str) -> Optional[str]:
+        wm = self.watermark_column.lower()
+        return next((c for c in self.catalog.columns(table) if c.lower() == wm), None)
+
+    def _marks(self, conn, tables: Iterable[str]) -> Dict[str, Optional[str]]:
+        out = {}
+        for t in tables:
+            col = self._wm_column(t)
+            value = conn.execute(text(f"SELECT MAX({self._q(col)}) FROM {self._q(t)}")).scalar()
+            out[t] = _mark_str(value)
+        return out
+
+    def _create_sql(self, table: str, body: str) -> str:
+        if self.engine.dialect.name == "sqlite":
+            return f"CREATE TABLE {self._q(table)} AS {body}"
+        head, main = split_with(body)
+        return f"{head} SELECT * INTO {self._q(table)} FROM ({main}) AS _q".strip()
+
+    def _insert_sql(self, table: str, body: str, where: str = "") -> str:
+        head, main = split_with(body)
+        return f"{head} INSERT INTO {self._q(table)} SELECT * FROM ({main}) AS _q{where}".strip()
+
+    # ─────────── Kayıt tablosu ───────────
+    def reload(self, *, force: bool = False) -> Dict[str, MatView]:
+        """Kayıtları DB'den okur (en fazla ``sync_interval``'da bir)."""
+        now = time.monotonic()
+        if not force and now - self._synced < self.sync_interval:
+            return self._views
+        try:
+            with self.engine.connect() as conn:
+                rows = conn.execute(select(_registry)).mappings().all()
+        except Exception:
+            rows = []                   # kayıt tablosu henüz yok
+        views = {r["name"].lower(): MatView.from_row(r) for r in rows}
+        with self._lock:
+            self._views = views
+            self._by_canonical = {(v.set_id, v.canonical): v for v in views.values()
+                                  if v.status == "ready" and v.rows is not None}
+            self._synced = now
+        return views
+
+    def get(self, name: str) -> Optional[MatView]:
+        return self.reload(force=True).get(name.lower())
+
+    def list(self) -> List[Dict]:
+        return [v.as_dict() for v in self.reload(force=True).values()]
+
+    def _save(self, conn, v: MatView):
+        row = {**asdict(v), "sources": json.dumps(v.sources),
+               "watermark": json.dumps(v.watermark)}
+        conn.execute(delete(_registry).where(_registry.c.name == v.name))
+        conn.execute(insert(_registry).values(**row))
+
+    # ─────────── Oluştur / sil ───────────
+    def create(self, name: str, set_id: int, sql: str, *,
+               tables: Iterable[str], interval: Optional[float] = None) -> MatView:
+        """``sql``'in sonucunu ``name`` tablosuna yazar ve kaydeder.
+
+        ``tables`` sorgunun okuduğu gerçek tablolardır.  Aynı adlı kayıtlı
+        görünüm varsa değiştirilir; kayıtsız bir tablo / görünümle çakışırsa
+        ValueError.
+        """
+        _meta.create_all(self.engine, tables=[_registry], checkfirst=True)
+        existing = self.get(name)
+        insp = inspect(self.engine)
+        is_view = name.lower() in {v.lower() for v in insp.get_view_names()}
+        if existing is None and not is_view and insp.has_table(name):
+            raise ValueError(f"{name} zaten bir tablo; başka bir ad seçin.")
+
+        body = strip_order_by(sql)
+        real = [next((t for t in self.catalog.tables() if t.lower() == s.lower()), s)
+                for s in sorted(tables)]
+        sources = [t for t in real if self._wm_column(t)]
+        wm = self.watermark_column.lower()
+
+        t0 = time.perf_counter()
+        with self.engine.begin() as conn:
+            marks = self._marks(conn, sources)
+            if existing is not None:
+                conn.execute(text(f"DROP TABLE IF EXISTS {self._q(existing.name)}"))
+            if is_view:
+                conn.execute(text(f"DROP VIEW {self._q(name)}"))
+            # üretilen SQL text() ile değil sürücüye doğrudan gider (literal'lerdeki ':' bind sanılmasın)
+            conn.exec_driver_sql(self._create_sql(name, body))
+            cols = [c["name"] for c in inspect(conn).get_columns(name)]
+            out_wm = next((c for c in cols if c.lower() == wm), None)
+            mode = ("append" if len(real) == 1 and len(sources) == 1 and out_wm
+                    and not _NOT_APPENDABLE_RE.search(body) else "full")
+            if mode == "append" and marks[sources[0]] is not None:
+                # okuma ile yazma arasında gelen satırlar bir sonraki yenilemeye kalsın
+                conn.exec_driver_sql(f"DELETE FROM {self._q(name)} WHERE {self._q(out_wm)} > ?",
+                                     (marks[sources[0]],))
+            rows = conn.execute(text(f"SELECT COUNT(*) FROM {self._q(name)}")).scalar()
+            ms = (time.perf_counter() - t0) * 1000
+            v = MatView(name=name, set_id=set_id, sql=sql,
+                        canonical=canonical_sql(body), mode=mode, sources=sources,
+                        watermark=marks,
+                        interval_s=self.default_interval if interval is None else interval,
+                        status="ready", rows=rows, last_rows=rows, last_mode="full",
+                        last_refresh_at=time.time(), last_refresh_ms=round(ms, 1),
+                        refreshes=1, created_at=time.time())
+            self._save(conn, v)
+        MATVIEW_REFRESH_SECONDS.observe(ms / 1000, mode="full")
+        self.reload(force=True)
+        log.info("► Kalıcı görünüm oluşturuldu  %s  mode=%s  rows=%s  %.0f ms",
+                 name, mode, rows, ms)
+        return v
+
+    def drop(self, name: str) -> bool:
+        """Kayıtlı görünümün tablosunu ve kaydını siler (yoksa False)."""
+        v = self.get(name)
+        if v is None:
+            return False
+        with self.engine.begin() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {self._q(v.name)}"))
+            conn.execute(delete(_registry).where(_registry.c.name == v.name))
+        self.reload(force=True)
+        return True
+
+    # ─────────── Yenileme ───────────
+    def _claim(self, name: str) -> bool:
+        now = time.time()
+        with self.engine.begin() as conn:
+            res = conn.execute(update(_registry)
+                               .where(_registry.c.name == name)
+                               .where(or_(_registry.c.claimed_until.is_(None),
+                                          _registry.c.claimed_until < now))
+                               .values(claimed_until=now + self.CLAIM_TTL))
+            return res.rowcount == 1
+
+    def refresh(self, name: str, *, full: bool = False) -> Dict:
+        """Su seviyesine göre append / full / unchanged yenileme.
+
+        → {name, status, mode, added, rows, ms}; başka worker yeniliyorsa
+        ``status="busy"``.
+        """
+        v = self.get(name)
+        if v is None:
+            raise KeyError(name)
+        if not self._claim(v.name):
+            return {"name": v.name, "status": "busy"}
+
+        t0, mode, added = time.perf_counter(), "unchanged", 0
+        values = {"claimed_until": None}
+        try:
+            with self.engine.begin() as conn:
+                marks = self._marks(conn, v.sources)
+                if full or v.status != "ready" or not v.sources:
+                    mode = "full"
+                elif marks != v.watermark:
+                    src = v.sources[0]
+                    lo, hi = v.watermark.get(src), marks.get(src)
+                    mode = "append" if v.mode == "append" and lo is not None else "full"
+
+                if mode == "append":
+                    col = self._q(self._wm_column(src))
+                    added = conn.exec_driver_sql(
+                        self._insert_sql(v.name, strip_order_by(v.sql),
+                                         f" WHERE _q.{col} > ? AND _q.{col} <= ?"),
+                        (lo, hi)).rowcount
+                elif mode == "full":
+                    conn.execute(text(f"DELETE FROM {self._q(v.name)}"))
+                    added = conn.exec_driver_sql(self._insert_sql(v.name,
+                                                                  strip_order_by(v.sql))).rowcount
+                rows = (v.rows if mode == "unchanged" else
+                        conn.execute(text(f"SELECT COUNT(*) FROM {self._q(v.name)}")).scalar())
+            ms = (time.perf_counter() - t0) * 1000
+            values.update(status="ready", error=None, rows=rows, last_rows=added,
+                          last_mode=mode, watermark=json.dumps(marks),
+                          last_refresh_at=time.time(), last_refresh_ms=round(ms, 1),
+                          refreshes=v.refreshes + 1)
+            result = {"name": v.name, "status": "success", "mode": mode, "added": added,
+                      "rows": rows, "ms": round(ms, 1)}
+        except Exception as e:
+            ms = (time.perf_counter() - t0) * 1000
+            values.update(status="error", error=str(e)[:2000], last_refresh_at=time.time())
+            result = {"name": v.name, "status": "error", "error": str(e), "ms": round(ms, 1)}
+            log.warning("✗ Kalıcı görünüm yenilenemedi  %s: %s", v.name, e)
+        finally:
+            with self.engine.begin() as conn:
+                conn.execute(update(_registry).where(_registry.c.name == v.name).values(**values))
+            self.reload(force=True)
+        MATVIEW_REFRESH_SECONDS.observe(ms / 1000, mode=mode)
+        return result
+
+    def refresh_due(self) -> List[Dict]:
+        """Süresi dolan tüm görünümleri yeniler (zamanlayıcı için)."""
+        now = time.time()
+        return [self.refresh(v.name) for v in list(self.reload(force=True).values())
+                if v.due(now)]
+
+    # ─────────── /ask yönlendirmesi ───────────
+    def route(self, set_id: int, sql: str) -> Tuple[str, Optional[str]]:
+        """Kanonik SQL'i kayıtlı bir görünümle aynıysa → (görünüm sorgusu, ad).
+
+        En dıştaki ORDER BY korunur; ``P.kolon`` gibi niteleyiciler atılır
+        (görünüm tablosunda kolonlar çıktı adlarıyla durur).
+        """
+        if not self.route_enabled:
+            return sql, None
+        self.reload()
+        if not self._by_canonical:
+            return sql, None
+        v = self._by_canonical.get((set_id, canonical_sql(strip_order_by(sql))))
+        if v is None:
+            return sql, None
+        order = re.sub(r"(?<![\w'])(?:\w+|\[[^\]]+\])\.(?=[\w\[])", "", order_by_clause(sql))
+        self.routed += 1
+        return f"SELECT * FROM {self._q(v.name)} {order}".rstrip() + ";", v.name
+
+    def stats(self) -> Dict:
+        views = list(self._views.values())
+        return {"views": len(views),
+                "ready": sum(v.status == "ready" for v in views),
+                "errors": sum(v.status == "error" for v in views),
+                "rows": sum(v.rows or 0 for v in views),
+                "routed": self.routed}
+
+
+_MANAGERS: Dict[int, MatViewManager] = {}
+_MANAGERS_LOCK = threading.Lock()
+
+
+def get_matviews(engine) -> MatViewManager:
+    """Engine başına tek yönetici (get_catalog gibi)."""
+    with _MANAGERS_LOCK:
+        if id(engine) not in _MANAGERS:
+            _MANAGERS[id(engine)] = MatViewManager(engine)
+        return _MANAGERS[id(engine)]
+
+
+def all_matviews() -> List[MatViewManager]:
+    """Bu süreçte oluşturulmuş tüm yöneticiler (zamanlayıcı bunları gezer)."""
+    with _MANAGERS_LOCK:
+        return list(_MANAGERS.values())
@@ -0,0 +1,189 @@
+"""
+metrics_helper.py – aşama bazlı süre ölçümü + Prometheus metin çıktısı
+
+``StageTimer`` tek bir isteğin aşamalarını (prompt, LLM, doğrulama, DB …)
+ölçer; her aşama hem istek sonucundaki ``stages`` sözlüğüne hem de süreç
+geneli histograma yazılır.  ``REGISTRY.render()`` /metrics için Prometheus
+"text exposition" biçimini üretir; anlık değerler (önbellek, havuz)
+``register_collector`` ile render sırasında toplanır.
+"""
+
+import time, bisect, threading, contextlib
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+__all__ = ["Counter", "Histogram", "Registry", "REGISTRY", "StageTimer", "stage",
+           "record_usage",
+           "STAGE_SECONDS", "LLM_TOKENS", "PROMPT_TOKENS_SAVED", "REPAIRS", "REPAIR_SECONDS", "REQUESTS",
+           "QUERY_GUARD", "MATVIEW_REFRESH_SECONDS", "REPLICA_QUERIES", "REPLICA_SYNC_SECONDS",
+           "LLM_ATTEMPTS", "LLM_ROUTING"]
+
+LabelKey = Tuple[Tuple[str, str], ...]
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _fmt_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ""
+    body = ",".join(f'{k}="{v.replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+                    for k, v in items)
+    return "{" + body + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        k = _key(labels)
+        with self._lock:
+            self._values[k] = self._values.get(k, 0.0) + amount
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            out += [f"{self.name}{_fmt_labels(k)} {v}" for k, v in self._values.items()]
+        return out
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: Iterable[float] = DEFAULT_BUCKETS):
+        self.name, self.help = name, help
+        self.buckets = tuple(sorted(buckets))
+        self._data: Dict[LabelKey, List] = {}      # [bucket sayaçları, toplam, adet]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        k = _key(labels)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            d = self._data.setdefault(k, [[0] * len(self.buckets), 0.0, 0])
+            if i < len(self.buckets):
+                d[0][i] += 1
+            d[1] += value
+            d[2] += 1
+
+    def render(self) -> List[str]:
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for k, (counts, total, n) in self._data.items():
+                acc = 0
+                for b, c in zip(self.buckets, counts):
+                    acc += c
+                    out.append(f"{self.name}_bucket{_fmt_labels(k, ('le', repr(b)))} {acc}")
+                out.append(f"{self.name}_bucket{_fmt_labels(k, ('le', '+Inf'))} {n}")
+                out.append(f"{self.name}_sum{_fmt_labels(k)} {total}")
+                out.append(f"{self.name}_count{_fmt_labels(k)} {n}")
+        return out
+
+
+# (isim, tür, açıklama, [(etiketler, değer)])
+Sample = Tuple[str, str, str, List[Tuple[Dict[str, object], float]]]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: Dict[str, Callable[[], Iterable[Sample]]] = {}
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, name: str, fn: Callable[[], Iterable[Sample]]):
+        # aynı isimle tekrar kayıt öncekinin yerine geçer (ör. yeni Main örneği)
+        self._collectors[name] = fn
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines += m.render()
+        for fn in list(self._collectors.values()):
+            for name, typ, help, samples in fn():
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {typ}"]
+                lines += [f"{name}{_fmt_labels(_key(lbl))} {val}" for lbl, val in samples]
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "nl2sql_stage_seconds", "Aşama başına süre (prompt, llm, doğrulama, db …)"))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "nl2sql_llm_tokens_total", "LLM token kullanımı (prompt / completion / cached)"))
+PROMPT_TOKENS_SAVED = REGISTRY.register(Counter(
+    "nl2sql_prompt_tokens_saved_total", "DDL budama / bütçe ile gönderilmeyen tahmini token"))
+REPAIRS = REGISTRY.register(Counter(
+    "nl2sql_repairs_total", "Onarım döngüsü sonuçları (success / failed)"))
+REPAIR_SECONDS = REGISTRY.register(Histogram(
+    "nl2sql_repair_added_seconds", "İlk hatadan sonuca kadar onarımın eklediği süre"))
+REQUESTS = REGISTRY.register(Counter(
+    "nl2sql_requests_total", "Endpoint ve sonuç durumuna göre istek sayısı"))
+QUERY_GUARD = REGISTRY.register(Counter(
+    "nl2sql_query_guard_total", "DB sorgusu: maliyetten reddedilen / zaman aşımı / iptal"))
+MATVIEW_REFRESH_SECONDS = REGISTRY.register(Histogram(
+    "nl2sql_matview_refresh_seconds", "Kalıcı görünüm yenileme süresi (append / full / unchanged)"))
+REPLICA_QUERIES = REGISTRY.register(Counter(
+    "nl2sql_replica_queries_total", "Yerel kopyaya yönlendirilen / kaynağa dönen sorgular"))
+REPLICA_SYNC_SECONDS = REGISTRY.register(Histogram(
+    "nl2sql_replica_sync_seconds", "Yerel kopya senkron süresi (tablo başına)"))
+LLM_ATTEMPTS = REGISTRY.register(Counter(
+    "nl2sql_llm_attempts_total", "Dağıtım başına LLM denemesi (win / invalid / cancelled / error)"))
+LLM_ROUTING = REGISTRY.register(Counter(
+    "nl2sql_llm_routing_total", "Hedge / hedge kazancı / katman yükseltme / katman atlama"))
+
+
+class StageTimer:
+    """Tek istek için aşama süreleri (ms) + isteğe bağlı iz (span) listesi."""
+
+    def __init__(self, set_id: Optional[int] = None):
+        self.set_id = set_id
+        self.t0 = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.spans: List[Dict[str, float]] = []
+        self.usage: Dict[str, int] = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, start)
+
+    def add(self, name: str, seconds: float, start: Optional[float] = None):
+        ms = seconds * 1000
+        self.stages[name] = round(self.stages.get(name, 0.0) + ms, 3)
+        if start is not None:
+            self.spans.append({"name": name,
+                               "start_ms": round((start - self.t0) * 1000, 3),
+                               "dur_ms": round(ms, 3)})
+        STAGE_SECONDS.observe(seconds, stage=name, set_id=self.set_id)
+
+
+def record_usage(timer: Optional[StageTimer], usage) -> Dict[str, int]:
+    """OpenAI ``response.usage`` → token sayaçları (+ varsa istek zamanlayıcısı)."""
+    if usage is None:
+        return {}
+    details = getattr(usage, "prompt_tokens_details", None)
+    out = {"prompt": getattr(usage, "prompt_tokens", 0) or 0,
+           "completion": getattr(usage, "completion_tokens", 0) or 0,
+           "cached": getattr(details, "cached_tokens", 0) or 0}
+    set_id = timer.set_id if timer is not None else None
+    for kind, n in out.items():
+        LLM_TOKENS.inc(n, kind=kind, set_id=set_id)
+        if timer is not None:
+            timer.usage[kind] = timer.usage.get(kind, 0) + n
+    return out
+
+
+def stage(timer: Optional[StageTimer], name: str):
+    """``timer`` yoksa hiçbir şey ölçmeyen bağlam."""
+    return timer.stage(name) if timer is not None else contextlib.nullcontext()
@@ -0,0 +1,170 @@
+"""
+paging_helper.py – satır limiti / sayfalama için SQL yardımcıları
+
+Üretilen SELECT'e, güvenli olduğu durumlarda sunucu tarafı limit eklenir:
+  • SQLite / DuckDB : sona ``LIMIT n OFFSET m`` (zaten LIMIT / OFFSET yoksa)
+  • MSSQL   : en dışta ORDER BY varsa ``OFFSET m ROWS FETCH NEXT n ROWS ONLY``,
+              yoksa ve ilk sayfaysa ``SELECT TOP (n)``
+Diğer durumlarda (ör. MSSQL'de zaten OFFSET / TOP varsa) SQL olduğu gibi
+kalır, limit ve offset fetch sırasında uygulanır.  Yorumlar ek yapılmadan
+önce atılır (sondaki ``-- …`` eklenen LIMIT'i yoruma çevirmesin).
+
+Sayfa jetonu (page token) SQL'i ve sıradaki offset'i taşır; HMAC ile
+imzalanır ki istemci başka bir SQL'i jeton içine koyamasın.  Anahtar
+PAGE_TOKEN_SECRET'tan okunur; yoksa süreç başına rastgele üretilir
+(server.py çok worker'da ortak bir anahtarı worker'lara aktarır).
+"""
+
+import os, re, json, hmac, base64, hashlib, secrets
+from typing import Dict, Optional, Tuple
+
+from .validator_helper import strip_comments
+
+__all__ = ["limit_sql", "count_sql", "strip_order_by", "order_by_clause", "split_with",
+           "encode_page_token", "decode_page_token"]
+
+# Çoklu süreçte aynı anahtar paylaşılmalı → PAGE_TOKEN_SECRET
+_SECRET = (os.getenv("PAGE_TOKEN_SECRET") or secrets.token_hex(16)).encode()
+
+_LIMIT_TAIL_RE = re.compile(r"(?i)\blimit\s+\d+(\s*(,|offset)\s*\d+)?\s*$")
+_ORDER_BY_RE   = re.compile(r"(?i)\border\s+by\b")
+_OFFSET_RE     = re.compile(r"(?i)\boffset\s+\d+\s+rows?\b")
+_TOP_RE        = re.compile(r"(?i)\btop\b")
+_SELECT_HEAD   = re.compile(r"(?i)^\s*select(\s+(distinct|all))?\b")
+_COMPOUND_RE   = re.compile(r"(?i)\b(union|except|intersect)\b")
+_MAIN_SELECT   = re.compile(r"(?i)\bselect\b")
+
+
+def _mask(sql: str) -> str:
+    """Parantez ve string literal içini boşlukla örter (uzunluk korunur).
+
+    Böylece düz regex'ler yalnız en dış seviyedeki yapıyı görür.
+    """
+    out, depth, quote = [], 0, None
+    for ch in sql:
+        if quote:
+            out.append(" ")
+            if ch == quote:
+                quote = None
+            continue
+        if ch in ("'", '"', "["):
+            quote = "]" if ch == "[" else ch
+            out.append(" ")
+        elif ch == "(":
+            depth += 1
+            out.append(" ")
+        elif ch == ")":
+            depth = max(0, depth - 1)
+            out.append(" ")
+        else:
+            out.append(" " if depth else ch)
+    return "".join(out)
+
+
+def _strip_semicolon(sql: str) -> str:
+    """Yorumları ve sondaki ``;``'ü atar (ek yapılacak gövde)."""
+    return strip_comments(sql).strip().rstrip(";").rstrip()
+
+
+def limit_sql(sql: str, dialect: str, offset: int, limit: int) -> Tuple[str, bool]:
+    """SQL'e ``limit`` satır (``offset``'ten itibaren) sınırı eklemeye çalışır.
+
+    Returns:
+        (sql, sunucu offset'i uyguladı mı)
+        İkinci değer False ise çağıran taraf ilk ``offset`` satırı kendisi atlamalı.
+    """
+    body = _strip_semicolon(sql)
+    top = _mask(body)
+
+    if dialect in ("sqlite", "duckdb"):
+        if _LIMIT_TAIL_RE.search(top) or _OFFSET_RE.search(top):
+            return sql, False
+        return f"{body} LIMIT {limit} OFFSET {offset};", True
+
+    if dialect == "mssql":
+        if _OFFSET_RE.search(top) or _LIMIT_TAIL_RE.search(top):
+            return sql, False           # TOP, OFFSET … FETCH ile birlikte kullanılamaz
+        order = list(_ORDER_BY_RE.finditer(top))
+        if order and not _TOP_RE.search(top):
+            return f"{body} OFFSET {offset} ROWS FETCH NEXT {limit} ROWS ONLY;", True
+        head = _SELECT_HEAD.match(top)
+        # UNION'da TOP yalnız ilk SELECT'e uygulanır → ekleme
+        if offset == 0 and head and not _TOP_RE.search(top) and not _COMPOUND_RE.search(top):
+            i = head.end()
+            return f"{body[:i]} TOP ({limit}){body[i:]};", True
+
+    return sql, False
+
+
+def strip_order_by(sql: str) -> str:
+    """En dıştaki ORDER BY'ı (ve ``;``) atar; TOP / OFFSET / LIMIT varsa
+    sıralama sonucu belirlediği için dokunmaz."""
+    body = _strip_semicolon(sql)
+    top = _mask(body)
+    if not (_TOP_RE.search(top) or _OFFSET_RE.search(top) or _LIMIT_TAIL_RE.search(top)):
+        order = list(_ORDER_BY_RE.finditer(top))
+        if order:
+            body = body[:order[-1].start()].rstrip()
+    return body
+
+
+def order_by_clause(sql: str) -> str:
+    """En dıştaki ``ORDER BY …`` (OFFSET / LIMIT kısmı hariç); yoksa ""."""
+    body = _strip_semicolon(sql)
+    top = _mask(body)
+    order = list(_ORDER_BY_RE.finditer(top))
+    if not order:
+        return ""
+    start = order[-1].start()
+    tail = re.search(r"(?i)\b(offset|limit)\b", top[start:])
+    end = start + tail.start() if tail else len(body)
+    return body[start:end].rstrip()
+
+
+def split_with(sql: str) -> Tuple[str, str]:
+    """``WITH a AS (…) SELECT …`` → ("WITH a AS (…)", "SELECT …").
+
+    CTE yoksa baş kısım boştur.  MSSQL'de CTE alt sorguya sarılamadığından
+    sarmalayan ifade (INSERT / SELECT INTO) baş kısımdan sonra yazılır.
+    """
+    body = _strip_semicolon(sql)
+    top = _mask(body)
+    if not re.match(r"(?i)^\s*with\b", top):
+        return "", body
+    m = _MAIN_SELECT.search(top)
+    if m is None:
+        return "", body
+    return body[:m.start()].rstrip(), body[m.start():]
+
+
+def count_sql(sql: str, dialect: str) -> Optional[str]:
+    """Toplam satır sayısı için ``COUNT(*)`` sorgusu; mümkün değilse None."""
+    body = _strip_semicolon(sql)
+    if dialect == "mssql" and re.match(r"(?i)^\s*with\b", _mask(body)):
+        return None                 # MSSQL'de CTE alt sorguya sarılamaz
+    return f"SELECT COUNT(*) FROM ({strip_order_by(body)}) AS _q;"
+
+
+# ─────────── Sayfa jetonu ───────────
+def _sign(payload: bytes) -> str:
+    return hmac.new(_SECRET, payload, hashlib.sha256).hexdigest()[:32]
+
+
+def encode_page_token(set_id: int, sql: str, offset: int, limit: int) -> str:
+    payload = json.dumps({"s": set_id, "q": sql, "o": offset, "n": limit},
+                         ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    blob = base64.urlsafe_b64encode(payload).decode().rstrip("=")
+    return f"{blob}.{_sign(payload)}"
+
+
+def decode_page_token(token: str) -> Dict:
+    """Jetonu çözer; imza tutmazsa ValueError."""
+    try:
+        blob, sig = token.rsplit(".", 1)
+        payload = base64.urlsafe_b64decode(blob + "=" * (-len(blob) % 4))
+    except Exception:
+        raise ValueError("Geçersiz sayfa jetonu.")
+    if not hmac.compare_digest(sig, _sign(payload)):
+        raise ValueError("Sayfa jetonu imzası geçersiz.")
+    d = json.loads(payload)
+    return {"set_id": d["s"], "sql": d["q"], "offset": d["o"], "limit": d["n"]}
@@ -0,0 +1,347 @@
+"""
+prompt_helper.py – set başına önceden hazırlanmış prompt + DDL budama + token bütçesi
+
+``PromptBuilder`` kurallar / örnekler / DDL metnini set başına bir kez
+hazırlar; her istekte yalnız soru eklenir.  İki yerleşim vardır:
+
+  cached   sistem + kurallar + örnekler + tam DDL sabit önek, soru en sonda.
+           Önek her istekte bayt bayt aynıdır → sağlayıcı prompt önbelleği
+           (Azure/OpenAI, ≥1024 token) öneki yeniden kullanır.
+  compact  soru ile ilgili tablolar anahtar kelime + kolon adı eşleşmesiyle
+           seçilir, FK grafiğindeki ara tablolar (JOIN yolu) eklenir.  Bütçe
+           aşılırsa sırasıyla kolonlar budanır, sonra örnekler çıkarılır.
+
+``auto`` sabit önek önbellek eşiğini geçiyorsa cached, geçmiyorsa compact
+seçer (budanmış DDL soruya göre değiştiği için ikisi birlikte kullanılamaz).
+Token sayımı ``tiktoken`` kuruluysa onunla, değilse yaklaşık sayımla yapılır.
+
+Ortam değişkenleri:
+  PROMPT_LAYOUT            auto | cached | compact (vars. auto)
+  PROMPT_CACHE_MIN_TOKENS  auto için önbellek eşiği (vars. 1024)
+  PROMPT_TOKEN_BUDGET      compact: istek başına azami prompt token'ı (0 → sınırsız)
+  PROMPT_PRUNE_DDL         compact: 1 → soruyla ilgisiz tabloları çıkar (vars. 1)
+  PROMPT_TOKENIZER         tiktoken kodlaması (vars. cl100k_base)
+"""
+
+import os, re, threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+__all__ = ["PromptBuilder", "PromptBuild", "TableDDL", "parse_ddl", "count_tokens",
+           "fold_words"]
+
+SYSTEM_PROMPT = "You are an expert SQL generator for Microsoft SQL Server."
+SELECT_ONLY   = "Sadece MSSQL SELECT sorgusu yaz."
+
+
+# ───────────────────── Token sayımı ─────────────────────
+_ENCODER = None
+_ENCODER_LOCK = threading.Lock()
+
+
+def _encoder():
+    global _ENCODER
+    if _ENCODER is None:
+        with _ENCODER_LOCK:
+            if _ENCODER is None:
+                try:
+                    import tiktoken
+                    _ENCODER = tiktoken.get_encoding(os.getenv("PROMPT_TOKENIZER", "cl100k_base"))
+                except Exception:
+                    _ENCODER = False        # kurulu değil / indirilemedi → yaklaşık
+    return _ENCODER
+
+
+_APPROX_RE = re.compile(r"\w{1,4}|[^\w\s]", re.U)
+
+
+def count_tokens(text: str) -> int:
+    """tiktoken varsa gerçek, yoksa ~4 karakterlik parça sayısı."""
+    enc = _encoder()
+    if enc:
+        return len(enc.encode(text))
+    return len(_APPROX_RE.findall(text))
+
+
+# ───────────────────── Kelime normalizasyonu ─────────────────────
+_FOLD = str.maketrans("çğıöşüâîûÇĞIİÖŞÜ", "cgiosuaiucgiiosu")
+_CAMEL_RE = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+
+
+def fold_words(text: str) -> List[str]:
+    """Türkçe karakterleri sadeleştirip küçük harfli kelimelere ayırır.
+
+    ``KalanMiktar`` / ``Kalan_miktar`` / ``kalan miktar`` → ["kalan", "miktar"]
+    """
+    text = _CAMEL_RE.sub(" ", text).translate(_FOLD).lower()
+    return [w for w in re.split(r"[^a-z0-9]+", text) if w]
+
+
+def _matches(word: str, keyword: str) -> bool:
+    # Türkçe ekler: "fabrikaların" ~ "fabrika", "makine" ~ "machine" değil
+    if len(keyword) < 3 or len(word) < 3:
+        return word == keyword
+    return word.startswith(keyword) or (len(word) >= 4 and keyword.startswith(word))
+
+
+# ───────────────────── DDL ayrıştırma ─────────────────────
+@dataclass
+class TableDDL:
+    name: str
+    header: str                                   # "CREATE TABLE … ("
+    columns: List[Tuple[str, str]]                # (kolon, tam satır)
+    trailer: List[str]                            # CONSTRAINT / FK satırları + ");"
+    comment: str = ""                             # tablo öncesi "-- …" satırları
+    pk: Set[str] = field(default_factory=set)
+    fks: List[Tuple[str, str, str]] = field(default_factory=list)   # (kolon, ref_tbl, ref_kolon)
+    dates: Set[str] = field(default_factory=set)
+
+    def render(self, keep: Optional[Set[str]] = None) -> str:
+        cols = [line for c, line in self.columns if keep is None or c.lower() in keep]
+        parts = ([self.comment] if self.comment else []) + [self.header] + cols + self.trailer
+        return "\n".join(parts)
+
+
+_TABLE_RE = re.compile(r"((?:^--[^\n]*\n)*)^CREATE\s+TABLE\s+([^\s(]+)\s*\((.*?)^\);",
+                       re.I | re.M | re.S)
+_COL_RE   = re.compile(r"^\s*\[?([A-Za-z_ÇĞİÖŞÜçğıöşü][\wÇĞİÖŞÜçğıöşü]*)\]?\s+([A-Za-z]+)")
+_FK_RE    = re.compile(r"FOREIGN\s+KEY\s*\(\s*\[?(\w+)\]?\s*\)\s*REFERENCES\s+"
+                       r"(?:\[?\w+\]?\.)?\[?(\w+)\]?\s*\(\s*\[?(\w+)\]?\s*\)", re.I)
+
+
+def _bare(name: str) -> str:
+    return name.split(".")[-1].strip("[]")
+
+
+def parse_ddl(ddl: str) -> Dict[str, TableDDL]:
+    """CREATE TABLE bloklarını tablo → (kolonlar, PK, FK) yapısına çevirir."""
+    tables: Dict[str, TableDDL] = {}
+    for m in _TABLE_RE.finditer(ddl):
+        comment, raw_name, body = m.group(1).strip(), m.group(2), m.group(3)
+        name = _bare(raw_name)
+        header = m.group(0)[len(m.group(1)):].split("\n", 1)[0]
+        t = TableDDL(name=name, header=header, columns=[], trailer=[], comment=comment)
+        in_constraint = False
+        for line in body.strip("\n").split("\n"):
+            if not line.strip():
+                continue
+            upper = line.strip().upper()
+            for fk in _FK_RE.finditer(line):
+                t.fks.append((fk.group(1).lower(), fk.group(2).lower(), fk.group(3).lower()))
+            if upper.startswith(("CONSTRAINT", "FOREIGN", "PRIMARY KEY")) or in_constraint:
+                # çok satırlı CONSTRAINT … FOREIGN KEY … bloğu
+                t.trailer.append(line)
+                in_constraint = upper.startswith("CONSTRAINT") and "REFERENCES" not in upper
+                continue
+            cm = _COL_RE.match(line)
+            if not cm:
+                t.trailer.append(line)
+                continue
+            col, typ = cm.group(1), cm.group(2).upper()
+            t.columns.append((col.lower(), line))
+            if "PRIMARY KEY" in upper:
+                t.pk.add(col.lower())
+            if typ in ("DATE", "DATETIME", "DATETIME2", "SMALLDATETIME"):
+                t.dates.add(col.lower())
+        t.trailer.append(");")
+        tables[name.lower()] = t
+    return tables
+
+
+# ───────────────────── Prompt ─────────────────────
+@dataclass
+class PromptBuild:
+    messages: List[dict]
+    report: Dict[str, object]
+
+
+class PromptBuilder:
+    """Bir tablo seti için sabit prompt parçaları + soru başına budama."""
+
+    def __init__(self, *, ddl: str, rules: str = "", examples: str = "",
+                 table_keywords: Optional[Dict[str, Iterable[str]]] = None,
+                 budget: Optional[int] = None, prune: Optional[bool] = None,
+                 layout: Optional[str] = None):
+        self.budget = int(os.getenv("PROMPT_TOKEN_BUDGET", "0")) if budget is None else budget
+        self.prune  = (os.getenv("PROMPT_PRUNE_DDL", "1") == "1") if prune is None else prune
+        layout = (layout or os.getenv("PROMPT_LAYOUT", "auto")).lower()
+        if layout not in ("auto", "cached", "compact"):
+            raise ValueError("PROMPT_LAYOUT auto, cached veya compact olmalı")
+
+        self.full_ddl = ddl.strip()
+        self.tables   = parse_ddl(ddl)
+        self.rules    = rules.strip()
+        self.examples = examples.strip()
+
+        # ─── FK grafiği (yönsüz) → JOIN yolu için ───
+        self.graph: Dict[str, Set[str]] = {t: set() for t in self.tables}
+        for t, info in self.tables.items():
+            for _, ref, _ in info.fks:
+                if ref in self.graph:
+                    self.graph[t].add(ref)
+                    self.graph[ref].add(t)
+
+        # ─── Tablo başına eşleşme kelimeleri ───
+        self.table_words: Dict[str, Set[str]] = {}
+        self.column_words: Dict[str, Dict[str, Set[str]]] = {}
+        for t, info in self.tables.items():
+            words = set(fold_words(info.name))
+            for kw in (table_keywords or {}).get(info.name, ()):
+                words.update(fold_words(kw))
+            self.table_words[t] = words
+            self.column_words[t] = {c: set(fold_words(c)) - {"id"} for c, _ in info.columns}
+
+        # ─── Sabit parçalar bir kez hazırlanır ───
+        self.system_tokens   = count_tokens(SYSTEM_PROMPT)
+        self.rules_tokens    = count_tokens(self.rules)
+        self.examples_tokens = count_tokens(self.examples)
+        self.full_ddl_tokens = count_tokens(self.full_ddl)
+        self._ddl_cache: Dict[Tuple, Tuple[str, int]] = {}
+        self._lock = threading.Lock()
+
+        # ─── Önbelleklenebilir sabit önek (cached yerleşim) ───
+        parts = [SYSTEM_PROMPT, SELECT_ONLY]
+        if self.rules:
+            parts.append(self.rules)
+        if self.examples:
+            parts.append("### KÖTÜ–İYİ ÖRNEKLER (BAD ↔ GOOD)\n" + self.examples)
+        parts.append("### DDL TABLO BLOĞU // BU DDL'E SADIK KALINACAK\n" + self.full_ddl)
+        self.prefix        = "\n\n".join(parts)
+        self.prefix_tokens = count_tokens(self.prefix)
+        min_tokens = int(os.getenv("PROMPT_CACHE_MIN_TOKENS", "1024"))
+        self.layout = (layout if layout != "auto" else
+                       "cached" if self.prefix_tokens >= min_tokens else "compact")
+
+    # ─────────── Tablo / kolon seçimi ───────────
+    def relevant(self, question: str) -> Tuple[List[str], Dict[str, Set[str]]]:
+        """→ (seçilen tablolar, tablo başına soruda geçen kolonlar)"""
+        words = fold_words(question)
+        hits: Set[str] = set()
+        cols: Dict[str, Set[str]] = {}
+        for t in self.tables:
+            if any(_matches(w, k) for w in words for k in self.table_words[t]):
+                hits.add(t)
+            for c, cw in self.column_words[t].items():
+                if cw and any(_matches(w, k) for w in words for k in cw):
+                    cols.setdefault(t, set()).add(c)
+                    hits.add(t)
+        return self._join_closure(hits), cols
+
+    def _join_closure(self, hits: Set[str]) -> List[str]:
+        """Seçilen tablolar arasındaki en kısa FK yollarını da ekler."""
+        keep = set(hits)
+        hits = sorted(hits)
+        for i, a in enumerate(hits):
+            for b in hits[i + 1:]:
+                keep.update(self._path(a, b))
+        # DDL'deki sırayı koru
+        return [t for t in self.tables if t in keep]
+
+    def _path(self, a: str, b: str) -> List[str]:
+        prev, q = {a: None}, deque([a])
+        while q:
+            cur = q.popleft()
+            if cur == b:
+                path = []
+                while cur is not None:
+                    path.append(cur)
+                    cur = prev[cur]
+                return path
+            for nxt in self.graph.get(cur, ()):
+                if nxt not in prev:
+                    prev[nxt] = cur
+                    q.append(nxt)
+        return []
+
+    def _ddl(self, tables: Tuple[str, ...], cols: Optional[Dict[str, Set[str]]]) -> Tuple[str, int]:
+        key = (tables, tuple(sorted((t, tuple(sorted(c))) for t, c in cols.items()))
+               if cols is not None else None)
+        with self._lock:
+            hit = self._ddl_cache.get(key)
+        if hit:
+            return hit
+        blocks = []
+        for t in tables:
+            info = self.tables[t]
+            keep = None
+            if cols is not None:
+                # anahtarlar + tarih kolonları + soruda geçenler her zaman kalır
+                keep = info.pk | {c for c, _, _ in info.fks} | info.dates | cols.get(t, set())
+            blocks.append(info.render(keep))
+        text = "\n\n".join(blocks)
+        out = (text, count_tokens(text))
+        with self._lock:
+            if len(self._ddl_cache) < 512:
+                self._ddl_cache[key] = out
+        return out
+
+    # ─────────── Prompt ───────────
+    def _user_prompt(self, question: str, ddl: str, examples: bool) -> str:
+        parts = [self.rules] if self.rules else []
+        if examples and self.examples:
+            parts.append("### KÖTÜ–İYİ ÖRNEKLER (BAD ↔ GOOD)\n" + self.examples)
+        parts += [SELECT_ONLY,
+                  "### SORU\n" + question,
+                  "### DDL TABLO BLOĞU // BU DDL'E SADIK KALINACAK\n" + ddl,
+                  "SQL:"]
+        return "\n\n".join(parts)
+
+    def build(self, question: str) -> PromptBuild:
+        q_tokens = count_tokens(question)
+        if self.layout == "cached":
+            return self._build_cached(question, q_tokens)
+        fixed = self.system_tokens + self.rules_tokens + q_tokens + 20   # başlıklar
+        full_tokens = fixed + self.examples_tokens + self.full_ddl_tokens
+
+        tables: List[str] = list(self.tables)
+        cols: Dict[str, Set[str]] = {}
+        if self.prune and self.tables:
+            picked, cols = self.relevant(question)
+            if picked:                      # hiçbir eşleşme yoksa tam DDL
+                tables = picked
+        ddl, ddl_tokens = (self._ddl(tuple(tables), None) if len(tables) < len(self.tables)
+                           else (self.full_ddl, self.full_ddl_tokens))
+        examples, col_pruned = True, False
+
+        def total():
+            return fixed + ddl_tokens + (self.examples_tokens if examples else 0)
+
+        if self.budget and total() > self.budget and self.tables:
+            ddl, ddl_tokens = self._ddl(tuple(tables), cols)
+            col_pruned = True
+        if self.budget and total() > self.budget:
+            examples = False
+
+        messages = [{"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "user", "content": self._user_prompt(question, ddl, examples)}]
+        tokens = total()
+        return PromptBuild(messages, {
+            "tokens": tokens,
+            "full_tokens": full_tokens,
+            "saved": full_tokens - tokens,
+            "tables": [self.tables[t].name for t in tables],
+            "columns_pruned": col_pruned,
+            "examples": examples,
+            "budget": self.budget or None,
+            "over_budget": bool(self.budget and tokens > self.budget),
+            "layout": "compact",
+        })
+
+    def _build_cached(self, question: str, q_tokens: int) -> PromptBuild:
+        # önek değişmez; değişken kısım yalnız son kullanıcı mesajı
+        messages = [{"role": "system", "content": self.prefix},
+                    {"role": "user", "content": f"### SORU\n{question}\n\nSQL:"}]
+        tokens = self.prefix_tokens + q_tokens + 8
+        return PromptBuild(messages, {
+            "tokens": tokens,
+            "full_tokens": tokens,
+            "saved": 0,
+            "tables": [t.name for t in self.tables.values()],
+            "columns_pruned": False,
+            "examples": bool(self.examples),
+            "budget": None,
+            "over_budget": False,
+            "layout": "cached",
+            "prefix_tokens": self.prefix_tokens,
+        })
@@ -0,0 +1,444 @@
+"""
+replica_helper.py – zaman serisi setleri için yerel kolonsal kopya (Parquet + DuckDB)
+
+Set 2 / 3 tabloları (Pursu_hammadde_verimleri, Pursu_hat_verileri) yalnız
+eklenen, ``date_time`` anahtarlı zaman serileridir; soruların çoğu tarih
+aralığı üzerinde toplamadır.  Bu modül bu tabloları su seviyesiyle
+(``önceki < date_time <= MAX``) artımlı olarak ay bölümlü Parquet
+dosyalarına kopyalar ve analitik SELECT'leri DuckDB ile bu kopyada çalıştırır.
+
+Dizin düzeni (REPLICA_DIR/<engine özeti>/):
+  <tablo>/_manifest.json                 geçerli dosyalar + su seviyesi
+  <tablo>/month=2025-06/s000042-0.parquet
+  _sync.lock                             tek yazıcı kilidi
+
+Okuyucular yalnız manifest'teki dosyaları görür; manifest ``os.replace``
+ile atomik yazılır, yarım kalan senkronun dosyaları hiç görünmez ve bir
+sonraki senkronda silinir.  Bir ay bölümündeki dosya sayısı
+REPLICA_COMPACT_FILES'ı aşınca bölüm tek dosyada birleştirilir; eski
+dosyalar REPLICA_GRACE sn sonra silinir (o an okuyan sorgular bozulmasın).
+Aynı dizine tek süreç yazar (``_sync.lock``); worker'lar yalnız okur.
+
+Yönlendirme (``route``): sorgunun okuduğu tüm tablolar kopyada, son senkron
+REPLICA_MAX_LAG sn'den yeni, sorgu analitik (GROUP BY / toplama / DISTINCT
+/ pencere; REPLICA_ROUTE=all → tüm SELECT'ler) ve DuckDB'ye çevrilebiliyorsa
+(bkz. dialect_helper).  Kopyada hata olursa sorgu kaynakta çalışır.
+
+Kaynakta güncellenen / silinen satırlar kopyaya yansımaz (tablolar yalnız
+eklenir varsayılır); gerekirse dizin silinip baştan kopyalanır.
+duckdb isteğe bağlıdır (pip install duckdb); kurulu değilse kopya kapalıdır.
+
+Ortam değişkenleri:
+  REPLICA_SETS            kopyası tutulan setler, ör. "2,3" (vars. boş → kapalı)
+  REPLICA_DIR             (vars. ./replica)
+  REPLICA_WATERMARK_COLUMN  (vars. date_time)
+  REPLICA_SYNC_INTERVAL   senkron aralığı sn (vars. 60, 0 → yalnız elle)
+  REPLICA_ROUTE           analytical (vars.) | all | 0
+  REPLICA_MAX_LAG         bu kadar sn senkronlanmamış kopyaya gidilmez (vars. 600)
+  REPLICA_BATCH           senkronda kaynaktan parça başına satır (vars. 200000)
+  REPLICA_COMPACT_FILES   ay bölümü başına dosya sınırı (vars. 16)
+  REPLICA_GRACE           birleştirilen dosyaların silinme gecikmesi sn (vars. 300)
+  REPLICA_THREADS         DuckDB iş parçacığı (vars. DuckDB varsayılanı)
+"""
+
+import os, json, glob, time, hashlib, threading, logging, contextlib, importlib.util
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import inspect, text, types as satypes
+
+from .db_helper import StatementTimeout
+from .dialect_helper import Untranslatable, translate_to_duckdb
+from .matview_helper import _mark_str
+from .metrics_helper import REPLICA_SYNC_SECONDS
+from .schema_helper import get_catalog
+from .validator_helper import tokenize
+
+__all__ = ["Replica", "get_replica", "all_replicas", "replica_available", "replica_sets",
+           "is_analytical"]
+
+log = logging.getLogger("app.replica")
+
+_AGGREGATES = frozenset("COUNT COUNT_BIG SUM AVG MIN MAX STDEV STDEVP VAR VARP "
+                        "STRING_AGG".split())
+
+
+def replica_available() -> bool:
+    return importlib.util.find_spec("duckdb") is not None
+
+
+def replica_sets() -> Set[int]:
+    raw = os.getenv("REPLICA_SETS", "")
+    return {int(x) for x in raw.split(",") if x.strip()}
+
+
+def _duckdb():
+    # isteğe bağlı bağımlılık → yalnız kopya açıkken yüklenir
+    try:
+        import duckdb
+    except ImportError:
+        raise RuntimeError("yerel kopya için duckdb kurulu olmalı (pip install duckdb)")
+    return duckdb
+
+
+def is_analytical(sql: str) -> bool:
+    """GROUP BY / DISTINCT / pencere ya da toplama fonksiyonu içeren sorgu."""
+    toks = tokenize(sql)
+    for i, t in enumerate(toks):
+        if t.kind == "keyword" and t.upper in ("GROUP", "DISTINCT", "OVER"):
+            return True
+        if (t.kind == "ident" and t.upper in _AGGREGATES
+                and i + 1 < len(toks) and toks[i + 1].value == "("):
+            return True
+    return False
+
+
+def _qd(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _lit(value: str) -> str:
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _duck_type(t) -> str:
+    """Kaynak kolon tipi → Parquet'e yazılacak DuckDB tipi."""
+    if isinstance(t, satypes.Boolean):
+        return "BOOLEAN"
+    if isinstance(t, satypes.Integer):
+        return "BIGINT"
+    if isinstance(t, (satypes.Numeric, satypes.Float)):
+        return "DOUBLE"                 # DECIMAL / FLOAT – analitik için yeterli
+    if isinstance(t, satypes.DateTime):
+        return "TIMESTAMP"
+    if isinstance(t, satypes.Date):
+        return "DATE"
+    if isinstance(t, satypes.Time):
+        return "TIME"
+    return "VARCHAR"
+
+
+class Replica:
+    """Engine başına yerel kopya: senkron (tek yazıcı) + DuckDB okuyucu."""
+
+    LOCK_TTL = 3600                     # sn; bundan eski kilit sahipsiz sayılır
+
+    def __init__(self, engine, directory: Optional[str] = None, *,
+                 watermark_column: Optional[str] = None):
+        self.engine = engine
+        self.catalog = get_catalog(engine)
+        base = directory or os.getenv("REPLICA_DIR", "replica")
+        # aynı REPLICA_DIR'i paylaşan farklı veritabanları karışmasın
+        digest = hashlib.sha1(str(engine.url).encode("utf-8")).hexdigest()[:10]
+        self.dir = os.path.abspath(os.path.join(base, digest))
+        self.watermark_column = watermark_column or os.getenv("REPLICA_WATERMARK_COLUMN",
+                                                              "date_time")
+        self.route_mode = os.getenv("REPLICA_ROUTE", "analytical").strip().lower()
+        self.max_lag = float(os.getenv("REPLICA_MAX_LAG", "600"))
+        self.batch = int(os.getenv("REPLICA_BATCH", "200000"))
+        self.compact_files = int(os.getenv("REPLICA_COMPACT_FILES", "16"))
+        self.grace = float(os.getenv("REPLICA_GRACE", "300"))
+        self.threads = int(os.getenv("REPLICA_THREADS", "0"))
+        self.poll = 2.0                 # manifest değişikliği en fazla bu aralıkla kontrol edilir
+
+        self.tables: Dict[str, str] = {}            # küçük harf → gerçek ad
+        self._manifests: Dict[str, Dict] = {}       # okuyucunun gördüğü (görünümü kurulu)
+        self._mtimes: Dict[str, float] = {}
+        self._con = None
+        self._lock = threading.Lock()
+        self._checked = float("-inf")
+        self.last_sync: Dict[str, Dict] = {}
+        self.routed = self.fallbacks = self.untranslatable = 0
+
+    # ─────────── Tablolar / manifest ───────────
+    def track(self, tables: Iterable[str]):
+        """Su seviyesi kolonu olan tabloları kopyaya ekler."""
+        wm = self.watermark_column.lower()
+        for t in tables:
+            if any(c.lower() == wm for c in self.catalog.columns(t)):
+                self.tables.setdefault(t.lower(), t)
+
+    def _tdir(self, table: str) -> str:
+        return os.path.join(self.dir, table)
+
+    def _read_manifest(self, table: str) -> Dict:
+        try:
+            with open(os.path.join(self._tdir(table), "_manifest.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"table": table, "watermark": None, "rows": 0, "seq": 0,
+                    "synced_at": None, "columns": None, "files": [], "retired": []}
+
+    def _write_manifest(self, table: str, m: Dict):
+        path = os.path.join(self._tdir(table), "_manifest.json")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(m, f, ensure_ascii=False)
+        os.replace(tmp, path)           # okuyucular yarım manifest görmez
+
+    # ─────────── Yazıcı kilidi ───────────
+    def _acquire(self) -> bool:
+        os.makedirs(self.dir, exist_ok=True)
+        path = os.path.join(self.dir, "_sync.lock")
+        for _ in range(2):
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                try:
+                    stale = time.time() - os.path.getmtime(path) > self.LOCK_TTL
+                except OSError:
+                    stale = True        # bu arada silindi
+                if not stale:
+                    return False
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+                continue
+            os.write(fd, str(os.getpid()).encode())
+            os.close(fd)
+            return True
+        return False
+
+    def _release(self):
+        with contextlib.suppress(OSError):
+            os.remove(os.path.join(self.dir, "_sync.lock"))
+
+    # ─────────── Senkron ───────────
+    def sync(self) -> List[Dict]:
+        """Tüm tabloları artımlı senkronlar; başka süreç yazıyorsa ``busy``."""
+        if not self.tables:
+            return []
+        if not self._acquire():
+            return [{"status": "busy"}]
+        try:
+            return [self._sync_table(t) for t in list(self.tables.values())]
+        finally:
+            self._release()
+
+    def _columns(self, table: str) -> List[Tuple[str, str]]:
+        return [(c["name"], _duck_type(c["type"]))
+                for c in inspect(self.engine).get_columns(table)]
+
+    def _sync_table(self, table: str) -> Dict:
+        m = self._read_manifest(table)
+        os.makedirs(self._tdir(table), exist_ok=True)
+        self._sweep(table, m)
+        wm = next(c for c in self.catalog.columns(table)
+                  if c.lower() == self.watermark_column.lower())
+        q = self.engine.dialect.identifier_preparer.quote
+        t0, added, lo = time.perf_counter(), 0, m["watermark"]
+        try:
+            with self.engine.connect() as conn:
+                hi = _mark_str(conn.execute(text(f"SELECT MAX({q(wm)}) FROM {q(table)}")).scalar())
+                if hi is not None and hi != lo:
+                    columns = m["columns"] or self._columns(table)
+                    where, args = ((f" WHERE {q(wm)} > ? AND {q(wm)} <= ?", (lo, hi)) if lo
+                                   else (f" WHERE {q(wm)} <= ?", (hi,)))
+                    cols = ", ".join(q(c) for c, _ in columns)
+                    # "?" parametreleri sürücüye doğrudan gider (sqlite3 / pyodbc qmark)
+                    res = conn.execution_options(stream_results=True).exec_driver_sql(
+                        f"SELECT {cols} FROM {q(table)}{where} ORDER BY {q(wm)}", args)
+                    seq, part, files = m["seq"] + 1, 0, []
+                    while True:
+                        rows = res.fetchmany(self.batch)
+                        if not rows:
+                            break
+                        files += self._write_batch(table, columns, wm, rows, seq, part)
+                        added += len(rows)
+                        part += 1
+                    m.update(files=m["files"] + files, seq=seq, columns=columns,
+                             rows=m["rows"] + added, watermark=hi)
+                    self._compact(table, m, wm)
+        except Exception as e:
+            ms = (time.perf_counter() - t0) * 1000
+            log.warning("✗ Yerel kopya senkronu başarısız  %s: %s", table, e)
+            out = {"table": table, "status": "error", "error": str(e), "ms": round(ms, 1)}
+            self.last_sync[table] = out
+            return out
+        m["synced_at"] = time.time()
+        self._write_manifest(table, m)
+        ms = (time.perf_counter() - t0) * 1000
+        REPLICA_SYNC_SECONDS.observe(ms / 1000, table=table)
+        out = {"table": table, "status": "success", "added": added, "rows": m["rows"],
+               "files": len(m["files"]), "watermark": m["watermark"], "ms": round(ms, 1)}
+        self.last_sync[table] = out
+        if added:
+            log.info("► Yerel kopya senkronlandı  %s  +%s satır  %.0f ms", table, added, ms)
+        return out
+
+    def _write_batch(self, table: str, columns: List[Tuple[str, str]], wm: str,
+                     rows: list, seq: int, part: int) -> List[Dict]:
+        """Bir parça satırı ay bölümlerine ayrı Parquet dosyaları olarak yazar."""
+        import pandas as pd
+        df = pd.DataFrame.from_records(rows, columns=[c for c, _ in columns])
+        con = _duckdb().connect()
+        try:
+            con.register("_batch", df)
+            sel = ", ".join(f"CAST({_qd(c)} AS {t}) AS {_qd(c)}" for c, t in columns)
+            con.execute(f"CREATE TEMP TABLE _b AS SELECT *, strftime({_qd(wm)}, '%Y-%m') "
+                        f"AS _month FROM (SELECT {sel} FROM _batch)")
+            out = []
+            for month, n in con.execute("SELECT _month, COUNT(*) FROM _b "
+                                        "GROUP BY _month ORDER BY _month").fetchall():
+                rel = os.path.join(f"month={month}", f"s{seq:06d}-{part}.parquet")
+                path = os.path.join(self._tdir(table), rel)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                con.execute(f"COPY (SELECT * EXCLUDE (_month) FROM _b WHERE _month = {_lit(month)} "
+                            f"ORDER BY {_qd(wm)}) TO {_lit(path)} "
+                            "(FORMAT PARQUET, COMPRESSION ZSTD)")
+                out.append({"path": rel, "month": month, "rows": n})
+            return out
+        finally:
+            con.close()
+
+    def _compact(self, table: str, m: Dict, wm: str):
+        """Çok dosyalı ay bölümlerini tek dosyada birleştirir (eskiler emekliye)."""
+        by_month: Dict[str, List[Dict]] = {}
+        for f in m["files"]:
+            by_month.setdefault(f["month"], []).append(f)
+        now = time.time()
+        for month, files in by_month.items():
+            if len(files) <= self.compact_files:
+                continue
+            rel = os.path.join(f"month={month}", f"c{m['seq']:06d}.parquet")
+            srcs = ", ".join(_lit(os.path.join(self._tdir(table), f["path"])) for f in files)
+            con = _duckdb().connect()
+            try:
+                con.execute(f"COPY (SELECT * FROM read_parquet([{srcs}]) ORDER BY {_qd(wm)}) "
+                            f"TO {_lit(os.path.join(self._tdir(table), rel))} "
+                            "(FORMAT PARQUET, COMPRESSION ZSTD)")
+            finally:
+                con.close()
+            m["files"] = ([f for f in m["files"] if f["month"] != month] +
+                          [{"path": rel, "month": month, "rows": sum(f["rows"] for f in files)}])
+            m["retired"] = m.get("retired", []) + [{"path": f["path"], "at": now} for f in files]
+
+    def _sweep(self, table: str, m: Dict):
+        """Manifest'te olmayan (yarım senkron) ve süresi dolan emekli dosyaları siler."""
+        tdir, now = self._tdir(table), time.time()
+        keep = [r for r in m.get("retired", []) if now - r["at"] < self.grace]
+        known = {f["path"] for f in m["files"]} | {r["path"] for r in keep}
+        for path in glob.glob(os.path.join(tdir, "month=*", "*.parquet")):
+            if os.path.relpath(path, tdir) not in known:
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+        m["retired"] = keep
+
+    # ─────────── Okuyucu ───────────
+    def _connection(self):
+        if self._con is None:
+            config = {"threads": self.threads} if self.threads > 0 else {}
+            self._con = _duckdb().connect(":memory:", config=config)
+        return self._con
+
+    def _refresh_views(self, force: bool = False):
+        """Manifest'i değişen tabloların DuckDB görünümünü yeniden kurar."""
+        now = time.monotonic()
+        if not force and now - self._checked < self.poll:
+            return
+        with self._lock:
+            con = self._connection()
+            for key, table in self.tables.items():
+                path = os.path.join(self._tdir(table), "_manifest.json")
+                try:
+                    mtime = os.path.getmtime(path)
+                except OSError:
+                    continue            # henüz senkronlanmadı
+                if self._mtimes.get(key) == mtime:
+                    continue
+                m = self._read_manifest(table)
+                if m["files"]:
+                    files = ", ".join(_lit(os.path.join(self._tdir(table), f["path"]))
+                                      for f in m["files"])
+                    try:
+                        con.execute(f"CREATE OR REPLACE VIEW {_qd(table)} AS "
+                                    f"SELECT * FROM read_parquet([{files}])")
+                    except Exception as e:
+                        # manifest'teki dosya eksik / bozuk → tablo kaynağa gider,
+                        # bir sonraki kontrolde yeniden denenir
+                        log.warning("Kopya görünümü kurulamadı (%s): %s", table, e)
+                        self._manifests.pop(key, None)
+                        self._mtimes.pop(key, None)
+                        continue
+                    self._manifests[key] = m
+                self._mtimes[key] = mtime
+            self._checked = now
+
+    @contextlib.contextmanager
+    def cursor(self, timeout: float = 0):
+        """DuckDB cursor'u; ``timeout`` sn dolunca sorgu kesilir → StatementTimeout."""
+        self._refresh_views()
+        cur = self._connection().cursor()
+        fired = threading.Event()
+
+        def expire():
+            fired.set()
+            cur.interrupt()
+
+        timer = threading.Timer(timeout, expire) if timeout and timeout > 0 else None
+        if timer is not None:
+            timer.daemon = True
+            timer.start()
+        try:
+            yield cur
+        except Exception as e:
+            if fired.is_set():
+                raise StatementTimeout(timeout) from e
+            raise
+        finally:
+            if timer is not None:
+                timer.cancel()
+            cur.close()
+
+    # ─────────── Yönlendirme ───────────
+    def route(self, sql: str, tables: Iterable[str]) -> Optional[str]:
+        """Kopyada çalıştırılabilecekse DuckDB SQL'i, değilse None."""
+        if self.route_mode in ("0", "off", "false"):
+            return None
+        tables = {t.lower() for t in tables}
+        if not tables or not tables <= set(self.tables):
+            return None
+        self._refresh_views()
+        now = time.time()
+        for t in tables:
+            m = self._manifests.get(t)
+            if m is None or not m.get("synced_at") or now - m["synced_at"] > self.max_lag:
+                return None
+        if self.route_mode != "all" and not is_analytical(sql):
+            return None
+        try:
+            return translate_to_duckdb(sql)
+        except Untranslatable as e:
+            self.untranslatable += 1
+            log.debug("DuckDB'ye çevrilemedi: %s", e)
+            return None
+
+    def stats(self) -> Dict:
+        now = time.time()
+        tables = {}
+        for key, table in self.tables.items():
+            m = self._manifests.get(key) or self._read_manifest(table)
+            tables[table] = {"rows": m["rows"], "files": len(m["files"]),
+                             "watermark": m["watermark"],
+                             "lag_s": (round(now - m["synced_at"], 1)
+                                       if m.get("synced_at") else None),
+                             "last_sync": self.last_sync.get(table)}
+        return {"dir": self.dir, "route": self.route_mode, "tables": tables,
+                "routed": self.routed, "fallbacks": self.fallbacks,
+                "untranslatable": self.untranslatable}
+
+
+_REPLICAS: Dict[str, Replica] = {}
+_REPLICAS_LOCK = threading.Lock()
+
+
+def get_replica(engine) -> Replica:
+    """Engine başına tek kopya (get_catalog gibi URL anahtarlı)."""
+    key = str(engine.url)
+    with _REPLICAS_LOCK:
+        if key not in _REPLICAS:
+            _REPLICAS[key] = Replica(engine)
+        return _REPLICAS[key]
+
+
+def all_replicas() -> List[Replica]:
+    with _REPLICAS_LOCK:
+        return list(_REPLICAS.values())
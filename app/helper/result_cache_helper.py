@@ -0,0 +1,256 @@
+"""
+result_cache_helper.py – kanonik SQL anahtarlı sorgu sonucu önbelleği
+
+Aynı (kanonikleştirilmiş) SQL aynı set / sayfa için tekrar çalıştığında
+sonuç DB'ye gitmeden döner.  Satırlar dict listesi yerine kolon başına
+NumPy dizisi olarak tutulur (sayısal kolonlar int64/float64, diğerleri
+object).  Boyut sınırı kayıt sayısı değil bayttır (LRU).
+
+Geçersiz kılma:
+  • TTL – tablo başına (sorgunun dokunduğu tabloların en kısası)
+  • elle – ``invalidate(["Pursu_hammadde_verimleri"])`` / POST /cache/invalidate
+  • su seviyesi (watermark) – ``date_time`` kolonu olan tablolarda
+    MAX(date_time) en fazla RESULT_CACHE_WATERMARK_INTERVAL sn'de bir
+    sorulur; değişmişse o tabloya dokunan kayıtlar düşer.  Sorgu hata
+    verir ya da RESULT_CACHE_WATERMARK_TIMEOUT'u aşarsa su seviyesi
+    "bilinmiyor" sayılır: o istek önbellekten okumaz / yazmaz
+
+Ortam değişkenleri:
+  RESULT_CACHE                    0 → kapalı (vars. 1)
+  RESULT_CACHE_MAX_MB             toplam bellek sınırı (vars. 64)
+  RESULT_CACHE_TTL                varsayılan TTL sn (vars. 60)
+  RESULT_CACHE_TABLE_TTL          tablo bazında, ör. "Pursu_hammadde_verimleri:300,PlcTag:10"
+  RESULT_CACHE_WATERMARK_COLUMN   (vars. date_time)
+  RESULT_CACHE_WATERMARK_INTERVAL sn (vars. 5)
+  RESULT_CACHE_WATERMARK_TIMEOUT  MAX() sorgusu için sn (vars. 2, 0 → yalnız ifade zaman aşımı)
+"""
+
+import os, sys, time, hashlib, threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+if TYPE_CHECKING:
+    import numpy as np
+
+__all__ = ["ResultCache", "ColumnarResult", "to_columnar"]
+
+# su seviyesi okunamadı (zaman aşımı / hata) → hiçbir kayıtla eşleşmez
+_UNKNOWN = object()
+
+
+class ColumnarResult:
+    """Kolon adları + kolon başına dizi; satır dict'leri gerektiğinde üretilir."""
+    __slots__ = ("columns", "arrays", "nrows", "nbytes")
+
+    def __init__(self, columns: List[str], arrays: List["np.ndarray"]):
+        self.columns = list(columns)
+        self.arrays = arrays
+        self.nrows = len(arrays[0]) if arrays else 0
+        self.nbytes = sum(_array_bytes(a) for a in arrays) + 64 * len(columns)
+
+    def column_lists(self) -> List[list]:
+        # tolist() NumPy skalerlerini Python tiplerine çevirir (JSON uyumlu)
+        return [a.tolist() for a in self.arrays]
+
+    def rows(self) -> List[Dict]:
+        cols = self.columns
+        return [dict(zip(cols, r)) for r in zip(*self.column_lists())]
+
+
+def _array_bytes(a: "np.ndarray") -> int:
+    if a.dtype != object:
+        return int(a.nbytes)
+    return int(a.nbytes) + sum(sys.getsizeof(v) for v in a if v is not None)
+
+
+def _column_array(values: list) -> "np.ndarray":
+    import numpy as np                  # ilk önbellek yazımında yüklenir (açılışı yavaşlatmaz)
+    if values and all(type(v) is int for v in values):
+        try:
+            return np.array(values, dtype=np.int64)
+        except OverflowError:
+            pass
+    elif values and all(type(v) in (int, float) for v in values):
+        return np.array(values, dtype=np.float64)
+    arr = np.empty(len(values), dtype=object)
+    arr[:] = values
+    return arr
+
+
+def to_columnar(columns: List[str], rows: Iterable[tuple]) -> ColumnarResult:
+    """Cursor tuple'larından doğrudan kolon dizileri (dict ara adımı yok)."""
+    import numpy as np
+    rows = list(rows)
+    if not rows:
+        return ColumnarResult(columns, [np.empty(0, dtype=object) for _ in columns])
+    return ColumnarResult(columns, [_column_array(list(c)) for c in zip(*rows)])
+
+
+def _parse_table_ttl(raw: str) -> Dict[str, float]:
+    out = {}
+    for part in filter(None, (p.strip() for p in raw.split(","))):
+        name, _, ttl = part.rpartition(":")
+        if name:
+            out[name.strip().lower()] = float(ttl)
+    return out
+
+
+class _Entry:
+    __slots__ = ("data", "meta", "tables", "expires", "marks", "nbytes")
+
+    def __init__(self, data, meta, tables, expires, marks):
+        self.data, self.meta, self.tables = data, meta, tables
+        self.expires, self.marks = expires, marks
+        self.nbytes = data.nbytes
+
+
+class ResultCache:
+    """Bayt sınırlı LRU + tablo bazlı TTL / su seviyesi geçersiz kılma."""
+
+    def __init__(self, *, max_bytes: Optional[int] = None,
+                 ttl: Optional[float] = None,
+                 table_ttl: Optional[Dict[str, float]] = None,
+                 watermark_column: Optional[str] = None,
+                 watermark_interval: Optional[float] = None,
+                 watermark_timeout: Optional[float] = None):
+        self.max_bytes = max_bytes or int(float(os.getenv("RESULT_CACHE_MAX_MB", "64")) * 1024 * 1024)
+        self.ttl = float(os.getenv("RESULT_CACHE_TTL", "60")) if ttl is None else ttl
+        self.table_ttl = {k.lower(): v for k, v in table_ttl.items()} if table_ttl is not None else \
+            _parse_table_ttl(os.getenv("RESULT_CACHE_TABLE_TTL", ""))
+        self.watermark_column = watermark_column or os.getenv("RESULT_CACHE_WATERMARK_COLUMN",
+                                                              "date_time")
+        self.watermark_interval = (float(os.getenv("RESULT_CACHE_WATERMARK_INTERVAL", "5"))
+                                   if watermark_interval is None else watermark_interval)
+        self.watermark_timeout = (float(os.getenv("RESULT_CACHE_WATERMARK_TIMEOUT", "2"))
+                                  if watermark_timeout is None else watermark_timeout)
+
+        self._mem: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._by_table: Dict[str, Set[str]] = {}
+        self._marks: Dict[str, Tuple[float, object]] = {}     # tablo → (sorulma zamanı, değer)
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+        self.mark_errors = 0
+
+    # ─────────── Anahtar ───────────
+    @staticmethod
+    def key(table_set: int, dialect: str, canonical: str, *parts) -> str:
+        raw = "\x1f".join([str(table_set), dialect, canonical, *map(str, parts)])
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def ttl_for(self, tables: Iterable[str]) -> float:
+        ttls = [self.table_ttl.get(t.lower(), self.ttl) for t in tables]
+        return min(ttls) if ttls else self.ttl
+
+    # ─────────── Su seviyesi ───────────
+    def watermarks(self, tables: Iterable[str],
+                   fetch: Optional[Callable[[str], object]]) -> Dict[str, object]:
+        """Tablo → güncel MAX(watermark); aralık dolmadıysa son bilinen değer.
+
+        Okunamayan tablo ``_UNKNOWN`` alır (son bilinen değer güncellenmez).
+        """
+        if fetch is None:
+            return {}
+        now, out = time.monotonic(), {}
+        for t in tables:
+            with self._lock:
+                seen = self._marks.get(t)
+            if seen is None or now - seen[0] >= self.watermark_interval:
+                try:
+                    value = fetch(t)
+                except Exception:
+                    with self._lock:
+                        self.mark_errors += 1
+                    out[t] = _UNKNOWN
+                    continue
+                with self._lock:
+                    prev = self._marks.get(t)
+                    self._marks[t] = (now, value)
+                if prev is not None and prev[1] != value:
+                    self.invalidate([t])
+                seen = (now, value)
+            if seen[1] is not None:
+                out[t] = seen[1]
+        return out
+
+    # ─────────── Okuma / yazma ───────────
+    def get(self, key: str, tables: Iterable[str] = (),
+            fetch_mark: Optional[Callable[[str], object]] = None):
+        """→ (ColumnarResult, meta) ya da None."""
+        marks = self.watermarks(tables, fetch_mark)
+        with self._lock:
+            e = self._mem.get(key)
+            if e is not None and any(v is _UNKNOWN for v in marks.values()):
+                # güncel mi bilinmiyor → bu istek için ıska, kayıt kalır
+                self.misses += 1
+                return None
+            if e is not None and (time.time() > e.expires or
+                                  any(marks.get(t) != v for t, v in e.marks.items())):
+                self._drop(key)
+                e = None
+            if e is None:
+                self.misses += 1
+                return None
+            self._mem.move_to_end(key)
+            self.hits += 1
+            return e.data, e.meta
+
+    def put(self, key: str, data: ColumnarResult, meta: Dict, tables: Iterable[str] = (),
+            fetch_mark: Optional[Callable[[str], object]] = None) -> bool:
+        tables = {t.lower() for t in tables}
+        ttl = self.ttl_for(tables)
+        if ttl <= 0 or data.nbytes > self.max_bytes // 4:
+            return False                # çok büyük sonuç önbelleği tek başına doldurmasın
+        marks = self.watermarks(tables, fetch_mark)
+        if any(v is _UNKNOWN for v in marks.values()):
+            return False
+        entry = _Entry(data, meta, tables, time.time() + ttl, marks)
+        with self._lock:
+            if key in self._mem:
+                self._drop(key)
+            self._mem[key] = entry
+            self.bytes += entry.nbytes
+            for t in tables:
+                self._by_table.setdefault(t, set()).add(key)
+            while self.bytes > self.max_bytes and self._mem:
+                self._drop(next(iter(self._mem)))
+                self.evictions += 1
+        return True
+
+    def _drop(self, key: str):
+        e = self._mem.pop(key, None)
+        if e is None:
+            return
+        self.bytes -= e.nbytes
+        for t in e.tables:
+            keys = self._by_table.get(t)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[t]
+
+    def invalidate(self, tables: Optional[Iterable[str]] = None) -> int:
+        """Verilen tablolara dokunan kayıtları (None → hepsini) siler."""
+        with self._lock:
+            if tables is None:
+                keys = list(self._mem)
+            else:
+                keys = {k for t in tables for k in self._by_table.get(t.lower(), ())}
+            for k in keys:
+                self._drop(k)
+            self.invalidations += len(keys)
+            return len(keys)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        with self._lock:
+            return {"hits": self.hits,
+                    "misses": self.misses,
+                    "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                    "entries": len(self._mem),
+                    "bytes": self.bytes,
+                    "max_bytes": self.max_bytes,
+                    "evictions": self.evictions,
+                    "invalidations": self.invalidations,
+                    "watermark_errors": self.mark_errors,
+                    "tables": {t: len(k) for t, k in self._by_table.items()}}
@@ -0,0 +1,132 @@
+"""
+schema_helper.py – engine başına bir kez yüklenen şema kataloğu
+
+Her sorguda ``inspect(engine)`` ile yansıtma (reflection) yapmak yerine
+tablo → kolon kümesi ve FK grafı bir kez okunur, bellekte O(1) aramalarla
+kullanılır.  TTL dolunca (veya ``refresh()`` ile) yeniden yüklenir.
+
+Ortam değişkenleri:
+  DB_SCHEMA    yansıtılacak şema (MSSQL'de vars. "dbo", diğerlerinde yok)
+  SCHEMA_TTL   saniye; 0 → hiç süresi dolmaz (vars. 3600)
+"""
+
+import os, time, threading
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import inspect
+
+from .db_helper import redacted_url
+
+__all__ = ["SchemaCatalog", "get_catalog", "refresh_all"]
+
+# (tablo, kolon, hedef tablo, hedef kolon) – hepsi küçük harf
+ForeignKey = Tuple[str, str, str, str]
+
+
+class SchemaCatalog:
+    """Tablo/kolon/FK bilgisinin bellekteki kopyası (isimler küçük harf)."""
+
+    def __init__(self, engine, *, schema: Optional[str] = None, ttl: Optional[float] = None):
+        self.engine = engine
+        if schema is None:
+            schema = os.getenv("DB_SCHEMA") or ("dbo" if engine.dialect.name == "mssql" else None)
+        self.schema = schema
+        self.ttl = float(os.getenv("SCHEMA_TTL", "3600")) if ttl is None else ttl
+
+        self._tables: Dict[str, Dict[str, str]] = {}   # tablo → {kolon: orijinal ad}
+        self._names: Dict[str, str] = {}               # tablo → orijinal ad
+        self._fks: List[ForeignKey] = []
+        self._graph: Dict[str, Set[str]] = {}
+        self.loaded_at: float = 0.0
+        self.load_ms: float = 0.0
+        self._lock = threading.Lock()
+
+    # ─────────── Yükleme ───────────
+    def refresh(self) -> "SchemaCatalog":
+        """Kataloğu veritabanından yeniden okur (tek seferde, toplu)."""
+        with self._lock:
+            t0 = time.perf_counter()
+            insp = inspect(self.engine)
+            names = insp.get_table_names(schema=self.schema)
+
+            # SQLAlchemy 2.x: tüm tablolar için tek turda kolon / FK
+            if hasattr(insp, "get_multi_columns"):
+                cols_by = {k[1]: v for k, v in insp.get_multi_columns(schema=self.schema).items()}
+                fks_by  = {k[1]: v for k, v in insp.get_multi_foreign_keys(schema=self.schema).items()}
+            else:
+                cols_by = {t: insp.get_columns(t, schema=self.schema) for t in names}
+                fks_by  = {t: insp.get_foreign_keys(t, schema=self.schema) for t in names}
+
+            tables, display, fks = {}, {}, []
+            for t in names:
+                display[t.lower()] = t
+                tables[t.lower()] = {c["name"].lower(): c["name"] for c in cols_by.get(t, [])}
+                for fk in fks_by.get(t, []):
+                    ref = (fk.get("referred_table") or "").lower()
+                    for c, rc in zip(fk.get("constrained_columns", []),
+                                     fk.get("referred_columns", [])):
+                        fks.append((t.lower(), c.lower(), ref, rc.lower()))
+
+            self._set(tables, display, fks)
+            self.load_ms = (time.perf_counter() - t0) * 1000
+            return self
+
+    def _set(self, tables, display, fks):
+        graph: Dict[str, Set[str]] = {t: set() for t in tables}
+        for a, _, b, _ in fks:
+            graph.setdefault(a, set()).add(b)
+            graph.setdefault(b, set()).add(a)
+        # referansları tek hamlede değiştir → okuyucular kilitsiz kalır
+        self._tables, self._names, self._fks, self._graph = tables, display, fks, graph
+        self.loaded_at = time.time()
+
+    def _fresh(self) -> "SchemaCatalog":
+        if not self.loaded_at or (self.ttl and time.time() - self.loaded_at > self.ttl):
+            self.refresh()
+        return self
+
+    # ─────────── Sorgular (O(1)) ───────────
+    def has_table(self, table: str) -> bool:
+        return table.lower() in self._fresh()._tables
+
+    def has_column(self, table: str, column: str) -> bool:
+        return column.lower() in self._fresh()._tables.get(table.lower(), ())
+
+    def columns(self, table: str) -> List[str]:
+        return list(self._fresh()._tables.get(table.lower(), {}).values())
+
+    def tables(self) -> List[str]:
+        return list(self._fresh()._names.values())
+
+    def foreign_keys(self) -> List[ForeignKey]:
+        return list(self._fresh()._fks)
+
+    def neighbours(self, table: str) -> Set[str]:
+        return set(self._fresh()._graph.get(table.lower(), ()))
+
+    def info(self) -> Dict:
+        return {"tables": len(self._tables),
+                "foreign_keys": len(self._fks),
+                "schema": self.schema,
+                "loaded_at": self.loaded_at,
+                "load_ms": round(self.load_ms, 1)}
+
+
+# ─────────── Süreç geneli kayıt (engine URL → katalog) ───────────
+_CATALOGS: Dict[str, SchemaCatalog] = {}
+_CATALOGS_LOCK = threading.Lock()
+
+
+def get_catalog(engine) -> SchemaCatalog:
+    key = str(engine.url)
+    with _CATALOGS_LOCK:
+        if key not in _CATALOGS:
+            _CATALOGS[key] = SchemaCatalog(engine)
+        return _CATALOGS[key]
+
+
+def refresh_all() -> Dict[str, Dict]:
+    """Tüm katalogları yeniden yükle; anahtar kimlik bilgisi içermeyen DSN etiketi."""
+    with _CATALOGS_LOCK:
+        cats = list(_CATALOGS.values())
+    return {redacted_url(cat.engine): cat.refresh().info() for cat in cats}
@@ -0,0 +1,223 @@
+"""
+semantic_helper.py – gömme (embedding) tabanlı soru önbelleği
+
+Birebir aynı olmayan ama aynı anlama gelen sorular için ("Line A
+makineleri" ↔ "Line B makineleri") daha önce üretilmiş SQL'i yeniden
+kullanır.  Her tablo seti için ayrı bir vektör matrisi tutulur, arama tek
+bir NumPy matris–vektör çarpımıyla (kosinüs) yapılır.
+
+Gömme fonksiyonu takılabilirdir: ``List[str] → np.ndarray (n, d)``.
+Varsayılan ``HashingEmbedder`` ağ gerektirmez (karakter n-gram hashing).
+
+Ortam değişkenleri:
+  SEMANTIC_CACHE_THRESHOLD   kosinüs eşiği          (vars. 0.90)
+  SEMANTIC_CACHE_SIZE        set başına en fazla kayıt (vars. 5000)
+"""
+
+import os, re, zlib, threading
+from difflib import SequenceMatcher
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from .cache_helper import normalize_question
+from .validator_helper import tokenize
+
+__all__ = ["HashingEmbedder", "SemanticCache", "SemanticHit"]
+
+EmbedFn = Callable[[List[str]], np.ndarray]
+
+_TOKEN_RE   = re.compile(r"\w+", re.U)
+_LITERAL_RE = re.compile(r"N?'(?:[^']|'')*'")
+_NUMBER_RE  = re.compile(r"^\d+(?:[.,]\d+)?$")
+# sayı yalnız bu token'lardan sonra bir filtre değeridir (TOP 5, DATEADD(…, -5, …),
+# takma ad vb. değil); BETWEEN x AND y'deki y ayrıca kontrol edilir
+_COMPARISON = frozenset({"=", "<>", "!=", "<", ">", "<=", ">=", "!<", "!>", "BETWEEN"})
+
+
+def _substitute_number(sql: str, old: str, new: str) -> Optional[str]:
+    """``old`` sayısı SQL'de tam bir kez, string literal içinde ya da bir
+    karşılaştırmanın değeri olarak geçiyorsa onu ``new`` yapar; yoksa None."""
+    if not _NUMBER_RE.match(new):
+        return None
+    pat = re.compile(rf"(?<!\w){re.escape(old)}(?!\w)")
+    toks = tokenize(sql)
+    spots = []                                  # (başlangıç, bitiş, karşılaştırma mı)
+    for i, t in enumerate(toks):
+        if t.kind == "string":
+            spots.extend((t.pos + m.start(), t.pos + m.end(), True)
+                         for m in pat.finditer(t.value))
+        elif t.kind == "number" and t.value == old:
+            prev = [p.upper for p in toks[max(0, i - 3):i]]
+            ok = bool(prev) and (prev[-1] in _COMPARISON or
+                                 (prev[-1] == "AND" and len(prev) == 3 and prev[0] == "BETWEEN"))
+            spots.append((t.pos, t.pos + len(t.value), ok))
+        elif t.kind == "qident" and pat.search(t.value):
+            return None                         # ör. takma ad [2023] / "5"
+    if len(spots) != 1 or not spots[0][2]:
+        return None
+    start, end, _ = spots[0]
+    return sql[:start] + new + sql[end:]
+
+
+class HashingEmbedder:
+    """Karakter n-gram'larını sabit boyutlu vektöre hash'leyen yerel gömücü."""
+
+    def __init__(self, dim: int = 512, ngrams=(3, 4)):
+        self.dim, self.ngrams = dim, ngrams
+
+    def _one(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for word in normalize_question(text).split():
+            w = f" {word} "
+            for n in self.ngrams:
+                for i in range(max(1, len(w) - n + 1)):
+                    h = zlib.crc32(w[i:i + n].encode("utf-8"))
+                    vec[h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        return np.vstack([self._one(t) for t in texts])
+
+
+class SemanticHit(NamedTuple):
+    sql: str
+    score: float
+    source_question: str
+    substituted: bool
+
+
+class _Index:
+    """Tek tablo seti için büyüyen (kapasite ikiye katlanan) vektör matrisi."""
+
+    def __init__(self, dim: int, max_entries: int):
+        self.max_entries = max_entries
+        self.matrix = np.zeros((min(64, max_entries), dim), dtype=np.float32)
+        self.questions: List[str] = []
+        self.sqls: List[str] = []
+        self.gen_ms: List[float] = []
+        self.next = 0                       # dolunca en eskinin üzerine yazılır
+
+    def add(self, vec: np.ndarray, question: str, sql: str, gen_ms: float):
+        n = len(self.questions)
+        if n < self.max_entries:
+            if n == len(self.matrix):
+                grown = np.zeros((min(n * 2, self.max_entries), self.matrix.shape[1]),
+                                 dtype=np.float32)
+                grown[:n] = self.matrix
+                self.matrix = grown
+            self.matrix[n] = vec
+            self.questions.append(question)
+            self.sqls.append(sql)
+            self.gen_ms.append(gen_ms)
+            return
+        i = self.next
+        self.matrix[i] = vec
+        self.questions[i], self.sqls[i], self.gen_ms[i] = question, sql, gen_ms
+        self.next = (i + 1) % self.max_entries
+
+    def best(self, vec: np.ndarray):
+        n = len(self.questions)
+        if not n:
+            return None, 0.0
+        scores = self.matrix[:n] @ vec
+        i = int(np.argmax(scores))
+        return i, float(scores[i])
+
+
+def substitute_literals(old_q: str, new_q: str, sql: str) -> Optional[str]:
+    """İki soru arasındaki kelime farklarını SQL string/sayı literallerine uygular.
+
+    Dönüş ``None`` ise fark güvenle aktarılamıyor demektir (ör. soruya yeni
+    bir sayı eklenmiş/silinmiş, değişen sayı SQL'de tam bir kez ve bir
+    literal / karşılaştırma değeri olarak geçmiyor, ya da değişen kelime
+    hiçbir string literalde bulunamıyor).
+    """
+    a = _TOKEN_RE.findall(old_q)
+    b = _TOKEN_RE.findall(new_q)
+    sm = SequenceMatcher(a=[t.lower() for t in a], b=[t.lower() for t in b], autojunk=False)
+
+    pairs = []
+    for op, i1, i2, j1, j2 in sm.get_opcodes():
+        if op == "equal":
+            continue
+        if op == "replace" and i2 - i1 == j2 - j1:
+            pairs.extend(zip(a[i1:i2], b[j1:j2]))
+            continue
+        # eklenen/silinen sayı filtre değerini değiştirir → yeniden kullanma
+        if any(_NUMBER_RE.match(t) for t in a[i1:i2] + b[j1:j2]):
+            return None
+
+    for old, new in pairs:
+        if _NUMBER_RE.match(old):
+            sql = _substitute_number(sql, old, new)
+            if sql is None:
+                return None
+            continue
+        pat = re.compile(rf"(?<!\w){re.escape(old)}(?!\w)", re.I)
+        # kelime yalnız string literal içindeyse değiştirilir; literalde yoksa
+        # fark büyük olasılıkla kolon / tablo seçimini değiştiriyor → yeniden kullanma
+        if not any(pat.search(m.group(0)) for m in _LITERAL_RE.finditer(sql)):
+            return None
+        sql = _LITERAL_RE.sub(lambda m: pat.sub(new, m.group(0)), sql)
+    return sql
+
+
+class SemanticCache:
+    """table_set başına en yakın önceki soruyu bulan önbellek."""
+
+    def __init__(self, embed_fn: Optional[EmbedFn] = None, *,
+                 threshold: Optional[float] = None,
+                 max_entries: Optional[int] = None):
+        self.embed_fn = embed_fn or HashingEmbedder()
+        self.threshold = threshold if threshold is not None else \
+            float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.90"))
+        self.max_entries = max_entries or int(os.getenv("SEMANTIC_CACHE_SIZE", "5000"))
+
+        self._index: Dict[int, _Index] = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.rejected = 0
+        self.saved_ms = 0.0
+
+    def _embed(self, question: str) -> np.ndarray:
+        vec = np.asarray(self.embed_fn([question])[0], dtype=np.float32)
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def lookup(self, table_set: int, question: str) -> Optional[SemanticHit]:
+        vec = self._embed(question)
+        with self._lock:
+            idx = self._index.get(table_set)
+            i, score = idx.best(vec) if idx else (None, 0.0)
+            if i is None or score < self.threshold:
+                self.misses += 1
+                return None
+            src_q, src_sql, src_ms = idx.questions[i], idx.sqls[i], idx.gen_ms[i]
+
+        sql = substitute_literals(src_q, question, src_sql)
+        with self._lock:
+            if sql is None:
+                self.rejected += 1
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_ms += src_ms
+        return SemanticHit(sql, score, src_q, sql != src_sql)
+
+    def add(self, table_set: int, question: str, sql: str, gen_ms: float = 0.0):
+        vec = self._embed(question)
+        with self._lock:
+            if table_set not in self._index:
+                self._index[table_set] = _Index(len(vec), self.max_entries)
+            self._index[table_set].add(vec, question, sql, gen_ms)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "rejected": self.rejected,
+                "hit_rate": round(self.hits / total, 3) if total else 0.0,
+                "saved_ms": round(self.saved_ms, 1),
+                "entries": {sid: len(ix.questions) for sid, ix in self._index.items()},
+                "threshold": self.threshold}
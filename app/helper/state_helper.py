@@ -0,0 +1,118 @@
+"""
+state_helper.py – oturum başına paylaşılan durum (son SQL)
+
+/save_view'in kullandığı "son çalışan SQL" süreç içi bir dict'te değil,
+oturum (session_id) × set anahtarıyla burada tutulur.  STATE_DB verilirse
+kayıtlar SQLite dosyasına yazılır; aynı dosyayı kullanan tüm uvicorn
+worker'ları aynı durumu görür (WAL + busy_timeout ile eşzamanlı erişim).
+Verilmezse yalnız bellek (tek süreç) kullanılır.
+
+``shared_secret()`` aynı dosyada worker'ların ortak kullandığı rastgele
+bir anahtar tutar (ilk yazan belirler) – ör. PAGE_TOKEN_SECRET verilmediyse
+sayfa jetonu imzası için.
+
+Ortam değişkenleri:
+  STATE_DB    SQLite dosyası; boşsa yalnız bellek
+  STATE_TTL   saniye; bu süreden eski oturum kayıtları silinir (vars. 86400)
+"""
+
+import os, time, sqlite3, secrets, threading
+from typing import Dict, Optional, Tuple
+
+__all__ = ["SessionStore", "DEFAULT_SESSION", "shared_secret"]
+
+# session_id göndermeyen istemciler (eski davranış: herkes tek kayıt paylaşır)
+DEFAULT_SESSION = "default"
+
+
+class SessionStore:
+    """(session_id, set_id) → son SQL; bellek ya da SQLite arka depo."""
+
+    def __init__(self, *, path: Optional[str] = None, ttl: Optional[float] = None):
+        self.path = path if path is not None else (os.getenv("STATE_DB") or None)
+        self.ttl = float(os.getenv("STATE_TTL", "86400")) if ttl is None else ttl
+
+        self._mem: Dict[Tuple[str, int], Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+        self._db: Optional[sqlite3.Connection] = None
+        if self.path:
+            self._db = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA busy_timeout=5000")
+            self._db.execute("""CREATE TABLE IF NOT EXISTS last_sql (
+                                    session_id TEXT    NOT NULL,
+                                    set_id     INTEGER NOT NULL,
+                                    sql        TEXT    NOT NULL,
+                                    updated_at REAL    NOT NULL,
+                                    PRIMARY KEY (session_id, set_id))""")
+            self._db.commit()
+            self.purge_expired()
+
+    # ─────────── Oku / yaz ───────────
+    def set_last_sql(self, session_id: Optional[str], set_id: int, sql: str):
+        key, now = (session_id or DEFAULT_SESSION, set_id), time.time()
+        with self._lock:
+            if self._db is None:
+                self._mem[key] = (sql, now)
+                return
+            self._db.execute("INSERT OR REPLACE INTO last_sql (session_id, set_id, sql, updated_at) "
+                             "VALUES (?, ?, ?, ?)", (*key, sql, now))
+            self._db.commit()
+
+    def get_last_sql(self, session_id: Optional[str], set_id: int) -> Optional[str]:
+        key = (session_id or DEFAULT_SESSION, set_id)
+        with self._lock:
+            if self._db is None:
+                hit = self._mem.get(key)
+            else:
+                hit = self._db.execute("SELECT sql, updated_at FROM last_sql "
+                                       "WHERE session_id = ? AND set_id = ?", key).fetchone()
+        if hit and (not self.ttl or time.time() - hit[1] <= self.ttl):
+            return hit[0]
+        return None
+
+    def purge_expired(self) -> int:
+        """TTL'i geçmiş oturum kayıtlarını siler, silinen sayısını döner."""
+        if not self.ttl:
+            return 0
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            if self._db is None:
+                old = [k for k, (_, ts) in self._mem.items() if ts < cutoff]
+                for k in old:
+                    del self._mem[k]
+                return len(old)
+            cur = self._db.execute("DELETE FROM last_sql WHERE updated_at < ?", (cutoff,))
+            self._db.commit()
+            return cur.rowcount
+
+    def stats(self) -> Dict:
+        with self._lock:
+            n = (len(self._mem) if self._db is None else
+                 self._db.execute("SELECT COUNT(*) FROM last_sql").fetchone()[0])
+        return {"sessions": n, "persistent": self._db is not None, "path": self.path}
+
+    def close(self):
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+
+def shared_secret(path: str, name: str) -> str:
+    """``path`` SQLite dosyasındaki ``name`` anahtarı; yoksa üretip kaydeder.
+
+    Aynı anda başlayan worker'lardan yalnız ilkinin değeri kalır
+    (INSERT OR IGNORE), hepsi aynı değeri okur.
+    """
+    db = sqlite3.connect(path, timeout=5.0)
+    try:
+        db.execute("PRAGMA busy_timeout=5000")
+        db.execute("CREATE TABLE IF NOT EXISTS secrets (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        db.execute("INSERT OR IGNORE INTO secrets (name, value) VALUES (?, ?)",
+                   (name, secrets.token_hex(32)))
+        db.commit()
+        return db.execute("SELECT value FROM secrets WHERE name = ?", (name,)).fetchone()[0]
+    finally:
+        db.close()
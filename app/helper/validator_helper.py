@@ -0,0 +1,499 @@
+"""
+validator_helper.py – tokenizer tabanlı, tek geçişli SQL doğrulayıcı
+
+Regex tabanlı ``_is_safe`` / ``_columns_exist`` ikilisinin yerini alır:
+
+  • yorumlar ve string/köşeli parantez içerikleri token düzeyinde ayrılır
+    (``UpdateDate`` kolonu ya da ``'drop'`` literal'i yasaklı kelime sayılmaz)
+  • yalnız tek bir SELECT / WITH ifadesine izin verilir (salt okunur)
+  • FROM / JOIN / APPLY ile gelen tablolar ve takma adları (alias) çözülür,
+    CTE ve türetilmiş tablolar (alt sorgu) tanınır
+  • ``M.Definition`` gibi nitelikli ve nitelik­siz kolon referansları
+    önbellekteki şema kataloğuna karşı kontrol edilir
+
+Hatalar ``SQLValidationError`` (ValueError alt sınıfı) içinde yapılandırılmış
+``Issue`` listesi olarak döner; DB'ye gitmeden mikro saniyeler içinde.
+"""
+
+import re, difflib
+from dataclasses import dataclass, asdict
+from typing import Dict, List, NamedTuple, Optional, Set
+
+__all__ = ["Token", "tokenize", "strip_comments", "canonical_sql", "Issue",
+           "SQLValidationError", "SQLValidator"]
+
+
+# ───────────────────── Tokenizer ─────────────────────
+class Token(NamedTuple):
+    kind: str       # ident | qident | keyword | string | number | var | op | punct
+    value: str
+    pos: int
+
+    @property
+    def upper(self) -> str:
+        return self.value.upper()
+
+
+_TOKEN_RE = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<string>N?'(?:[^']|'')*(?:'|\Z))
+  | (?P<word>[^\W\d][\w$#]*)
+  | (?P<punct>[(),.;])
+  | (?P<comment>--[^\n]*|/\*.*?(?:\*/|\Z))
+  | (?P<qident>\[(?:[^\]]|\]\])*(?:\]|\Z)|"(?:[^"]|"")*(?:"|\Z)|`[^`]*(?:`|\Z))
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)
+  | (?P<var>@@?[\w]+)
+  | (?P<op><=|>=|<>|!=|!<|!>|\|\||::|[-+*/%=<>&|^~])
+  | (?P<other>.)
+""", re.X | re.S | re.U)
+
+# T-SQL anahtar kelimeleri – kolon / tablo adı olarak yorumlanmaz
+KEYWORDS = frozenset("""
+    SELECT FROM WHERE AND OR NOT IN IS NULL LIKE BETWEEN AS ON JOIN INNER LEFT RIGHT
+    FULL OUTER CROSS APPLY GROUP BY ORDER HAVING DISTINCT TOP PERCENT WITH TIES UNION
+    ALL EXCEPT INTERSECT CASE WHEN THEN ELSE END ASC DESC OFFSET ROWS ROW FETCH NEXT
+    FIRST ONLY LIMIT OVER PARTITION EXISTS ANY SOME ESCAPE COLLATE NULLS LAST WITHIN
+    RANGE UNBOUNDED PRECEDING FOLLOWING CURRENT PIVOT UNPIVOT FOR VALUES TRUE FALSE
+    NOLOCK READUNCOMMITTED NOWAIT INDEX OPTION RECOMPILE MAXDOP
+    CURRENT_TIMESTAMP CURRENT_DATE CURRENT_TIME CURRENT_USER SESSION_USER SYSTEM_USER
+    INSERT UPDATE DELETE MERGE DROP ALTER CREATE TRUNCATE EXEC EXECUTE GRANT REVOKE
+    DENY INTO BULK OPENROWSET OPENQUERY OPENDATASOURCE DBCC SHUTDOWN BACKUP RESTORE
+    KILL RECONFIGURE USE DECLARE SET WAITFOR
+""".split())
+
+# CAST(x AS …) / CONVERT(…) içindeki veri tipleri
+TYPES = frozenset("""
+    INT INTEGER BIGINT SMALLINT TINYINT BIT DECIMAL NUMERIC MONEY SMALLMONEY FLOAT REAL
+    CHAR VARCHAR NCHAR NVARCHAR TEXT NTEXT DATE TIME DATETIME DATETIME2 SMALLDATETIME
+    DATETIMEOFFSET UNIQUEIDENTIFIER BINARY VARBINARY MAX
+""".split())
+
+# DATEADD(day, …) / DATEDIFF(month, …) gibi tarih parçaları
+DATEPARTS = frozenset("""
+    YEAR YY YYYY QUARTER QQ Q MONTH MM M DAYOFYEAR DY Y DAY DD D WEEK WK WW WEEKDAY DW
+    HOUR HH MINUTE MI N SECOND SS S MILLISECOND MS MICROSECOND MCS NANOSECOND NS
+    ISO_WEEK ISOWK ISOWW TZOFFSET TZ
+""".split())
+
+WRITE_KEYWORDS = frozenset("""
+    INSERT UPDATE DELETE MERGE DROP ALTER CREATE TRUNCATE EXEC EXECUTE GRANT REVOKE
+    DENY INTO BULK OPENROWSET OPENQUERY OPENDATASOURCE DBCC SHUTDOWN BACKUP RESTORE
+    KILL RECONFIGURE USE DECLARE SET WAITFOR
+""".split())
+
+# FROM bağlamını kapatan kelimeler
+_CLAUSE_END = frozenset("WHERE GROUP ORDER HAVING UNION EXCEPT INTERSECT OPTION "
+                        "WINDOW FOR OFFSET FETCH".split())
+_JOINERS    = frozenset(("FROM", "JOIN", "APPLY"))
+# bir ifadeyi bitiren token'lardan sonra gelen tanımlayıcı örtük alias'tır
+_EXPR_END   = frozenset(("ident", "qident", "number", "string", "var"))
+
+
+def _unquote(tok: Token) -> str:
+    v = tok.value
+    if tok.kind == "qident":
+        return v[1:-1].replace("]]", "]").replace('""', '"')
+    return v
+
+
+def tokenize(sql: str) -> List[Token]:
+    """Boşluk ve yorumlar atılmış token listesi."""
+    out: List[Token] = []
+    for m in _TOKEN_RE.finditer(sql):
+        kind = m.lastgroup
+        if kind == "ws" or kind == "comment":
+            continue
+        val = m.group()
+        if kind == "word":
+            kind = "keyword" if val.upper() in KEYWORDS else "ident"
+        elif kind == "other":
+            kind = "op"                                  # tanınmayan tek karakter
+        out.append(Token(kind, val, m.start()))
+    return out
+
+
+def strip_comments(sql: str) -> str:
+    """``--`` / ``/* */`` yorumlarını tek boşlukla değiştirir; literal'lere dokunmaz."""
+    return "".join(" " if m.lastgroup == "comment" else m.group()
+                   for m in _TOKEN_RE.finditer(sql))
+
+
+def canonical_sql(sql: str) -> str:
+    """Önbellek anahtarı için SQL'i kanonik biçime getirir.
+
+    Yorumlar / fazla boşluk / sondaki ``;`` atılır, anahtar kelimeler büyük,
+    tanımlayıcılar köşeli parantezsiz küçük harf olur; literal'ler aynen kalır.
+    """
+    parts = []
+    for t in tokenize(sql):
+        if t.kind == "keyword":
+            parts.append(t.upper)
+        elif t.kind in ("ident", "qident"):
+            parts.append(_unquote(t).lower())
+        else:
+            parts.append(t.value)
+    while parts and parts[-1] == ";":
+        parts.pop()
+    return " ".join(parts)
+
+
+# ───────────────────── Hata yapısı ─────────────────────
+@dataclass
+class Issue:
+    code: str                      # syntax | not_read_only | forbidden_keyword | multiple_statements
+                                   # | unknown_table | unknown_column | unknown_alias
+    message: str
+    pos: Optional[int] = None
+    table: Optional[str] = None
+    column: Optional[str] = None
+    suggestion: Optional[str] = None
+
+    def as_dict(self) -> Dict:
+        return {k: v for k, v in asdict(self).items() if v is not None}
+
+
+class SQLValidationError(ValueError):
+    def __init__(self, issues: List[Issue]):
+        self.issues = issues
+        super().__init__("; ".join(i.message for i in issues))
+
+    @property
+    def code(self) -> str:
+        return self.issues[0].code if self.issues else "invalid"
+
+    def as_dict(self) -> Dict:
+        return {"code": self.code, "issues": [i.as_dict() for i in self.issues]}
+
+
+# ───────────────────── Doğrulayıcı ─────────────────────
+class _Source:
+    """FROM'daki bir kaynak: gerçek tablo ya da opak (CTE / alt sorgu / TVF)."""
+    __slots__ = ("table", "opaque")
+
+    def __init__(self, table: Optional[str], opaque: bool):
+        self.table, self.opaque = table, opaque
+
+
+class SQLValidator:
+    """``validate(sql)`` → sorun yoksa None, varsa ``SQLValidationError``.
+
+    ``catalog`` ``SchemaCatalog`` arayüzünü (has_table / has_column / columns /
+    tables) sağlamalıdır; boşsa yalnız salt-okunur kontrolü yapılır.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    # ─────────── Kamu API'si ───────────
+    def check(self, sql: str) -> List[Issue]:
+        toks = tokenize(sql)
+        issues = self._check_statement(toks)
+        if issues:
+            return issues                   # salt-okunur değilse şemaya bakma
+        return self._check_columns(toks)
+
+    def validate(self, sql: str) -> None:
+        issues = self.check(sql)
+        if issues:
+            raise SQLValidationError(issues)
+
+    def referenced_tables(self, sql: str) -> Set[str]:
+        """Sorgunun okuduğu gerçek tablolar (küçük harf; CTE / alt sorgu hariç)."""
+        sources = self._collect(tokenize(sql))[0]
+        return {s.table.lower() for srcs in sources.values() for s in srcs
+                if s.table and not s.opaque}
+
+    def source_tables(self, sql: str) -> Dict[str, str]:
+        """FROM takma adı / tablo adı (küçük harf) → gerçek tablo adı."""
+        sources = self._collect(tokenize(sql))[0]
+        return {name: s.table for name, srcs in sources.items() for s in srcs
+                if s.table and not s.opaque}
+
+    # ─────────── Salt okunur / sözdizimi ───────────
+    def _check_statement(self, toks: List[Token]) -> List[Issue]:
+        if not toks:
+            return [Issue("syntax", "Boş SQL.")]
+        issues: List[Issue] = []
+
+        # noktalı virgülden sonra yalnız boşluk/yorum kalabilir
+        semis = [i for i, t in enumerate(toks) if t.value == ";"]
+        if semis and any(i != len(toks) - 1 for i in semis):
+            issues.append(Issue("multiple_statements", "Birden fazla SQL ifadesi var.",
+                                pos=toks[semis[0]].pos))
+
+        if toks[0].upper not in ("SELECT", "WITH"):
+            issues.append(Issue("not_read_only", "Yalnız SELECT sorgularına izin var.",
+                                pos=toks[0].pos))
+        for t in toks:
+            if t.kind == "keyword" and t.upper in WRITE_KEYWORDS:
+                issues.append(Issue("forbidden_keyword",
+                                    f"Yasaklı anahtar kelime: {t.upper}", pos=t.pos))
+            elif t.kind == "ident" and t.value.lower().startswith(("xp_", "sp_")):
+                issues.append(Issue("forbidden_keyword",
+                                    f"Sistem prosedürü çağrılamaz: {t.value}", pos=t.pos))
+            elif t.kind == "string" and (len(t.value) < 2 or not t.value.endswith("'")
+                                         or t.value in ("N'",)):
+                issues.append(Issue("syntax", "Kapanmamış string literal.", pos=t.pos))
+
+        depth = 0
+        for t in toks:
+            if t.value == "(":
+                depth += 1
+            elif t.value == ")":
+                depth -= 1
+                if depth < 0:
+                    issues.append(Issue("syntax", "Fazla kapanan parantez.", pos=t.pos))
+                    break
+        if depth > 0:
+            issues.append(Issue("syntax", "Kapanmamış parantez.", pos=toks[-1].pos))
+        return issues
+
+    # ─────────── Kaynak / takma ad çözümü ───────────
+    def _skip_parens(self, toks: List[Token], i: int) -> int:
+        """toks[i] == "(" → eşleşen ")" sonrası indeks."""
+        depth = 0
+        while i < len(toks):
+            if toks[i].value == "(":
+                depth += 1
+            elif toks[i].value == ")":
+                depth -= 1
+                if depth == 0:
+                    return i + 1
+            i += 1
+        return i
+
+    def _collect(self, toks: List[Token]):
+        """1. geçiş: CTE'ler, FROM kaynakları, çıktı takma adları.
+
+        → (alias → kaynaklar, çıktı adları, tüketilen token indeksleri, sorunlar)
+        """
+        sources: Dict[str, List[_Source]] = {}
+        out_names: Set[str] = set()
+        consumed: Set[int] = set()
+        ctes: Set[str] = set()
+        issues: List[Issue] = []
+        n = len(toks)
+
+        def ident_at(j):
+            return j < n and toks[j].kind in ("ident", "qident")
+
+        # ─── WITH a [(k1, k2)] AS (…), b AS (…) ───
+        i = 0
+        if toks and toks[0].upper == "WITH":
+            i = 1
+            while ident_at(i):
+                ctes.add(_unquote(toks[i]).lower())
+                consumed.add(i)
+                i += 1
+                if i < n and toks[i].value == "(":
+                    end = self._skip_parens(toks, i)
+                    for j in range(i + 1, end - 1):
+                        if ident_at(j):
+                            out_names.add(_unquote(toks[j]).lower())
+                            consumed.add(j)
+                    i = end
+                if i < n and toks[i].upper == "AS" and i + 1 < n and toks[i + 1].value == "(":
+                    i = self._skip_parens(toks, i + 1)
+                if i < n and toks[i].value == ",":
+                    i += 1
+                    continue
+                break
+
+        # ─── FROM / JOIN kaynakları (parantez derinliği başına durum) ───
+        in_from = {0: False}
+        depth = 0
+        i = 0
+        while i < n:
+            t = toks[i]
+            if t.value == "(":
+                depth += 1
+                in_from[depth] = False
+                i += 1
+                continue
+            if t.value == ")":
+                in_from.pop(depth, None)
+                depth -= 1
+                i += 1
+                continue
+            u = t.upper if t.kind == "keyword" else ""
+            if u in _JOINERS or (t.value == "," and in_from.get(depth)):
+                in_from[depth] = True
+                i = self._source(toks, i + 1, sources, ctes, consumed, issues)
+                continue
+            if u in _CLAUSE_END or u == "ON":
+                in_from[depth] = False
+            i += 1
+
+        # ─── Çıktı takma adları: "… AS ad" ve örtük "ifade ad" ───
+        for i, t in enumerate(toks):
+            if i == 0 or i in consumed or t.kind not in ("ident", "qident"):
+                continue
+            nxt = toks[i + 1] if i + 1 < n else None
+            if nxt is not None and nxt.value in ("(", "."):
+                continue
+            if t.kind == "ident" and t.upper in TYPES:
+                continue                        # CAST(x AS INT)
+            prev = toks[i - 1]
+            if prev.kind == "keyword" and prev.upper == "AS":
+                out_names.add(_unquote(t).lower())
+                consumed.add(i)
+            elif self._ends_expr(toks, i - 1):
+                out_names.add(_unquote(t).lower())
+                consumed.add(i)
+        return sources, out_names, consumed, ctes, issues
+
+    def _ends_expr(self, toks: List[Token], k: int) -> bool:
+        """toks[k] bir select ifadesini bitiriyor mu (sonraki ident örtük alias)?"""
+        t = toks[k]
+        if t.kind == "keyword":
+            return t.upper == "END"
+        if t.value == ")":
+            # TOP (5) kolon → alias değil
+            depth, j = 0, k
+            while j >= 0:
+                if toks[j].value == ")":
+                    depth += 1
+                elif toks[j].value == "(":
+                    depth -= 1
+                    if depth == 0:
+                        break
+                j -= 1
+            return not (j > 0 and toks[j - 1].upper == "TOP")
+        if t.kind == "number":
+            return not (k > 0 and toks[k - 1].upper in ("TOP", "OFFSET", "FETCH"))
+        return t.kind in _EXPR_END
+
+    def _source(self, toks, i, sources, ctes, consumed, issues) -> int:
+        """toks[i]'den başlayan bir FROM kaynağını okur; sonraki indeksi döndürür."""
+        n = len(toks)
+        if i >= n:
+            return i
+        if toks[i].value == "(":
+            # türetilmiş tablo: ( SELECT … ) [AS] alias
+            end = self._skip_parens(toks, i)
+            src, j = _Source(None, True), end
+        elif toks[i].kind in ("ident", "qident"):
+            parts, j = [i], i + 1
+            while j + 1 < n and toks[j].value == "." and toks[j + 1].kind in ("ident", "qident"):
+                parts.append(j + 1)
+                j += 2
+            consumed.update(parts)
+            name = _unquote(toks[parts[-1]])
+            if j < n and toks[j].value == "(":
+                # tablo değerli fonksiyon (OPENJSON, STRING_SPLIT …)
+                src, j = _Source(name, True), self._skip_parens(toks, j)
+            elif name.lower() in ctes:
+                src = _Source(name, True)
+            else:
+                src = _Source(name, False)
+                if self._catalog_ready() and not self.catalog.has_table(name):
+                    issues.append(Issue("unknown_table", f"Tablo bulunamadı: {name}",
+                                        pos=toks[parts[-1]].pos, table=name,
+                                        suggestion=self._suggest(name, self.catalog.tables())))
+            sources.setdefault(name.lower(), []).append(src)
+        else:
+            return i
+
+        # [AS] alias
+        if j < n and toks[j].upper == "AS" and toks[j].kind == "keyword":
+            j += 1
+        if j < n and toks[j].kind in ("ident", "qident"):
+            sources.setdefault(_unquote(toks[j]).lower(), []).append(src)
+            consumed.add(j)
+            j += 1
+        # WITH (NOLOCK) gibi tablo ipuçları
+        if j + 1 < n and toks[j].upper == "WITH" and toks[j + 1].value == "(":
+            j = self._skip_parens(toks, j + 1)
+        return j
+
+    # ─────────── Kolon kontrolü ───────────
+    def _catalog_ready(self) -> bool:
+        try:
+            return bool(self.catalog.tables())
+        except Exception:
+            return False
+
+    @staticmethod
+    def _suggest(name: str, options: List[str]) -> Optional[str]:
+        low = {o.lower(): o for o in options}
+        hit = difflib.get_close_matches(name.lower(), list(low), n=1, cutoff=0.6)
+        return low[hit[0]] if hit else None
+
+    def _check_columns(self, toks: List[Token]) -> List[Issue]:
+        sources, out_names, consumed, ctes, issues = self._collect(toks)
+        if not self._catalog_ready():
+            return []
+
+        real = {s.table.lower() for srcs in sources.values() for s in srcs
+                if not s.opaque and s.table and self.catalog.has_table(s.table)}
+        any_opaque = any(s.opaque for srcs in sources.values() for s in srcs)
+        real_cols: Set[str] = set()
+        for tbl in real:
+            real_cols.update(c.lower() for c in self.catalog.columns(tbl))
+        known = real_cols | out_names
+
+        n = len(toks)
+        i = 0
+        while i < n:
+            t = toks[i]
+            if i in consumed or t.kind not in ("ident", "qident"):
+                i += 1
+                continue
+            nxt = toks[i + 1] if i + 1 < n else None
+            if nxt is not None and nxt.value == "(":
+                i += 1                                   # fonksiyon çağrısı
+                continue
+
+            # ─── nitelikli: q.kolon / şema.q.kolon ───
+            if nxt is not None and nxt.value == "." and i + 2 < n:
+                chain = [i]
+                j = i + 1
+                while j + 1 < n and toks[j].value == "." and \
+                        (toks[j + 1].kind in ("ident", "qident") or toks[j + 1].value == "*"):
+                    chain.append(j + 1)
+                    j += 2
+                if j < n and toks[j].value == "(":
+                    i = j                                # şema.fonksiyon(
+                    continue
+                if len(chain) >= 2:
+                    issue = self._check_qualified(_unquote(toks[chain[-2]]), toks[chain[-1]],
+                                                  sources, toks[chain[-2]].pos)
+                    if issue:
+                        issues.append(issue)
+                i = j
+                continue
+
+            # ─── niteliksiz ───
+            name = _unquote(t).lower()
+            if t.kind == "ident" and (t.upper in TYPES or t.upper in DATEPARTS):
+                pass
+            elif name not in known and name not in sources and not any_opaque and real:
+                issues.append(Issue("unknown_column", f"Kolon bulunamadı: {_unquote(t)}",
+                                    pos=t.pos, column=_unquote(t),
+                                    suggestion=self._suggest(name, list(real_cols))))
+            i += 1
+        return issues
+
+    def _check_qualified(self, qual: str, col_tok: Token, sources, pos) -> Optional[Issue]:
+        q = qual.lower()
+        if col_tok.value == "*":
+            if q not in sources:
+                return Issue("unknown_alias", f"Tanımsız tablo/alias: {qual}", pos=pos)
+            return None
+        col = _unquote(col_tok)
+        srcs = sources.get(q)
+        if srcs is None:
+            hint = "FROM/JOIN'de yok" if self.catalog.has_table(q) else "tanımsız"
+            return Issue("unknown_alias", f"Tablo/alias {hint}: {qual}", pos=pos, column=col,
+                         suggestion=self._suggest(q, list(sources)))
+        if any(s.opaque for s in srcs):
+            return None                 # CTE / alt sorgu kolonları burada bilinmiyor
+        tables = [s.table for s in srcs if s.table and self.catalog.has_table(s.table)]
+        if not tables:
+            return None                 # tablonun kendisi zaten raporlandı
+        if any(self.catalog.has_column(t, col) for t in tables):
+            return None
+        options = [c for t in tables for c in self.catalog.columns(t)]
+        return Issue("unknown_column", f"Kolon bulunamadı: {qual}.{col} ({tables[0]})",
+                     pos=col_tok.pos, table=tables[0], column=col,
+                     suggestion=self._suggest(col, options))
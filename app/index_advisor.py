@@ -0,0 +1,131 @@
+"""
+index_advisor.py – sorgu logundaki üretilmiş SQL'lerden indeks önerisi
+
+  python app/index_advisor.py --log query_logs.jsonl --top 10
+  python app/index_advisor.py --log query_logs.jsonl --set 3 --json advice.json
+  python app/index_advisor.py --log query_logs.jsonl --dsn sqlite:///test.db \\
+                              --apply --replay 5
+
+Log (döndürülmüş ``.1`` … dosyaları dahil) okunur; başarılı ve sonuç
+önbelleğinden gelmeyen kayıtların SQL'i kanonik biçime göre gruplanır,
+medyan ``exec_ms`` ve çalışma sayısıyla IndexAdvisor'a verilir (bkz.
+helper/index_helper.py).  Varsayılan yalnız öneri yazdırır; ``--apply``
+önerileri ``--dsn`` ile açıkça verilen (test) veritabanında oluşturur.
+``--replay N`` iş yükünü önce ve sonra N kez çalıştırıp süreleri
+karşılaştırır; ``--apply`` ile birlikte her indeks ayrıca doğrulanır ve
+tablosundaki sorguları ``--min-gain`` oranında hızlandırmayan indeks
+geri alınır.
+"""
+
+import os, sys, json, argparse, statistics
+from typing import Dict, List, Tuple
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR)
+
+from helper.log_helper import iter_logs
+from helper.validator_helper import canonical_sql
+
+
+def load_workload(path: str, *, set_id=None, backups: int = 5) -> List[Dict]:
+    """Log → [{"sql", "count", "exec_ms"}] (aynı kanonik SQL tek kayıt)."""
+    paths = [f"{path}.{i}" for i in range(backups, 0, -1)] + [path]
+    groups: Dict[str, Dict] = {}
+    for p in paths:
+        if not os.path.exists(p):
+            continue
+        for entry in iter_logs(p):
+            res = entry.get("response")
+            if not isinstance(res, dict) or res.get("status") != "success" or not res.get("sql"):
+                continue
+            if res.get("result_cached") or (set_id is not None and res.get("set_id") != set_id):
+                continue
+            g = groups.setdefault(canonical_sql(res["sql"]), {"sql": res["sql"], "ms": []})
+            g["ms"].append(float(res.get("exec_ms") or 0.0))
+    return [{"sql": g["sql"], "count": len(g["ms"]), "exec_ms": statistics.median(g["ms"])}
+            for g in groups.values()]
+
+
+def _print_advice(recs: List[Dict], advisor):
+    print(f"\n{advisor.queries} sorgu çalışması, {len(advisor.candidates)} aday"
+          + (f", {advisor.skipped} ayrıştırılamadı" if advisor.skipped else ""))
+    if not recs:
+        print("Öneri yok (adaylar mevcut indekslerle karşılanıyor).")
+    for i, r in enumerate(recs, 1):
+        roles = "; ".join(f"{k}: {', '.join(v)}" for k, v in r["roles"].items())
+        print(f"{i:>3}. skor {r['score']:>10.1f}  sayı {r['count']:>5}  {r['ddl']};")
+        print(f"     {roles}" + (f"  (+{len(r['covers'])} önek)" if r["covers"] else ""))
+
+
+def _print_replay(before: Dict, after: Dict):
+    print(f"\nİş yükü (medyan × sayı): {before['total_ms']:.1f} ms → {after['total_ms']:.1f} ms"
+          + (f"  ({before['total_ms'] / after['total_ms']:.2f}x)" if after["total_ms"] else ""))
+    for b, a in zip(before["queries"], after["queries"]):
+        if "ms" in b and "ms" in a:
+            print(f"  {b['ms']:>10.2f} → {a['ms']:>10.2f} ms  ×{b['count']:<4} "
+                  f"{' '.join(b['sql'].split())[:90]}")
+    if before["errors"]:
+        print(f"  {before['errors']} SQL bu veritabanında çalışmadı (atlandı)")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Üretilmiş SQL iş yükünden indeks önerisi")
+    ap.add_argument("--log", default=os.getenv("QUERY_LOG_FILE", "query_logs.jsonl"))
+    ap.add_argument("--dsn", help="şema / uygulama / tekrar için veritabanı (vars. DB_URL)")
+    ap.add_argument("--set", type=int, dest="set_id", help="yalnız bu tablo seti")
+    ap.add_argument("--top", type=int, default=10)
+    ap.add_argument("--min-count", type=int, default=1, help="en az bu kadar sorguda geçen")
+    ap.add_argument("--apply", action="store_true",
+                    help="önerileri oluştur (yalnız --dsn ile verilen test veritabanında)")
+    ap.add_argument("--replay", type=int, default=0, metavar="N",
+                    help="iş yükünü önce / sonra N kez çalıştırıp süreleri karşılaştır")
+    ap.add_argument("--min-gain", type=float, default=0.05,
+                    help="--apply --replay: indeksin tablosundaki sorgular en az bu oranda "
+                         "hızlanmazsa indeks geri alınır")
+    ap.add_argument("--max-rows", type=int, default=1000, help="tekrarda satır sınırı")
+    ap.add_argument("--json", help="sonuçları bu dosyaya yaz")
+    args = ap.parse_args()
+
+    if args.apply and not args.dsn:
+        ap.error("--apply yalnız açıkça verilen --dsn (test veritabanı) ile çalışır")
+
+    from helper.db_helper import get_engine, default_dsn, redacted_url
+    from helper.index_helper import IndexAdvisor, replay
+
+    workload = load_workload(args.log, set_id=args.set_id)
+    if not workload:
+        ap.exit(1, f"{args.log}: başarılı SQL kaydı yok\n")
+    engine = get_engine(args.dsn or default_dsn())
+    advisor = IndexAdvisor(engine)
+    for w in workload:
+        advisor.add(w["sql"], w["exec_ms"], w["count"])
+    recs = advisor.recommend(top=args.top, min_count=args.min_count)
+    _print_advice(recs, advisor)
+
+    result = {"dsn": redacted_url(engine),
+              "log": args.log, "queries": advisor.queries,
+              "distinct_sql": len(workload), "recommendations": recs}
+    if args.apply or args.replay:
+        runs: List[Tuple[str, int]] = [(w["sql"], w["count"]) for w in workload]
+        if args.replay:
+            result["before"] = replay(engine, runs, repeat=args.replay, max_rows=args.max_rows)
+        if args.apply:
+            result["applied"] = advisor.apply(recs, workload=runs if args.replay else None,
+                                              repeat=args.replay, max_rows=args.max_rows,
+                                              min_gain=args.min_gain)
+            for a in result["applied"]:
+                timing = (f"  {a['before_ms']:.1f} → {a['after_ms']:.1f} ms"
+                          if "before_ms" in a else "")
+                print(f"  {a['status']:>8} {a['name']}{timing}"
+                      + (f"  {a['error']}" if "error" in a else ""))
+        if args.replay:
+            result["after"] = replay(engine, runs, repeat=args.replay, max_rows=args.max_rows)
+            _print_replay(result["before"], result["after"])
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+server.py – üretim giriş noktası (yalnız API, çok worker'lı uvicorn)
+
+  python app/server.py --workers 4 --host 0.0.0.0 --port 8000
+  uvicorn server:create_app --factory --app-dir app --workers 4
+
+Her worker kendi ``Main`` örneğini ``create_app()`` ile kurar (ortak
+STATE_DB / PAGE_TOKEN_SECRET varsayılanları da orada atanır, böylece
+``uvicorn --factory`` ile doğrudan başlatmak da güvenlidir); LLModel'ler
+worker içinde ilk istekte oluşturulur.  Worker'lar arasında paylaşılması
+gereken durum (oturum başına son SQL) STATE_DB SQLite dosyasındadır;
+sayfa jetonları tüm worker'larda aynı PAGE_TOKEN_SECRET ile imzalanır
+(verilmezse STATE_DB'de saklanan ortak anahtar kullanılır);
+sonuç / SQL önbellekleri worker başınadır (SQL_CACHE_PATH ile NL → SQL
+önbelleği de paylaşılabilir).
+
+Kapanışta (SIGTERM / Ctrl+C) uvicorn yeni bağlantı almaz, açık istekleri
+``--graceful-timeout`` kadar bekler; ardından lifespan süren LLM/DB
+işlerini DRAIN_TIMEOUT kadar boşaltır.
+
+Ortam değişkenleri:
+  API_HOST / API_PORT / API_WORKERS   vars. 127.0.0.1 / 8000 / 2
+  STATE_DB                            vars. <app>/nl2sql_state.db
+  PAGE_TOKEN_SECRET                   sayfa jetonu HMAC anahtarı; yoksa bir kez
+                                      üretilip STATE_DB'ye yazılır, tüm worker'lar okur
+  DRAIN_TIMEOUT                       sn (vars. 30)
+"""
+
+import os, sys, argparse
+
+import uvicorn
+from fastapi import FastAPI
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BASE_DIR)
+
+
+def _shared_env():
+    """Worker'lar arası paylaşılan durumun varsayılanları (helper importundan önce)."""
+    os.environ.setdefault("STATE_DB", os.path.join(BASE_DIR, "nl2sql_state.db"))
+    if not os.getenv("PAGE_TOKEN_SECRET"):
+        # süreç başına rastgele anahtar olsaydı bir worker'ın next_page_token'ı
+        # diğerinde doğrulanamazdı → tüm worker'lar STATE_DB'deki anahtarı okur
+        from helper.state_helper import shared_secret
+        os.environ["PAGE_TOKEN_SECRET"] = shared_secret(os.environ["STATE_DB"],
+                                                        "page_token")
+
+
+def create_app() -> FastAPI:
+    """uvicorn ``--factory`` için: worker başına bir uygulama."""
+    _shared_env()
+    from app import Main
+    return Main().app
+
+
+def main():
+    ap = argparse.ArgumentParser(description="NL→SQL API (çok worker)")
+    ap.add_argument("--host", default=os.getenv("API_HOST", "127.0.0.1"))
+    ap.add_argument("--port", type=int, default=int(os.getenv("API_PORT", "8000")))
+    ap.add_argument("--workers", type=int, default=int(os.getenv("API_WORKERS", "2")))
+    ap.add_argument("--graceful-timeout", type=float,
+                    default=float(os.getenv("DRAIN_TIMEOUT", "30")))
+    ap.add_argument("--log-level", default="warning")
+    args = ap.parse_args()
+
+    # worker'lar ortamı devralır → hepsi aynı durum dosyasını / anahtarı kullanır
+    _shared_env()
+    os.environ["DRAIN_TIMEOUT"] = str(args.graceful_timeout)
+
+    uvicorn.run("server:create_app", factory=True, app_dir=BASE_DIR,
+                host=args.host, port=args.port, workers=args.workers,
+                timeout_graceful_shutdown=int(args.graceful_timeout),
+                log_level=args.log_level)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Testler ``app/`` altındaki modülleri uygulamanın kendisi gibi (``helper.…``)
+içe aktarır; Azure / MSSQL gerekmez – LLM için bench_helper.FakeLLMClient,
+veritabanı için küçük bir SQLite fikstürü kullanılır.
+"""
+
+import os, sys, shutil
+
+import pytest
+
+APP_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app")
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+
+@pytest.fixture(scope="session")
+def fixture_db(tmp_path_factory):
+    """Oturum başına bir kez üretilen küçük tohumlu SQLite (bench fikstürü)."""
+    from helper.bench_helper import build_fixture
+    return build_fixture(str(tmp_path_factory.mktemp("db") / "fixture.db"), 2000)
+
+
+@pytest.fixture
+def db_url(fixture_db, tmp_path):
+    """Teste özel kopya – kalıcı görünüm / indeks yazımları diğer testlere sızmaz."""
+    path = tmp_path / "test.db"
+    shutil.copy(fixture_db, path)
+    return f"sqlite:///{path}"
+
+
+@pytest.fixture
+def make_main(db_url, tmp_path, monkeypatch):
+    """Sahte LLM'li ``Main`` kurar; ``env`` ile ortam değişkenleri önce ayarlanır.
+
+    → (main, istemciler {set_id: FakeLLMClient})
+    """
+    created = []
+
+    def _make(env=None, **client_kw):
+        base = {"QUERY_LOG_FILE": str(tmp_path / "query_logs.jsonl"),
+                "WARMUP_SETS": "", "MATVIEW_TICK": "0", "REPLICA_SYNC_INTERVAL": "0",
+                "DISCONNECT_POLL": "0.02", "STATE_DB": ""}
+        for k, v in {**base, **(env or {})}.items():
+            monkeypatch.setenv(k, v)
+        from app import Main
+        from helper.api_helper import LLModel
+        from helper.bench_helper import FakeLLMClient
+
+        clients = {}
+
+        def factory(*, table_set, **kw):
+            clients[table_set] = FakeLLMClient(table_set, **{"latency_ms": 0, **client_kw})
+            return LLModel(table_set=table_set, client=clients[table_set], dsn=db_url, **kw)
+
+        main = Main(model_factory=factory)
+        created.append(main)
+        return main, clients
+
+    yield _make
+    for main in created:
+        main.query_log.close()
+        main.limiter.shutdown(wait=False)
+        main.batch_executor.shutdown(wait=False)
+        main.state.close()
@@ -0,0 +1,64 @@
+"""/ask_batch: tekilleştirme sayfa jetonunu da hesaba katmalı."""
+
+import asyncio
+
+import httpx
+
+MACHINES = "SELECT M.Id, M.Definition FROM Machine M ORDER BY M.Id;"
+
+
+def _post(app, path: str, payload: dict):
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app),
+                                     base_url="http://test") as c:
+            r = await c.post(path, json=payload)
+            return r.status_code, r.json()
+    return asyncio.run(run())
+
+
+def test_pages_of_same_question_are_not_merged(make_main):
+    main, clients = make_main(sqls=[MACHINES])
+    q = {"question": "Makineleri listele", "set_id": 1, "max_rows": 2}
+    _, first = _post(main.app, "/ask", q)
+    token = first["next_page_token"]
+    assert token
+
+    # jetonlu öğe: soru yok, set_id yanlış verilmiş → jetondaki set kullanılır
+    status, body = _post(main.app, "/ask_batch", {"items": [
+        q, {"page_token": token, "set_id": 3, "max_rows": 2}, q]})
+    assert status == 200
+    r0, r1, r2 = body["results"]
+    assert body["unique"] == 2
+    assert r0["status"] == r1["status"] == "success", body
+    assert r0["rows"] == r2["rows"] == first["rows"]
+    assert r1["rows"] != r0["rows"]
+    assert [r["Id"] for r in r1["rows"]] == [first["rows"][-1]["Id"] + 1,
+                                             first["rows"][-1]["Id"] + 2]
+    assert clients[1].calls == 1                # ilk /ask; batch'te önbellek + jeton
+
+
+def test_invalid_token_and_empty_question_are_per_item_errors(make_main):
+    main, _ = make_main(sqls=[MACHINES])
+    status, body = _post(main.app, "/ask_batch", {"items": [
+        {"page_token": "bozuk.jeton"}, {"question": "  ", "set_id": 1}]})
+    assert status == 200 and body["unique"] == 0
+    assert [r["status"] for r in body["results"]] == ["error", "error"]
+
+
+def test_batch_size_is_capped(make_main):
+    main, _ = make_main({"BATCH_MAX_ITEMS": "2"}, sqls=[MACHINES])
+    item = {"question": "Makineleri listele", "set_id": 1}
+    status, _ = _post(main.app, "/ask_batch", {"items": [item] * 3})
+    assert status == 413
+
+
+def test_only_last_item_updates_session_last_sql(make_main):
+    main, _ = make_main(sqls=[MACHINES])
+    ok = {"question": "Makineleri listele", "set_id": 1, "session_id": "s"}
+    _post(main.app, "/ask_batch", {"items": [ok, {"question": "", "set_id": 1,
+                                                  "session_id": "s"}]})
+    assert main.state.get_last_sql("s", 1) is None      # son öğe başarısız
+
+    _post(main.app, "/ask_batch", {"items": [{**ok, "session_id": "other"}, ok]})
+    assert main.state.get_last_sql("s", 1) == MACHINES
+    assert main.state.get_last_sql("other", 1) is None
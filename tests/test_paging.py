@@ -0,0 +1,57 @@
+"""paging_helper: sunucu tarafı limit / offset eklemenin sınır durumları."""
+
+import sqlite3
+
+from helper.paging_helper import limit_sql, count_sql, encode_page_token, decode_page_token
+
+
+def test_trailing_line_comment_does_not_swallow_limit():
+    sql, server_offset = limit_sql("SELECT a FROM T ORDER BY a; -- latest first", "sqlite", 20, 11)
+    assert server_offset
+    assert sql == "SELECT a FROM T ORDER BY a LIMIT 11 OFFSET 20;"
+
+
+def test_block_comment_and_comment_text_in_literal():
+    sql, _ = limit_sql("SELECT '-- not a comment' AS a /* x */ FROM T", "sqlite", 0, 5)
+    assert "'-- not a comment'" in sql and "/*" not in sql
+    assert sql.endswith("LIMIT 5 OFFSET 0;")
+
+
+def test_second_page_on_sqlite_skips_rows():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE T (a INTEGER)")
+    conn.executemany("INSERT INTO T VALUES (?)", [(i,) for i in range(50)])
+    sql, server_offset = limit_sql("SELECT a FROM T ORDER BY a; -- son yorum", "sqlite", 20, 11)
+    assert server_offset
+    assert [r[0] for r in conn.execute(sql)] == list(range(20, 31))
+
+
+def test_mssql_existing_offset_fetch_is_left_alone():
+    src = "SELECT a FROM T ORDER BY a OFFSET 5 ROWS FETCH NEXT 10 ROWS ONLY"
+    sql, server_offset = limit_sql(src, "mssql", 0, 11)
+    assert sql == src and not server_offset
+    assert "TOP" not in sql
+
+
+def test_mssql_limit_tail_gets_no_top():
+    sql, server_offset = limit_sql("SELECT a FROM T LIMIT 3", "mssql", 0, 11)
+    assert "TOP" not in sql and not server_offset
+
+
+def test_mssql_order_by_uses_offset_fetch_and_plain_select_uses_top():
+    sql, ok = limit_sql("SELECT a FROM T ORDER BY a -- yorum", "mssql", 10, 11)
+    assert ok and sql.endswith("ORDER BY a OFFSET 10 ROWS FETCH NEXT 11 ROWS ONLY;")
+    sql, ok = limit_sql("SELECT DISTINCT a FROM T;", "mssql", 0, 11)
+    assert ok and sql == "SELECT DISTINCT TOP (11) a FROM T;"
+    # TOP yalnız ilk sayfada kullanılabilir
+    assert limit_sql("SELECT a FROM T;", "mssql", 20, 11)[1] is False
+
+
+def test_count_sql_strips_trailing_comment():
+    assert count_sql("SELECT a FROM T ORDER BY a -- c", "sqlite") == \
+        "SELECT COUNT(*) FROM (SELECT a FROM T) AS _q;"
+
+
+def test_page_token_round_trip():
+    tok = encode_page_token(3, "SELECT 1;", 20, 10)
+    assert decode_page_token(tok) == {"set_id": 3, "sql": "SELECT 1;", "offset": 20, "limit": 10}
@@ -0,0 +1,86 @@
+"""Sonuç önbelleği: su seviyesi / tablo bazlı geçersiz kılma."""
+
+import sqlite3
+
+import pytest
+
+from helper.db_helper import StatementTimeout
+from helper.result_cache_helper import ResultCache, to_columnar
+
+TABLE = "pursu_hammadde_verimleri"
+
+
+def _put(rc, key="k", tables=(TABLE,), fetch=None):
+    data = to_columnar(["a"], [(1,), (2,)])
+    assert rc.put(key, data, {"truncated": False}, tables, fetch)
+
+
+def test_watermark_change_invalidates():
+    rc = ResultCache(ttl=60, watermark_interval=0)
+    mark = {"v": 1}
+    fetch = lambda t: mark["v"]
+    _put(rc, fetch=fetch)
+    assert rc.get("k", [TABLE], fetch) is not None
+    mark["v"] = 2
+    assert rc.get("k", [TABLE], fetch) is None
+    assert rc.stats()["entries"] == 0
+
+
+def test_unknown_watermark_is_a_miss_but_keeps_entry():
+    rc = ResultCache(ttl=60, watermark_interval=0)
+    ok = lambda t: "2025-06-01"
+
+    def slow(t):
+        raise StatementTimeout(0.5)
+
+    _put(rc, fetch=ok)
+    assert rc.get("k", [TABLE], slow) is None
+    assert rc.stats()["entries"] == 1 and rc.stats()["watermark_errors"] == 1
+    assert rc.get("k", [TABLE], ok) is not None       # değer değişmedi → tekrar isabet
+    # bilinmeyen su seviyesiyle yazılmaz
+    assert not rc.put("k2", to_columnar(["a"], [(1,)]), {}, [TABLE], slow)
+
+
+def test_invalidate_by_table_and_ttl():
+    rc = ResultCache(ttl=60, watermark_interval=0)
+    _put(rc, "k1", ("a",))
+    _put(rc, "k2", ("b",))
+    assert rc.invalidate(["A"]) == 1
+    assert rc.get("k1") is None and rc.get("k2") is not None
+    expired = ResultCache(ttl=0)
+    assert not expired.put("k", to_columnar(["a"], [(1,)]), {}, ["a"])
+
+
+@pytest.fixture
+def big_db_url(db_url):
+    """Su seviyesi sorgusu birkaç bin VM adımını aşsın diye tabloyu büyütür."""
+    conn = sqlite3.connect(db_url[len("sqlite:///"):])
+    info = list(conn.execute(f"PRAGMA table_info({TABLE})"))
+    cols = ",".join(r[1] for r in info if not r[5])
+    for _ in range(7):
+        conn.execute(f"INSERT INTO {TABLE} (Id, {cols}) SELECT Id + (SELECT MAX(Id) FROM {TABLE}), "
+                     f"{cols} FROM {TABLE}")
+    conn.commit()
+    conn.close()
+    return db_url
+
+
+def test_watermark_query_is_bounded_by_timeout(big_db_url, make_main):
+    main, _ = make_main({"RESULT_CACHE_WATERMARK_TIMEOUT": "0.000001",
+                         "RESULT_CACHE_WATERMARK_INTERVAL": "0"})
+    model = main._get_model(2)
+    with pytest.raises(StatementTimeout):
+        model._watermark(TABLE)
+
+    first = model.answer("Malzeme bazında kalan miktar")
+    second = model.answer("Malzeme bazında kalan miktar")
+    assert first["status"] == second["status"] == "success"
+    assert not first["result_cached"] and not second["result_cached"]
+    assert main.result_cache.stats()["watermark_errors"] >= 2
+
+
+def test_result_cache_hits_when_watermark_is_known(make_main):
+    main, _ = make_main({"RESULT_CACHE_WATERMARK_INTERVAL": "0"})
+    model = main._get_model(2)
+    assert not model.answer("Malzeme bazında kalan miktar")["result_cached"]
+    assert model.answer("Malzeme bazında kalan miktar")["result_cached"]
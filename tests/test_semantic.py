@@ -0,0 +1,42 @@
+"""substitute_literals: önbellekteki SQL yalnız güvenle aktarılabilen farklarla yeniden kullanılır."""
+
+from helper.semantic_helper import substitute_literals
+
+INVENTORY = "SELECT SUM(Kalan_miktar) FROM T WHERE Depo = 'Ankara'"
+
+
+def test_word_inside_literal_is_replaced():
+    assert substitute_literals("Ankara deposunda kalan miktar", "İzmir deposunda kalan miktar",
+                               INVENTORY) == INVENTORY.replace("Ankara", "İzmir")
+
+
+def test_word_outside_literals_is_a_miss():
+    assert substitute_literals("Ankara deposunda kalan miktar", "Ankara deposunda fire miktar",
+                               INVENTORY) is None
+
+
+def test_number_in_comparison_or_literal_is_replaced():
+    assert substitute_literals("2023 satışları", "2024 satışları",
+                               "SELECT * FROM T WHERE Yil = 2023") == \
+        "SELECT * FROM T WHERE Yil = 2024"
+    assert substitute_literals("2023 satışları", "2024 satışları",
+                               "SELECT * FROM T WHERE d >= '2023-01-01'") == \
+        "SELECT * FROM T WHERE d >= '2024-01-01'"
+    assert substitute_literals("5 ile 10 arası", "5 ile 20 arası",
+                               "SELECT * FROM T WHERE x BETWEEN 5 AND 10") == \
+        "SELECT * FROM T WHERE x BETWEEN 5 AND 20"
+
+
+def test_number_outside_predicates_is_a_miss():
+    # TOP, fonksiyon argümanı ve takma adlar filtre değeri değildir
+    assert substitute_literals("ilk 5 kayıt", "ilk 10 kayıt", "SELECT TOP 5 * FROM T") is None
+    assert substitute_literals("son 5 gün", "son 7 gün",
+                               "SELECT * FROM T WHERE d > DATEADD(day, -5, GETDATE())") is None
+    assert substitute_literals("hat 5", "hat 7", "SELECT x AS [5] FROM T WHERE h = 5") is None
+
+
+def test_number_appearing_twice_is_a_miss():
+    assert substitute_literals("5 numaralı hat", "7 numaralı hat",
+                               "SELECT TOP 5 * FROM T WHERE Hat = 5") is None
+    assert substitute_literals("hat 5", "hat 7",
+                               "SELECT * FROM T WHERE Hat = 5 OR Yedek = '5'") is None
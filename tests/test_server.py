@@ -0,0 +1,34 @@
+"""server.py: ``uvicorn --factory`` ile başlayan worker'lar ortak durumu paylaşmalı."""
+
+import os, sys, json, subprocess
+
+from conftest import APP_DIR
+
+# worker taklidi: server.create_app() ile kurulan süreç jeton üretir / çözer
+_WORKER = r"""
+import json, sys
+import server
+server.create_app().router          # worker'ın yaptığı gibi uygulamayı kur
+from helper.paging_helper import encode_page_token, decode_page_token
+if sys.argv[1] == "encode":
+    print(encode_page_token(2, "SELECT 1;", 10, 10))
+else:
+    print(json.dumps(decode_page_token(sys.argv[2])))
+"""
+
+
+def _worker(tmp_path, *args) -> str:
+    env = {k: v for k, v in os.environ.items() if k != "PAGE_TOKEN_SECRET"}
+    env.update(STATE_DB=str(tmp_path / "state.db"), WARMUP_SETS="",
+               QUERY_LOG_FILE=str(tmp_path / "q.jsonl"), MATVIEW_TICK="0",
+               REPLICA_SYNC_INTERVAL="0")
+    out = subprocess.run([sys.executable, "-c", _WORKER, *args], cwd=APP_DIR, env=env,
+                         capture_output=True, text=True, timeout=60)
+    assert out.returncode == 0, out.stderr
+    return out.stdout.strip().splitlines()[-1]
+
+
+def test_page_token_from_one_worker_verifies_on_another(tmp_path):
+    token = _worker(tmp_path, "encode")
+    decoded = json.loads(_worker(tmp_path, "decode", token))
+    assert decoded == {"set_id": 2, "sql": "SELECT 1;", "offset": 10, "limit": 10}
@@ -0,0 +1,21 @@
+"""Oturum başına son SQL: /ask yazar, /save_view okur."""
+
+import asyncio
+
+import httpx
+
+
+def test_ask_records_last_sql_for_session(make_main):
+    main, _ = make_main()
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app),
+                                     base_url="http://test") as c:
+            r = await c.post("/ask", json={"question": "Makineleri listele", "set_id": 1,
+                                           "session_id": "s1"})
+            return r.json()
+
+    res = asyncio.run(run())
+    assert res["status"] == "success"
+    assert main.state.get_last_sql("s1", 1) == res["sql"]
+    assert main.state.get_last_sql("s2", 1) is None
@@ -0,0 +1,104 @@
+"""/ask/stream: istemci ilk parçadan önce ayrılınca set slotu bırakılmalı."""
+
+import json, asyncio, threading
+
+import httpx
+
+LIMITS = {"ASK_MAX_CONCURRENCY": "1", "ASK_MAX_QUEUE": "0"}
+
+
+async def _post_and_disconnect(app, path: str, payload: dict):
+    """Gövdeyi gönderip yanıt başlamadan kopan ham ASGI isteği.
+
+    ASGI 2.4'te sunucu kopan bağlantıya ``send`` sırasında OSError verir;
+    ilk mesaj (``http.response.start``) gönderilemediği için akış gövdesi
+    hiç iterasyona girmez.
+    """
+    messages = [{"type": "http.request", "body": json.dumps(payload).encode(),
+                 "more_body": False}]
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        if message["type"].startswith("http.response"):
+            raise OSError("istemci bağlantıyı kapattı")
+
+    scope = {"type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"},
+             "http_version": "1.1", "method": "POST", "scheme": "http",
+             "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "",
+             "headers": [(b"content-type", b"application/json")],
+             "client": ("test", 1), "server": ("test", 80)}
+    try:
+        await app(scope, receive, send)
+    except Exception:
+        pass                        # ClientDisconnect – sunucu bunu sessizce yutar
+
+
+async def _stream_events(app, payload: dict):
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app),
+                                 base_url="http://test") as c:
+        r = await c.post("/ask/stream", json=payload)
+        return r.status_code, [json.loads(line) for line in r.text.splitlines() if line]
+
+
+def test_disconnect_before_first_chunk_releases_slot(make_main):
+    main, _ = make_main(LIMITS, latency_ms=50)
+    payload = {"question": "Makineleri listele", "set_id": 1}
+
+    async def run():
+        await _post_and_disconnect(main.app, "/ask/stream", payload)
+        # hemen bakılır: sahipsiz bir slot ancak GC / loop kapanışında (async
+        # generator temizliği) dönerdi, o zamana kadar set 429 verir
+        st = dict(main.limiter.stats().get(1, {}))
+        return st, await _stream_events(main.app, payload)
+
+    st, (status, events) = asyncio.run(run())
+    assert st.get("in_flight", 0) == 0 and st.get("queued", 0) == 0
+    assert status == 200
+    assert events[0]["event"] == "queued" and events[-1]["event"] == "done"
+    assert main.limiter.stats()[1]["in_flight"] == 0
+
+
+def test_saturated_set_returns_429_before_streaming(make_main):
+    main, _ = make_main(LIMITS, latency_ms=300)
+    payload = {"question": "Makineleri listele", "set_id": 1}
+
+    async def run():
+        first = asyncio.create_task(_stream_events(main.app, payload))
+        for _ in range(200):
+            if main.limiter.stats().get(1, {}).get("in_flight"):
+                break
+            await asyncio.sleep(0.01)
+        second = await _stream_events(main.app, payload)
+        return await first, second
+
+    (s1, ev1), (s2, _) = asyncio.run(run())
+    assert s1 == 200 and ev1[-1]["event"] == "done"
+    assert s2 == 429
+    assert main.limiter.stats()[1]["in_flight"] == 0
+
+
+def test_local_stream_releases_slot_when_abandoned(make_main):
+    """Aynı süreçteki UI akışı: ilk olaydan sonra bırakılan generator slotu iade eder."""
+    main, _ = make_main(LIMITS, latency_ms=20)
+    loop = asyncio.new_event_loop()
+    main._loop = loop
+    main._loop_ready.set()
+    t = threading.Thread(target=loop.run_forever, daemon=True)
+    t.start()
+    try:
+        gen = main.local_stream({"question": "Makineleri listele", "set_id": 1})
+        assert next(gen)["event"] == "queued"
+        assert main.limiter.stats()[1]["in_flight"] == 1
+        gen.close()                                  # ör. sekme kapandı
+        assert main.limiter.stats()[1]["in_flight"] == 0
+
+        events = list(main.local_stream({"question": "Makineleri listele", "set_id": 1}))
+        assert events[-1]["event"] == "done"
+        assert main.limiter.stats()[1]["in_flight"] == 0
+    finally:
+        loop.call_soon_threadsafe(loop.stop)
+        t.join(2)
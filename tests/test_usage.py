@@ -0,0 +1,54 @@
+"""/ask akışla (iptal edilebilir) tamamlama kullanırken de token sayıları gelmeli."""
+
+import asyncio
+
+import httpx
+import pytest
+
+from helper.concurrency_helper import CancelToken, Cancelled
+from helper.metrics_helper import StageTimer
+
+
+async def _ask(app, payload: dict) -> dict:
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app),
+                                 base_url="http://test") as c:
+        return (await c.post("/ask", json=payload)).json()
+
+
+def test_ask_reports_real_token_counts(make_main):
+    main, clients = make_main()
+    res = asyncio.run(_ask(main.app, {"question": "Makineleri listele", "set_id": 1}))
+    assert res["status"] == "success", res
+    usage = res["usage"]
+    assert usage["prompt"] > 0 and usage["completion"] > 0
+    assert "prompt_est" in usage            # tahmin yanında gerçek sayı da var
+    assert clients[1].calls == 1
+
+
+def test_cancelled_completion_raises_and_counts_nothing(make_main):
+    main, _ = make_main()
+    model = main._get_model(1)
+    timer, token = StageTimer(1), CancelToken()
+    token.cancel("test")
+    with pytest.raises(Cancelled):
+        model.nl_to_sql("Makineleri listele", timer, cancel=token)
+    assert "prompt" not in timer.usage
+
+
+def test_stub_server_sends_usage_chunk_to_openai_client(db_url):
+    openai = pytest.importorskip("openai")
+    from helper.api_helper import LLModel
+    from helper.bench_helper import CANNED_SQL
+    from helper.llm_stub_helper import StubLLMServer, StubProfile
+
+    stub = StubLLMServer({"small": StubProfile(latency_ms=5, jitter_ms=0)},
+                         CANNED_SQL[1]).start()
+    try:
+        client = openai.OpenAI(base_url=stub.url + "/v1", api_key="stub")
+        model = LLModel(table_set=1, client=client, deployment="small", dsn=db_url)
+        timer = StageTimer(1)
+        sql = model.nl_to_sql("Makineleri listele", timer, cancel=CancelToken())
+        assert sql.upper().startswith("SELECT")
+        assert timer.usage["prompt"] > 0 and timer.usage["completion"] > 0
+    finally:
+        stub.stop()